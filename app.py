@@ -14,6 +14,11 @@ from modules.utils import load_config
 from modules.annotation import render_annotation_page
 from modules.training import render_training_page
 from modules.inference import render_inference_page
+from modules.admin import (
+    is_admin, profiling_requested, render_performance_page, render_profiles_page
+)
+from modules.profiler import profile_call
+from modules import perf
 
 
 def main():
@@ -21,6 +26,8 @@ def main():
     
     # Load configuration
     config = load_config()
+    perf.configure(config['performance']['window'])
+    admin = is_admin()
     
     # Page configuration
     st.set_page_config(
@@ -58,9 +65,12 @@ def main():
         st.markdown("---")
         
         # Navigation
+        pages = ["🏠 Home", "🖊️ Annotation", "🎓 Model Training", "🔍 AI Segmentation"]
+        if admin:
+            pages.extend(["📈 Performance", "🧪 Profiles"])
         page = st.radio(
             "Navigation",
-            options=["🏠 Home", "🖊️ Annotation", "🎓 Model Training", "🔍 AI Segmentation"],
+            options=pages,
             label_visibility="collapsed"
         )
         
@@ -112,14 +122,37 @@ def main():
             st.metric("Trained Models", n_models)
     
     # Main content
+    profile = profiling_requested(admin)
     if page == "🏠 Home":
-        render_home_page(config)
+        render_page('home', render_home_page, config, profile)
     elif page == "🖊️ Annotation":
-        render_annotation_page(config)
+        render_page('annotation', render_annotation_page, config, profile)
     elif page == "🎓 Model Training":
-        render_training_page(config)
+        render_page('training', render_training_page, config, profile)
     elif page == "🔍 AI Segmentation":
-        render_inference_page(config)
+        render_page('inference', render_inference_page, config, profile)
+    elif page == "📈 Performance":
+        render_performance_page(config)
+    elif page == "🧪 Profiles":
+        render_profiles_page(config)
+    
+    perf.maybe_export_prometheus(config['paths']['metrics'], config['performance']['export_interval_s'])
+
+
+def render_page(name, render_fn, config, profile=False):
+    """Render a page inside a timing span, optionally under the profiler"""
+    with perf.span(f'page.{name}'):
+        if profile:
+            profiling_config = config['profiling']
+            profile_call(
+                name, render_fn, config,
+                profiles_dir=config['paths']['profiles'],
+                top_n=profiling_config['top_n'],
+                max_entries=profiling_config['max_entries'],
+                trace_frames=profiling_config['trace_frames']
+            )
+        else:
+            render_fn(config)
 
 
 def render_home_page(config):
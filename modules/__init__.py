@@ -1,8 +1,20 @@
 """
 Dental Segmentation Application Modules
+
+Submodules are imported on first access, so importing a core module (or
+running ``python -m modules``) does not pull in Streamlit.
 """
-from modules.utils import load_config
-from modules.annotation import render_annotation_page
+import importlib
+
+_LAZY_ATTRIBUTES = {
+    'load_config': 'modules.utils',
+    'render_annotation_page': 'modules.annotation',
+}
 
 __all__ = ['load_config', 'render_annotation_page']
 
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        return getattr(importlib.import_module(_LAZY_ATTRIBUTES[name]), name)
+    raise AttributeError(f"module 'modules' has no attribute {name!r}")
@@ -0,0 +1,237 @@
+"""
+Uncertainty-ranked active-learning queue for unannotated films
+"""
+import os
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from modules.evaluation import model_cache_key
+from modules.masks import mask_iou_matrix
+
+QUEUE_FILE = 'queue.json'
+
+
+def list_unannotated_images(raw_images_dir: str, annotations_dir: str,
+                            formats: List[str]) -> List[str]:
+    """Names of raw images without a label file, sorted"""
+    if not os.path.exists(raw_images_dir):
+        return []
+    extensions = tuple(f".{ext.lower()}" for ext in formats)
+    return sorted(
+        f for f in os.listdir(raw_images_dir)
+        if f.lower().endswith(extensions)
+        and not os.path.exists(os.path.join(annotations_dir, Path(f).stem + '.txt'))
+    )
+
+
+def margin_uncertainty(confidences: np.ndarray, decision_threshold: float, top_k: int = 5) -> float:
+    """
+    Uncertainty from detections whose confidence is close to the decision threshold
+
+    Each detection's margin is its distance to the threshold, normalized to
+    [0, 1]; the image score is the mean uncertainty of its top_k least
+    certain detections. A film with no detections at all scores 1.0.
+    """
+    if len(confidences) == 0:
+        return 1.0
+    scale = np.where(confidences >= decision_threshold, 1.0 - decision_threshold, decision_threshold)
+    margin = np.clip(np.abs(confidences - decision_threshold) / np.maximum(scale, 1e-6), 0.0, 1.0)
+    uncertainty = np.sort(1.0 - margin)[::-1][:top_k]
+    return float(uncertainty.mean())
+
+
+def flip_disagreement(classes: np.ndarray, masks: np.ndarray,
+                      flipped_classes: np.ndarray, flipped_masks: np.ndarray) -> float:
+    """
+    Disagreement between predictions on an image and on its horizontal flip
+
+    The flipped masks must already be flipped back. For every class, each
+    mask on either side is credited with its best IoU on the other side;
+    the disagreement is one minus the mean credit, so unmatched masks count
+    as full disagreement.
+    """
+    n_total = len(classes) + len(flipped_classes)
+    if n_total == 0:
+        return 0.0
+    agreement = 0.0
+    for c in np.union1d(classes, flipped_classes):
+        a = masks[classes == c]
+        b = flipped_masks[flipped_classes == c]
+        if len(a) == 0 or len(b) == 0:
+            continue
+        iou = mask_iou_matrix(a, b)
+        agreement += iou.max(axis=1).sum() + iou.max(axis=0).sum()
+    return float(1.0 - agreement / n_total)
+
+
+def _result_arrays(result, stride: int, flip: bool = False):
+    """Classes, confidences and downsampled bool masks of a result"""
+    if result.masks is None or len(result.masks) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32), np.zeros((0, 1, 1), dtype=bool)
+    masks = result.masks.data[:, ::stride, ::stride].cpu().numpy() > 0.5
+    if flip:
+        masks = masks[:, :, ::-1]
+    return (result.boxes.cls.cpu().numpy().astype(np.int64),
+            result.boxes.conf.cpu().numpy(),
+            masks)
+
+
+def score_images(model, image_paths: List[str], batch_size: int = 8,
+                 imgsz: Optional[int] = None, conf: float = 0.1,
+                 decision_threshold: float = 0.25, flip_weight: float = 0.5,
+                 mask_stride: int = 4, progress_callback: Optional[Callable] = None) -> List[Dict]:
+    """
+    Score images by prediction uncertainty
+
+    Each batch holds the images and their horizontal flips, so one predict
+    call yields both views.
+
+    Args:
+        model: Loaded YOLO segmentation model
+        image_paths: Images to score
+        batch_size: Images per predict call (twice as many tensors with flips)
+        imgsz: Inference size (model default if None)
+        conf: Prediction confidence floor; keep it below decision_threshold
+        decision_threshold: Confidence at which detections are accepted at inference
+        flip_weight: Weight of flip disagreement against margin uncertainty
+        mask_stride: Mask downsampling stride for the flip IoU
+        progress_callback: Called as (done, total)
+
+    Returns:
+        One score dictionary per image; images that cannot be decoded are skipped
+    """
+    predict_args = {'conf': conf, 'verbose': False}
+    if imgsz:
+        predict_args['imgsz'] = imgsz
+
+    scores = []
+    for start in range(0, len(image_paths), batch_size):
+        batch_paths = image_paths[start:start + batch_size]
+        images = [cv2.imread(path, cv2.IMREAD_COLOR) for path in batch_paths]
+        batch_paths = [path for path, image in zip(batch_paths, images) if image is not None]
+        images = [image for image in images if image is not None]
+        flipped = [np.ascontiguousarray(image[:, ::-1]) for image in images]
+        results = model.predict(images + flipped, **predict_args) if images else []
+
+        for i, path in enumerate(batch_paths):
+            classes, confidences, masks = _result_arrays(results[i], mask_stride)
+            flipped_classes, _, flipped_masks = _result_arrays(results[i + len(batch_paths)],
+                                                               mask_stride, flip=True)
+            if masks.shape[1:] != flipped_masks.shape[1:] and len(masks) and len(flipped_masks):
+                h = min(masks.shape[1], flipped_masks.shape[1])
+                w = min(masks.shape[2], flipped_masks.shape[2])
+                masks, flipped_masks = masks[:, :h, :w], flipped_masks[:, :h, :w]
+
+            margin = margin_uncertainty(confidences, decision_threshold)
+            disagreement = flip_disagreement(classes, masks, flipped_classes, flipped_masks)
+            stat = os.stat(path)
+            scores.append({
+                'image': os.path.basename(path),
+                'score': (1.0 - flip_weight) * margin + flip_weight * disagreement,
+                'margin_uncertainty': margin,
+                'flip_disagreement': disagreement,
+                'n_detections': int((confidences >= decision_threshold).sum()),
+                'size': stat.st_size,
+                'mtime': stat.st_mtime
+            })
+
+        if progress_callback is not None:
+            progress_callback(min(start + batch_size, len(image_paths)), len(image_paths))
+    return scores
+
+
+def load_queue(queue_dir: str) -> Optional[Dict]:
+    """Load the persisted active-learning queue"""
+    queue_path = os.path.join(queue_dir, QUEUE_FILE)
+    if not os.path.exists(queue_path):
+        return None
+    with open(queue_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def queue_ranks(queue: Optional[Dict]) -> Dict[str, int]:
+    """Image name -> rank (0 = most uncertain)"""
+    if not queue:
+        return {}
+    return {item['image']: rank for rank, item in enumerate(queue['items'])}
+
+
+def build_uncertainty_queue(job, model_path: str, raw_images_dir: str, annotations_dir: str,
+                            queue_dir: str, formats: List[str], batch_size: int = 8,
+                            imgsz: Optional[int] = None, conf: float = 0.1,
+                            decision_threshold: float = 0.25, flip_weight: float = 0.5) -> Dict:
+    """
+    Background job: score all unannotated films and persist a ranked queue
+
+    Scores from a previous queue built with the same model are reused for
+    films that have not changed, so re-running after new uploads only
+    scores the new films.
+
+    Args:
+        job: JobContext from modules.jobs
+        model_path: Model used to score the films
+        raw_images_dir: Directory with raw films
+        annotations_dir: Directory with YOLO label files
+        queue_dir: Directory for the queue file
+        formats: Supported image extensions
+        batch_size, imgsz, conf, decision_threshold, flip_weight: See score_images
+
+    Returns:
+        Summary with the number of scored, reused and queued films and the
+        names of films that could not be decoded
+    """
+    from ultralytics import YOLO
+
+    model_key = model_cache_key(model_path)
+    images = list_unannotated_images(raw_images_dir, annotations_dir, formats)
+
+    previous = load_queue(queue_dir)
+    reusable = {}
+    if previous and previous.get('model_key') == model_key:
+        for item in previous['items']:
+            path = os.path.join(raw_images_dir, item['image'])
+            if os.path.exists(path):
+                stat = os.stat(path)
+                if stat.st_size == item['size'] and stat.st_mtime == item['mtime']:
+                    reusable[item['image']] = item
+
+    to_score = [os.path.join(raw_images_dir, name) for name in images if name not in reusable]
+    job.update(0.0, f"{len(to_score)} films to score, {len(reusable)} reused")
+
+    items = [reusable[name] for name in images if name in reusable]
+    unreadable = []
+    if to_score:
+        model = YOLO(model_path, task='segment')
+        scored = score_images(
+            model, to_score, batch_size, imgsz, conf, decision_threshold, flip_weight,
+            progress_callback=lambda done, total: job.update(done / total, f"Scored {done}/{total} films")
+        )
+        scored_names = {item['image'] for item in scored}
+        unreadable = [os.path.basename(path) for path in to_score
+                      if os.path.basename(path) not in scored_names]
+        items.extend(scored)
+    items.sort(key=lambda item: item['score'], reverse=True)
+
+    queue = {
+        'model': os.path.basename(model_path),
+        'model_key': model_key,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'decision_threshold': decision_threshold,
+        'flip_weight': flip_weight,
+        'items': items,
+        'unreadable': unreadable
+    }
+    os.makedirs(queue_dir, exist_ok=True)
+    queue_path = os.path.join(queue_dir, QUEUE_FILE)
+    tmp_path = queue_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(queue, f, indent=2)
+    os.replace(tmp_path, queue_path)
+
+    return {'scored': len(to_score) - len(unreadable), 'reused': len(reusable), 'queued': len(items),
+            'unreadable': unreadable}
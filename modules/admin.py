@@ -0,0 +1,157 @@
+"""
+Admin pages: per-stage latency dashboard, inference pool status and per-rerun profile viewer
+"""
+import os
+from datetime import datetime
+from typing import Dict
+
+import streamlit as st
+import plotly.graph_objects as go
+
+from modules import perf
+from modules.inference_pool import running_inference_pool
+from modules.profiler import list_profiles, format_stats, stats_path
+
+
+def is_admin() -> bool:
+    """
+    Admin mode: VIRAI_ADMIN=1 in the environment, or ?admin=<token> matching VIRAI_ADMIN_TOKEN
+    """
+    if os.environ.get('VIRAI_ADMIN') == '1':
+        return True
+    token = os.environ.get('VIRAI_ADMIN_TOKEN')
+    return bool(token) and st.query_params.get('admin') == token
+
+
+def profiling_requested(admin: bool) -> bool:
+    """Profile this rerun: VIRAI_PROFILE=1 for every rerun, or ?profile=1 for admins"""
+    if os.environ.get('VIRAI_PROFILE') == '1':
+        return True
+    return admin and st.query_params.get('profile') == '1'
+
+
+def render_performance_page(config: Dict):
+    """Render rolling latency percentiles of the instrumented stages"""
+    st.header("📈 Performance")
+    st.caption(f"Timings of this server process (pid {os.getpid()}); "
+               f"percentiles over the last {config['performance']['window']} samples per stage")
+
+    stages = perf.snapshot()
+    metrics_path = config['paths']['metrics']
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if st.button("🔄 Refresh", use_container_width=True):
+            st.rerun()
+    with col2:
+        if st.button("📤 Export Prometheus File", use_container_width=True, disabled=not stages):
+            st.success(f"Written to {perf.export_prometheus(metrics_path)}")
+    with col3:
+        if st.button("🗑️ Reset", use_container_width=True, disabled=not stages):
+            perf.reset()
+            st.rerun()
+
+    pool = running_inference_pool()
+    if pool is not None:
+        stats = pool.stats()
+        st.subheader("Inference Pool")
+        columns = st.columns(5)
+        columns[0].metric("Workers alive", f"{stats['alive']}/{stats['workers']}")
+        columns[1].metric("Queued / busy", f"{stats['pending'] - stats['busy']} / {stats['busy']}")
+        columns[2].metric("Completed", stats['completed'])
+        columns[3].metric("Failed", stats['failed'])
+        columns[4].metric("Worker restarts", stats['restarts'])
+
+    if not stages:
+        st.info("No timings recorded yet. Use the other pages and come back.")
+        return
+
+    prefixes = sorted({s['stage'].split('.')[0] for s in stages})
+    selected = st.multiselect("Areas", prefixes, default=prefixes)
+    stages = [s for s in stages if s['stage'].split('.')[0] in selected]
+
+    st.dataframe([{
+        'Stage': s['stage'],
+        'Count': s['count'],
+        'p50 (ms)': s['p50_ms'],
+        'p95 (ms)': s['p95_ms'],
+        'p99 (ms)': s['p99_ms'],
+        'Mean (ms)': s['mean_ms'],
+        'Max (ms)': s['max_ms'],
+        'Total (s)': s['total_s'],
+        'Last': datetime.fromtimestamp(s['last']).strftime('%H:%M:%S')
+    } for s in stages], use_container_width=True, hide_index=True)
+
+    fig = go.Figure()
+    names = [s['stage'] for s in stages]
+    for key, label in (('p50_ms', 'p50'), ('p95_ms', 'p95'), ('p99_ms', 'p99')):
+        fig.add_trace(go.Bar(y=names, x=[s[key] for s in stages], name=label, orientation='h'))
+    fig.update_layout(barmode='group', xaxis_title='ms', height=max(300, 60 * len(stages)),
+                      yaxis={'autorange': 'reversed'})
+    st.plotly_chart(fig, use_container_width=True)
+
+    values = perf.value_snapshot()
+    if values:
+        st.subheader("Observed Values")
+        st.dataframe([{
+            'Name': v['name'],
+            'Count': v['count'],
+            'p50': v['p50'],
+            'p95': v['p95'],
+            'p99': v['p99'],
+            'Mean': v['mean'],
+            'Max': v['max'],
+            'Last': datetime.fromtimestamp(v['last']).strftime('%H:%M:%S')
+        } for v in values], use_container_width=True, hide_index=True)
+
+    with st.expander("Prometheus text"):
+        text = perf.prometheus_text()
+        st.code(text, language='text')
+        st.download_button("⬇️ Download", text, file_name='metrics.prom', mime='text/plain')
+
+
+def render_profiles_page(config: Dict):
+    """Render the slowest recent profiled reruns"""
+    st.header("🧪 Profiles")
+    profiles_dir = config['paths']['profiles']
+    st.caption("Reruns are profiled with VIRAI_PROFILE=1, or by admins with ?profile=1 in the URL. "
+               f"The newest {config['profiling']['max_entries']} captures are kept in {profiles_dir}.")
+
+    if st.button("🔄 Refresh"):
+        st.rerun()
+
+    reports = list_profiles(profiles_dir)
+    if not reports:
+        st.info("No profiles captured yet.")
+        return
+
+    st.dataframe([{
+        'Started': r['started'],
+        'Page': r['label'],
+        'Wall (s)': r['duration_s'],
+        'CPU (s)': r['cpu_s'],
+        'Peak traced (MB)': r['peak_traced_mb'],
+        'Outcome': r['outcome']
+    } for r in reports], use_container_width=True, hide_index=True)
+
+    selected = st.selectbox(
+        "Capture", reports,
+        format_func=lambda r: f"{r['duration_s']:.2f}s · {r['label']} · {r['started']}"
+    )
+    tab_functions, tab_allocations, tab_stats = st.tabs(["Functions", "Allocations", "pstats"])
+    with tab_functions:
+        st.dataframe(selected['top_functions'], use_container_width=True, hide_index=True)
+    with tab_allocations:
+        if selected['top_allocations']:
+            st.dataframe(selected['top_allocations'], use_container_width=True, hide_index=True)
+        else:
+            st.info("No allocation trace (tracemalloc was already running elsewhere)")
+    with tab_stats:
+        sort = st.radio("Sort by", ['cumulative', 'tottime', 'calls'], horizontal=True)
+        text = format_stats(profiles_dir, selected['id'], sort)
+        if text is None:
+            st.warning("Profile data was pruned from the ring buffer")
+        else:
+            st.code(text, language='text')
+            with open(stats_path(profiles_dir, selected['id']), 'rb') as f:
+                st.download_button("⬇️ Download .prof", f.read(), file_name=f"{selected['id']}.prof")
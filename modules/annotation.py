@@ -2,18 +2,31 @@
 Annotation module for dental panoramic X-ray segmentation
 """
 import os
+import hashlib
 import streamlit as st
 from streamlit_drawable_canvas import st_canvas
 from PIL import Image
 import numpy as np
-import cv2
-import json
 from pathlib import Path
-from typing import List, Dict, Tuple
+from datetime import datetime
+from typing import List, Dict
 from modules.utils import (
     load_config, save_yolo_annotation, load_yolo_annotation,
-    hex_to_rgb, rgb_to_bgr, draw_polygon_on_image, get_image_dimensions
+    get_image_dimensions
 )
+from modules.registry import list_models
+from modules.jobs import start_job, list_jobs
+from modules.active_learning import (
+    build_uncertainty_queue, load_queue, queue_ranks, list_unannotated_images
+)
+from modules.preannotation import preannotate_images, load_draft, discard_draft, draft_path
+from modules.geometry import simplify_annotations, simplify_label_directory
+from modules.annotation_qa import (
+    check_annotations, update_image_qa, scan_annotations, load_qa, invalidate_qa
+)
+from modules.image_hash import HashIndex, compute_hashes
+from modules.visualization import draw_annotations
+from modules import perf
 
 
 class AnnotationInterface:
@@ -24,6 +37,10 @@ class AnnotationInterface:
         self.classes = config['classes']
         self.raw_images_dir = config['paths']['raw_images']
         self.annotations_dir = config['paths']['annotations']
+        self.active_learning_dir = config['paths']['active_learning']
+        self.drafts_dir = config['paths']['drafts']
+        self.qa_dir = config['paths']['annotation_qa']
+        self.jobs_dir = config['paths']['jobs']
         
         # Initialize session state
         if 'current_image' not in st.session_state:
@@ -32,6 +49,8 @@ class AnnotationInterface:
             st.session_state.current_annotations = []
         if 'annotation_mode' not in st.session_state:
             st.session_state.annotation_mode = 'draw'
+        if 'current_draft' not in st.session_state:
+            st.session_state.current_draft = None
     
     def render(self):
         """Render the annotation interface"""
@@ -67,6 +86,17 @@ class AnnotationInterface:
             st.session_state.current_image = image_path
             st.success(f"✅ Image uploaded: {uploaded_file.name}")
             
+            # Hashing and the index query run once per upload, not on every canvas rerun
+            upload_key = (uploaded_file.name, uploaded_file.size,
+                          hashlib.sha1(uploaded_file.getbuffer()).hexdigest())
+            if st.session_state.get('near_duplicates_key') != upload_key:
+                st.session_state.near_duplicates = self._check_near_duplicates(image_path)
+                st.session_state.near_duplicates_key = upload_key
+            if st.session_state.near_duplicates:
+                st.warning("⚠️ Possible duplicate of: " + ", ".join(
+                    f"{m['image']} (distance {m['phash_distance']})" for m in st.session_state.near_duplicates[:5]
+                ))
+            
             # Load existing annotations if any
             self._load_existing_annotations()
         
@@ -82,6 +112,12 @@ class AnnotationInterface:
                 # Display image count
                 st.info(f"📊 Total {len(image_files)} panoramic films")
                 
+                self._render_active_learning()
+                self._render_preannotation()
+                self._render_label_simplification()
+                self._render_annotation_qa()
+                image_files = self._sort_films(image_files)
+                
                 # List all images with thumbnails
                 st.markdown("**Film List:**")
                 for idx, img_file in enumerate(image_files, 1):
@@ -103,6 +139,8 @@ class AnnotationInterface:
                             label_path = os.path.join(self.annotations_dir, label_name)
                             if os.path.exists(label_path):
                                 st.success("✅ Annotated")
+                            elif os.path.exists(draft_path(self.drafts_dir, img_file)):
+                                st.info("📝 Draft available for review")
                             else:
                                 st.warning("⚠️ Not yet annotated")
                             
@@ -154,12 +192,29 @@ class AnnotationInterface:
             st.markdown("---")
             st.subheader("Annotations")
             
+            if st.session_state.current_draft:
+                st.info(f"📝 Draft from {st.session_state.current_draft} — review, correct and save to accept")
+                if st.button("🗑️ Discard Draft", use_container_width=True):
+                    discard_draft(self.drafts_dir, os.path.basename(st.session_state.current_image))
+                    st.session_state.current_draft = None
+                    st.session_state.current_annotations = []
+                    st.rerun()
+            
             if st.session_state.current_annotations:
+                issues = check_annotations(st.session_state.current_annotations, **self._qa_thresholds())
+                flagged = {}
+                for issue in issues:
+                    for idx in (issue['i'], issue['j']):
+                        flagged.setdefault(idx, issue['type'])
+                    st.warning(f"⚠️ {issue['type'].title()}: #{issue['i'] + 1} and #{issue['j'] + 1} "
+                               f"overlap (IoU {issue['iou']:.2f})")
+                
                 for idx, ann in enumerate(st.session_state.current_annotations):
                     class_name = self.classes[ann['class_id']]['name'].title()
                     col_a, col_b = st.columns([3, 1])
                     with col_a:
-                        st.text(f"{idx + 1}. {class_name} ({len(ann['polygon'])} points)")
+                        marker = "⚠️ " if idx in flagged else ""
+                        st.text(f"{marker}{idx + 1}. {class_name} ({len(ann['polygon'])} points)")
                     with col_b:
                         if st.button("🗑️", key=f"delete_{idx}"):
                             st.session_state.current_annotations.pop(idx)
@@ -181,6 +236,233 @@ class AnnotationInterface:
                     self._save_annotations()
                     st.rerun()
     
+    def _render_active_learning(self):
+        """Render the uncertainty queue job controls"""
+        with st.expander("🧠 Active Learning Queue", expanded=False):
+            st.caption("Rank unannotated films by model uncertainty (low-margin detections "
+                       "and disagreement under horizontal flip) so the most informative films come first")
+            
+            queue = load_queue(self.active_learning_dir)
+            if queue:
+                st.text(f"Queue: {len(queue['items'])} films, model {queue['model']}, {queue['created']}")
+                if queue.get('unreadable'):
+                    st.warning(f"⚠️ {len(queue['unreadable'])} films could not be read and were skipped: "
+                               f"{', '.join(queue['unreadable'])}")
+            
+            models = list_models(self.config['paths']['trained_models'])
+            if not models:
+                st.info("Train a model first to rank films")
+                return
+            
+            al_config = self.config['active_learning']
+            running = any(job['status'] == 'running'
+                          for job in list_jobs(self.jobs_dir, kind='active_learning'))
+            if st.button("🧠 Rank Unannotated Films", use_container_width=True, disabled=running,
+                         help=f"Uses the best registered model: {models[0]['file']}"):
+                start_job(
+                    'active_learning', build_uncertainty_queue, self.jobs_dir,
+                    os.path.join(self.config['paths']['trained_models'], models[0]['file']),
+                    self.raw_images_dir, self.annotations_dir, self.active_learning_dir,
+                    self.config['image']['supported_formats'],
+                    batch_size=al_config['batch_size'],
+                    imgsz=models[0].get('imgsz'),
+                    conf=al_config['prediction_conf'],
+                    decision_threshold=self.config['inference']['default_confidence'],
+                    flip_weight=al_config['flip_weight']
+                )
+                st.rerun()
+            
+            jobs = list_jobs(self.jobs_dir, kind='active_learning')
+            if jobs:
+                job = jobs[0]
+                if job['status'] == 'running':
+                    st.progress(job['progress'], text=job['message'])
+                    if st.button("🔄 Refresh", key="refresh_active_learning"):
+                        st.rerun()
+                elif job['status'] == 'failed':
+                    st.error(job['error'])
+    
+    def _render_preannotation(self):
+        """Render the model-assisted pre-annotation job controls"""
+        with st.expander("🤖 Pre-annotate Films", expanded=False):
+            st.caption("Run a trained model over films and save its masks as draft polygons "
+                       "to review and correct instead of drawing from scratch")
+            
+            models = {entry['file']: entry for entry in list_models(self.config['paths']['trained_models'])}
+            if not models:
+                st.info("Train a model first to pre-annotate films")
+                return
+            
+            model_file = st.selectbox("Model", options=list(models.keys()), key="preannotation_model")
+            unannotated = list_unannotated_images(self.raw_images_dir, self.annotations_dir,
+                                                  self.config['image']['supported_formats'])
+            all_unannotated = st.checkbox(f"All unannotated films ({len(unannotated)})", value=True)
+            if all_unannotated:
+                selected = unannotated
+            else:
+                selected = st.multiselect("Films", options=unannotated)
+            overwrite = st.checkbox("Replace existing drafts", value=False)
+            
+            pre_config = self.config['preannotation']
+            running = any(job['status'] == 'running'
+                          for job in list_jobs(self.jobs_dir, kind='preannotation'))
+            if st.button("🤖 Start Pre-annotation", use_container_width=True,
+                         disabled=running or not selected):
+                start_job(
+                    'preannotation', preannotate_images, self.jobs_dir,
+                    os.path.join(self.config['paths']['trained_models'], model_file),
+                    [os.path.join(self.raw_images_dir, f) for f in selected],
+                    self.drafts_dir,
+                    conf=pre_config['conf'],
+                    iou=self.config['inference']['default_iou'],
+                    imgsz=models[model_file].get('imgsz'),
+                    epsilon_px=pre_config['epsilon_px'],
+                    threads_per_worker=pre_config['threads_per_worker'],
+                    chunk_size=pre_config['chunk_size'],
+                    batch_size=pre_config['batch_size'],
+                    overwrite=overwrite
+                )
+                st.rerun()
+            
+            jobs = list_jobs(self.jobs_dir, kind='preannotation')
+            if jobs:
+                job = jobs[0]
+                if job['status'] == 'running':
+                    st.progress(job['progress'], text=job['message'])
+                    if st.button("🔄 Refresh", key="refresh_preannotation"):
+                        st.rerun()
+                elif job['status'] == 'completed':
+                    st.success(f"✅ Drafted {job['result']['polygons']} polygons "
+                               f"on {job['result']['films']} films")
+                elif job['status'] == 'failed':
+                    st.error(job['error'])
+    
+    def _render_label_simplification(self):
+        """Render the bulk polygon simplification tool for existing labels"""
+        with st.expander("📐 Simplify Existing Labels", expanded=False):
+            tolerance = st.number_input(
+                "Tolerance (px)", min_value=0.1, max_value=10.0, step=0.1,
+                value=float(self.config['annotation']['simplify_tolerance_px']),
+                help="No removed point lies farther than this from the simplified outline"
+            )
+            confirmed = st.checkbox(
+                "I want to rewrite all label files",
+                help="Originals of rewritten files are backed up first"
+            )
+            col_a, col_b = st.columns(2)
+            with col_a:
+                preview = st.button("🔎 Preview", use_container_width=True)
+            with col_b:
+                apply = st.button("✂️ Rewrite Labels", use_container_width=True, disabled=not confirmed)
+            
+            if preview or apply:
+                backup_dir = None
+                if apply:
+                    backup_dir = os.path.join(self.config['paths']['label_backups'],
+                                              f"simplify_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+                with st.spinner("Simplifying labels..."):
+                    totals = simplify_label_directory(
+                        self.annotations_dir, self.raw_images_dir, tolerance,
+                        self.config['image']['supported_formats'], dry_run=not apply,
+                        backup_dir=backup_dir
+                    )
+                if totals['files'] == 0:
+                    st.info("No label files to simplify")
+                    return
+                points_saved = 1 - totals['points_after'] / max(totals['points_before'], 1)
+                bytes_saved = 1 - totals['bytes_after'] / max(totals['bytes_before'], 1)
+                st.write(f"- Files: {totals['files']} ({len(totals['changed'])} changed)")
+                st.write(f"- Points: {totals['points_before']} → {totals['points_after']} "
+                         f"(-{points_saved:.0%})")
+                st.write(f"- Size: {totals['bytes_before'] / 1024:.1f} KB → "
+                         f"{totals['bytes_after'] / 1024:.1f} KB (-{bytes_saved:.0%})")
+                st.write(f"- Max deviation: {totals['max_deviation_px']:.2f} px (tolerance {tolerance:.2f} px)")
+                if totals['missing_images']:
+                    st.warning(f"⚠️ Skipped {len(totals['missing_images'])} labels without a matching film")
+                if apply:
+                    # Their QA findings were computed on the old polygons
+                    invalidate_qa(self.qa_dir, totals['changed'])
+                    if totals['changed']:
+                        st.success(f"✅ {len(totals['changed'])} label files rewritten; originals in {backup_dir}")
+                    else:
+                        st.success("✅ Labels already simplified")
+                    self._load_existing_annotations()
+    
+    def _check_near_duplicates(self, image_path: str) -> List[Dict]:
+        """Already uploaded films that look like this one; the film is indexed as well"""
+        hash_index = HashIndex(self.config['paths']['image_hashes'])
+        image_name = os.path.basename(image_path)
+        hashes = compute_hashes([image_path]).get(image_name)
+        if hashes is None:
+            return []
+        
+        matches = hash_index.query(hashes, self.config['dedup']['max_distance'], exclude=image_name)
+        entry = hash_index.entries.get(image_name)
+        if entry is None or entry['phash'] != hashes['phash']:
+            hash_index.add_image(image_path, hashes)
+        return matches
+    
+    def _qa_thresholds(self) -> Dict:
+        """QA thresholds from config, with allowed overlaps mapped to class ids"""
+        qa_config = self.config['annotation_qa']
+        class_ids = {c['name']: c['id'] for c in self.classes}
+        return {
+            'duplicate_iou': qa_config['duplicate_iou'],
+            'conflict_iou': qa_config['conflict_iou'],
+            'allowed_overlaps': [(class_ids[a], class_ids[b]) for a, b in qa_config['allowed_overlaps']]
+        }
+    
+    def _render_annotation_qa(self):
+        """Render the corpus-wide annotation QA scan and its findings"""
+        with st.expander("🔍 Annotation QA", expanded=False):
+            st.caption("Duplicate polygons (same class) and conflicting polygons (different classes) "
+                       "that overlap heavily; images are re-checked whenever they are saved")
+            
+            running = any(job['status'] == 'running'
+                          for job in list_jobs(self.jobs_dir, kind='annotation_qa'))
+            if st.button("🔍 Scan All Annotations", use_container_width=True, disabled=running):
+                start_job(
+                    'annotation_qa', scan_annotations, self.jobs_dir,
+                    self.annotations_dir, self.raw_images_dir, self.qa_dir,
+                    self.config['image']['supported_formats'],
+                    **self._qa_thresholds()
+                )
+                st.rerun()
+            
+            jobs = list_jobs(self.jobs_dir, kind='annotation_qa')
+            if jobs and jobs[0]['status'] == 'running':
+                st.progress(jobs[0]['progress'], text=jobs[0]['message'])
+                if st.button("🔄 Refresh", key="refresh_annotation_qa"):
+                    st.rerun()
+            elif jobs and jobs[0]['status'] == 'failed':
+                st.error(jobs[0]['error'])
+            
+            qa = load_qa(self.qa_dir)
+            rows = []
+            for label_file, entry in sorted(qa['images'].items()):
+                for issue in entry['issues']:
+                    rows.append({
+                        'Label': label_file,
+                        'Type': issue['type'],
+                        'Polygons': f"#{issue['i'] + 1} / #{issue['j'] + 1}",
+                        'Classes': f"{self.classes[issue['class_i']]['name']} / "
+                                   f"{self.classes[issue['class_j']]['name']}",
+                        'IoU': issue['iou']
+                    })
+            if rows:
+                st.dataframe(rows, use_container_width=True, hide_index=True)
+            elif qa['images']:
+                st.success(f"✅ No issues in {len(qa['images'])} checked label files")
+    
+    def _sort_films(self, image_files: List[str]) -> List[str]:
+        """Sort the film list by name or by active-learning rank"""
+        sort_by = st.radio("Sort Films By", options=["Name", "Uncertainty"], horizontal=True)
+        if sort_by == "Uncertainty":
+            ranks = queue_ranks(load_queue(self.active_learning_dir))
+            # Unranked films (annotated or added after the last run) go last
+            return sorted(image_files, key=lambda f: (ranks.get(f, len(ranks)), f))
+        return sorted(image_files)
+    
     def _render_canvas(self):
         """Render the annotation canvas"""
         if st.session_state.current_image is None:
@@ -188,8 +470,9 @@ class AnnotationInterface:
             return
         
         # Load image
-        image = Image.open(st.session_state.current_image)
-        img_array = np.array(image)
+        with perf.span('annotation.decode'):
+            image = Image.open(st.session_state.current_image)
+            img_array = np.array(image)
         
         # Get image dimensions
         img_width, img_height = image.size
@@ -245,18 +528,19 @@ class AnnotationInterface:
         if drawing_mode == "Draw Polygon":
             stroke_color = self.classes[st.session_state.get('selected_class', 0)]['color']
             
-            canvas_result = st_canvas(
-                fill_color="rgba(255, 165, 0, 0.3)",
-                stroke_width=2,
-                stroke_color=stroke_color,
-                background_image=image,
-                update_streamlit=True,
-                height=canvas_height,
-                width=canvas_width,
-                drawing_mode="polygon",
-                point_display_radius=3,
-                key="canvas",
-            )
+            with perf.span('annotation.render_canvas'):
+                canvas_result = st_canvas(
+                    fill_color="rgba(255, 165, 0, 0.3)",
+                    stroke_width=2,
+                    stroke_color=stroke_color,
+                    background_image=image,
+                    update_streamlit=True,
+                    height=canvas_height,
+                    width=canvas_width,
+                    drawing_mode="polygon",
+                    point_display_radius=3,
+                    key="canvas",
+                )
             
             # Process canvas result
             if canvas_result.json_data is not None:
@@ -280,55 +564,30 @@ class AnnotationInterface:
                                     polygon.append((x, y))
                             
                             if len(polygon) >= 3:
-                                # Add annotation
-                                st.session_state.current_annotations.append({
-                                    'class_id': st.session_state.get('selected_class', 0),
-                                    'polygon': polygon
-                                })
-                                st.success(f"✅ Polygon added ({len(polygon)} points)")
+                                # Simplify within the configured pixel tolerance
+                                (annotation,), stats = simplify_annotations(
+                                    [{'class_id': st.session_state.get('selected_class', 0),
+                                      'polygon': polygon}],
+                                    self.config['annotation']['simplify_tolerance_px']
+                                )
+                                st.session_state.current_annotations.append(annotation)
+                                st.success(f"✅ Polygon added ({stats['points_after']} points, "
+                                           f"simplified from {stats['points_before']})")
                                 st.rerun()
                             else:
                                 st.warning("⚠️ Polygon must contain at least 3 points")
         
         else:  # View mode
             # Draw existing annotations on image
-            img_with_annotations = self._draw_annotations_on_image(img_array)
-            st.image(img_with_annotations, use_container_width=True, caption="Annotated Image")
+            with perf.span('annotation.render_view'):
+                img_with_annotations = self._draw_annotations_on_image(img_array)
+                st.image(img_with_annotations, use_container_width=True, caption="Annotated Image")
     
     def _draw_annotations_on_image(self, image: np.ndarray) -> np.ndarray:
         """Draw all annotations on the image"""
-        img_copy = image.copy()
-        
-        for ann in st.session_state.current_annotations:
-            class_id = ann['class_id']
-            polygon = ann['polygon']
-            
-            # Get class color
-            hex_color = self.classes[class_id]['color']
-            rgb_color = hex_to_rgb(hex_color)
-            bgr_color = rgb_to_bgr(rgb_color)
-            
-            # Draw polygon
-            img_copy = draw_polygon_on_image(
-                img_copy, polygon, bgr_color,
-                thickness=3, fill=True, alpha=0.3
-            )
-            
-            # Add label text
-            if polygon:
-                centroid_x = int(np.mean([p[0] for p in polygon]))
-                centroid_y = int(np.mean([p[1] for p in polygon]))
-                class_name = self.classes[class_id]['name'].title()
-                
-                cv2.putText(
-                    img_copy, class_name,
-                    (centroid_x, centroid_y),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    0.8, bgr_color, 2
-                )
-        
-        return img_copy
+        return draw_annotations(image, st.session_state.current_annotations, self.classes)
     
+    @perf.timed('annotation.load')
     def _load_existing_annotations(self):
         """Load existing annotations for current image"""
         if st.session_state.current_image is None:
@@ -343,9 +602,17 @@ class AnnotationInterface:
             st.session_state.current_annotations = load_yolo_annotation(
                 label_path, img_width, img_height
             )
+            st.session_state.current_draft = None
         else:
-            st.session_state.current_annotations = []
+            draft = load_draft(self.drafts_dir, image_name)
+            if draft is not None:
+                st.session_state.current_annotations = draft['annotations']
+                st.session_state.current_draft = draft['model']
+            else:
+                st.session_state.current_annotations = []
+                st.session_state.current_draft = None
     
+    @perf.timed('annotation.save')
     def _save_annotations(self):
         """Save current annotations to file"""
         if st.session_state.current_image is None:
@@ -361,6 +628,15 @@ class AnnotationInterface:
             img_width,
             img_height
         )
+        
+        label_path = os.path.join(self.annotations_dir, Path(image_name).stem + '.txt')
+        update_image_qa(self.qa_dir, label_path, st.session_state.current_annotations,
+                        **self._qa_thresholds())
+        
+        # Saving a reviewed draft accepts it
+        if st.session_state.current_draft:
+            discard_draft(self.drafts_dir, image_name)
+            st.session_state.current_draft = None
 
 
 def render_annotation_page(config: Dict):
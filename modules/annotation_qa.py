@@ -0,0 +1,277 @@
+"""
+Annotation QA: duplicate and conflicting polygons found through a spatial grid index
+"""
+import os
+import json
+import hashlib
+import threading
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import cv2
+import numpy as np
+
+from modules.utils import load_yolo_annotation, get_image_dimensions, find_image
+
+QA_FILE = 'qa.json'
+
+_qa_lock = threading.Lock()
+
+
+class GridIndex:
+    """Uniform grid over bounding boxes; boxes are registered in every cell they touch"""
+
+    def __init__(self, boxes: np.ndarray, cell_size: Optional[float] = None):
+        """
+        Args:
+            boxes: (N, 4) x0, y0, x1, y1 boxes
+            cell_size: Grid cell size in pixels (default: mean box side)
+        """
+        self.boxes = boxes
+        if cell_size is None:
+            sides = np.maximum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]) if len(boxes) else []
+            cell_size = float(np.mean(sides)) if len(sides) else 1.0
+        self.cell_size = max(cell_size, 1.0)
+        self.cells = defaultdict(list)
+        cells = np.floor(boxes / self.cell_size).astype(int)
+        for i, (cx0, cy0, cx1, cy1) in enumerate(cells):
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    self.cells[(cx, cy)].append(i)
+
+    def candidate_pairs(self) -> Set[Tuple[int, int]]:
+        """Pairs (i < j) sharing a cell whose boxes intersect"""
+        pairs = set()
+        for members in self.cells.values():
+            for a in range(len(members)):
+                for b in range(a + 1, len(members)):
+                    i, j = members[a], members[b]
+                    pairs.add((i, j) if i < j else (j, i))
+        if not pairs:
+            return pairs
+        idx = np.array(sorted(pairs))
+        a, b = self.boxes[idx[:, 0]], self.boxes[idx[:, 1]]
+        overlap = ((np.minimum(a[:, 2], b[:, 2]) > np.maximum(a[:, 0], b[:, 0])) &
+                   (np.minimum(a[:, 3], b[:, 3]) > np.maximum(a[:, 1], b[:, 1])))
+        return {tuple(pair) for pair in idx[overlap].tolist()}
+
+
+def polygon_iou(a: np.ndarray, b: np.ndarray, max_side: int = 256) -> float:
+    """IoU of two pixel polygons, rasterized on their joint bounding box (longest side capped)"""
+    points = np.concatenate([a, b])
+    origin = points.min(axis=0)
+    extent = points.max(axis=0) - origin
+    scale = min(1.0, max_side / max(float(extent.max()), 1.0))
+    shape = (int(np.ceil(extent[1] * scale)) + 1, int(np.ceil(extent[0] * scale)) + 1)
+    masks = np.zeros((2,) + shape, dtype=np.uint8)
+    for mask, polygon in zip(masks, (a, b)):
+        cv2.fillPoly(mask, [np.round((polygon - origin) * scale).astype(np.int32).reshape(-1, 1, 2)], 1)
+    intersection = np.logical_and(masks[0], masks[1]).sum()
+    union = np.logical_or(masks[0], masks[1]).sum()
+    return float(intersection / union) if union else 0.0
+
+
+def check_annotations(annotations: List[Dict], duplicate_iou: float = 0.8,
+                      conflict_iou: float = 0.7,
+                      allowed_overlaps: Sequence[Sequence[int]] = ()) -> List[Dict]:
+    """
+    Find duplicate and conflicting polygons in one image
+
+    Only pairs whose boxes share a grid cell are considered, and a pair is
+    rasterized only if its area ratio (an upper bound on IoU) can reach the
+    lowest threshold.
+
+    Args:
+        annotations: Annotation dictionaries with 'class_id' and 'polygon' (pixels)
+        duplicate_iou: Same-class IoU at or above which two polygons are duplicates
+        conflict_iou: Cross-class IoU at or above which two polygons conflict
+        allowed_overlaps: Class id pairs that may overlap without conflict
+
+    Returns:
+        Issues with 'type' ('duplicate' or 'conflict'), indices, class ids and IoU
+    """
+    polygons = [np.asarray(ann['polygon'], dtype=np.float32).reshape(-1, 2) for ann in annotations]
+    valid = [i for i, p in enumerate(polygons) if len(p) >= 3]
+    if len(valid) < 2:
+        return []
+
+    boxes = np.array([np.concatenate([polygons[i].min(axis=0), polygons[i].max(axis=0)]) for i in valid])
+    areas = np.array([abs(cv2.contourArea(polygons[i])) for i in valid])
+    allowed = {tuple(sorted(pair)) for pair in allowed_overlaps}
+    min_iou = min(duplicate_iou, conflict_iou)
+
+    issues = []
+    for a, b in sorted(GridIndex(boxes).candidate_pairs()):
+        i, j = valid[a], valid[b]
+        class_i, class_j = annotations[i]['class_id'], annotations[j]['class_id']
+        if class_i != class_j and tuple(sorted((class_i, class_j))) in allowed:
+            continue
+        if min(areas[a], areas[b]) < min_iou * max(areas[a], areas[b]):
+            continue
+        iou = polygon_iou(polygons[i], polygons[j])
+        if class_i == class_j and iou >= duplicate_iou:
+            issues.append({'type': 'duplicate', 'i': i, 'j': j,
+                           'class_i': class_i, 'class_j': class_j, 'iou': round(iou, 4)})
+        elif class_i != class_j and iou >= conflict_iou:
+            issues.append({'type': 'conflict', 'i': i, 'j': j,
+                           'class_i': class_i, 'class_j': class_j, 'iou': round(iou, 4)})
+    return issues
+
+
+def _file_hash(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def load_qa(qa_dir: str) -> Dict:
+    """Load the QA index (label file name -> hash, annotation count and issues)"""
+    qa_path = os.path.join(qa_dir, QA_FILE)
+    if not os.path.exists(qa_path):
+        return {'images': {}}
+    with open(qa_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _update_qa(qa_dir: str, entries: Dict[str, Optional[Dict]]):
+    """Merge entries into the QA index (None removes an entry)"""
+    with _qa_lock:
+        qa = load_qa(qa_dir)
+        for label_file, entry in entries.items():
+            if entry is None:
+                qa['images'].pop(label_file, None)
+            else:
+                qa['images'][label_file] = entry
+        qa['updated'] = datetime.now().isoformat(timespec='seconds')
+        os.makedirs(qa_dir, exist_ok=True)
+        qa_path = os.path.join(qa_dir, QA_FILE)
+        tmp_path = qa_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(qa, f)
+        os.replace(tmp_path, qa_path)
+
+
+def invalidate_qa(qa_dir: str, label_files: List[str]):
+    """Drop the QA entries of label files rewritten outside the editor (re-checked by the next scan)"""
+    if label_files:
+        _update_qa(qa_dir, {label_file: None for label_file in label_files})
+
+
+def thresholds_key(thresholds: Dict) -> str:
+    """Digest of the QA thresholds; entries checked under other thresholds are re-checked"""
+    encoded = json.dumps({k: thresholds[k] for k in sorted(thresholds)}, default=list).encode('utf-8')
+    return hashlib.sha1(encoded).hexdigest()[:10]
+
+
+def _qa_entry(label_path: str, annotations: List[Dict], thresholds: Dict) -> Dict:
+    return {
+        'hash': _file_hash(label_path),
+        'thresholds': thresholds_key(thresholds),
+        'n_annotations': len(annotations),
+        'issues': check_annotations(annotations, **thresholds)
+    }
+
+
+def update_image_qa(qa_dir: str, label_path: str, annotations: List[Dict], **thresholds) -> List[Dict]:
+    """
+    Re-check one image after its labels were saved
+
+    Args:
+        qa_dir: Directory of the QA index
+        label_path: Saved label file
+        annotations: The saved annotations (pixels)
+        **thresholds: duplicate_iou, conflict_iou, allowed_overlaps
+
+    Returns:
+        Issues found in the image
+    """
+    label_file = os.path.basename(label_path)
+    if not os.path.exists(label_path):
+        _update_qa(qa_dir, {label_file: None})
+        return []
+    entry = _qa_entry(label_path, annotations, thresholds)
+    _update_qa(qa_dir, {label_file: entry})
+    return entry['issues']
+
+
+def _check_label_file(label_path: str, image_path: str, thresholds: Dict) -> Dict:
+    """Check one label file"""
+    img_width, img_height = get_image_dimensions(image_path)
+    annotations = load_yolo_annotation(label_path, img_width, img_height)
+    return _qa_entry(label_path, annotations, thresholds)
+
+
+def _check_label_files(files: List[Tuple[str, str, str]], thresholds: Dict) -> List[Tuple[str, Dict]]:
+    """Check a chunk of (name, label path, image path) files (runs in a worker process)"""
+    return [(name, _check_label_file(label_path, image_path, thresholds))
+            for name, label_path, image_path in files]
+
+
+def scan_annotations(job, annotations_dir: str, images_dir: str, qa_dir: str,
+                     formats: List[str], workers: Optional[int] = None, **thresholds) -> Dict:
+    """
+    Background job: check the whole annotation corpus in parallel
+
+    Label files whose content hash and thresholds match the QA index are not
+    re-checked. Files are sent to the workers in chunks, since checking a
+    small label file costs less than a round trip to a worker.
+
+    Args:
+        job: JobContext from modules.jobs
+        annotations_dir: Directory with YOLO label files
+        images_dir: Directory with the films (for pixel dimensions)
+        qa_dir: Directory of the QA index
+        formats: Image extensions to look for
+        workers: Worker processes (default: CPU count)
+        **thresholds: duplicate_iou, conflict_iou, allowed_overlaps
+
+    Returns:
+        Summary with checked/reused files and duplicate/conflict counts
+    """
+    label_files = sorted(f for f in os.listdir(annotations_dir) if f.endswith('.txt')) \
+        if os.path.exists(annotations_dir) else []
+    known = load_qa(qa_dir)['images']
+    current_thresholds = thresholds_key(thresholds)
+
+    to_check = {}
+    reused = 0
+    for label_file in label_files:
+        label_path = os.path.join(annotations_dir, label_file)
+        entry = known.get(label_file)
+        if entry is not None and entry.get('thresholds') == current_thresholds \
+                and entry['hash'] == _file_hash(label_path):
+            reused += 1
+            continue
+        image_path = find_image(images_dir, Path(label_file).stem, formats)
+        if image_path is not None:
+            to_check[label_file] = (label_path, image_path)
+
+    entries = {f: None for f in known if f not in label_files}
+    job.update(0.0, f"Checking {len(to_check)} label files")
+    if to_check:
+        # Spawn: this runs in a job thread of the Streamlit server, where forking can deadlock
+        workers = workers or os.cpu_count() or 1
+        files = [(name, *paths) for name, paths in to_check.items()]
+        chunk_size = max(1, min(256, len(files) // (workers * 4)))
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = [pool.submit(_check_label_files, files[start:start + chunk_size], thresholds)
+                       for start in range(0, len(files), chunk_size)]
+            done = 0
+            for future in futures:
+                for name, entry in future.result():
+                    entries[name] = entry
+                done += chunk_size
+                job.update(min(done, len(files)) / len(files),
+                           f"Checked {min(done, len(files))}/{len(files)} label files")
+    _update_qa(qa_dir, entries)
+
+    issues = [issue for entry in load_qa(qa_dir)['images'].values() for issue in entry['issues']]
+    return {
+        'checked': len(to_check),
+        'reused': reused,
+        'duplicates': sum(issue['type'] == 'duplicate' for issue in issues),
+        'conflicts': sum(issue['type'] == 'conflict' for issue in issues)
+    }
@@ -0,0 +1,276 @@
+"""
+Local HTTP inference API (python -m modules serve)
+
+A stdlib ThreadingHTTPServer in front of the shared inference worker pool,
+so concurrent clients share the workers' model caches and are micro-batched
+together. Connections are HTTP/1.1 keep-alive.
+
+Endpoints:
+    GET  /health          Pool status
+    GET  /models          Registered models, best first
+    GET  /metrics         Prometheus text of this process's timings
+    POST /predict         One image as the raw request body; returns a record
+    POST /predict/batch   multipart/form-data images; streams NDJSON records
+                          (chunked) in completion order
+
+Query parameters of the predict endpoints: model (registered file name,
+default: best), conf, iou, imgsz, format (rle or polygon), thresholds=1
+(the model's calibrated per-class thresholds) and name (/predict only).
+Records are those of modules.prediction.result_to_record.
+"""
+import os
+import json
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import cv2
+import numpy as np
+
+from modules import perf
+from modules.inference_pool import InferencePool, iter_records
+from modules.registry import list_models, get_model_entry
+
+NDJSON = 'application/x-ndjson'
+
+
+class APIError(Exception):
+    """Error reported to the client with an HTTP status"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _decode(data: bytes) -> np.ndarray:
+    """Decode uploaded image bytes into a BGR array (as ultralytics expects for arrays)"""
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise APIError(400, "Could not decode image")
+    return image
+
+
+def _multipart_files(content_type: str, body: bytes) -> List[Tuple[str, bytes]]:
+    """(file name, bytes) of each part of a multipart/form-data body"""
+    message = BytesParser(policy=HTTP).parsebytes(
+        b'Content-Type: ' + content_type.encode('latin-1') + b'\r\n\r\n' + body)
+    if not message.is_multipart():
+        raise APIError(400, "Expected a multipart/form-data body")
+    files = []
+    for index, part in enumerate(message.iter_parts()):
+        name = part.get_filename() or part.get_param('name', header='content-disposition') or f"image_{index}"
+        files.append((name, part.get_payload(decode=True) or b''))
+    return files
+
+
+class InferenceAPI:
+    """Request handling independent of the HTTP plumbing"""
+
+    def __init__(self, config: Dict, pool: InferencePool):
+        self.config = config
+        self.pool = pool
+        self.trained_models_dir = config['paths']['trained_models']
+        self.class_names = [c['name'] for c in config['classes']]
+
+    def models(self) -> List[Dict]:
+        return list_models(self.trained_models_dir)
+
+    def predict_options(self, query: Dict[str, str]) -> Dict:
+        """pool.submit keyword arguments from the query string"""
+        models = self.models()
+        if not models:
+            raise APIError(503, "No trained models registered")
+        name = query.get('model', models[0]['file'])
+        if name not in {m['file'] for m in models}:
+            raise APIError(404, f"Model not found: {name}")
+        entry = get_model_entry(self.trained_models_dir, name) or {}
+
+        try:
+            predict_args = {'conf': float(query.get('conf', self.config['inference']['default_confidence'])),
+                            'iou': float(query.get('iou', self.config['inference']['default_iou'])),
+                            'max_det': self.config['inference']['max_det']}
+            imgsz = int(query['imgsz']) if 'imgsz' in query else entry.get('imgsz')
+        except ValueError as e:
+            raise APIError(400, f"Invalid parameter: {e}")
+        if imgsz:
+            predict_args['imgsz'] = imgsz
+
+        mask_format = query.get('format', 'rle')
+        if mask_format not in ('rle', 'polygon'):
+            raise APIError(400, f"Unknown mask format: {mask_format}")
+        class_thresholds = None
+        if query.get('thresholds') == '1':
+            class_thresholds = entry.get('class_thresholds')
+            if not class_thresholds:
+                raise APIError(400, f"Model {name} has no calibrated class thresholds")
+        return {'model_path': os.path.join(self.trained_models_dir, name), 'predict_args': predict_args,
+                'class_thresholds': class_thresholds, 'mask_format': mask_format}
+
+    def predict(self, data: bytes, query: Dict[str, str]) -> Dict:
+        options = self.predict_options(query)
+        future = self.pool.submit(image=_decode(data), class_names=self.class_names,
+                                  image_name=query.get('name', ''), **options)
+        return future.result(self.config['inference_pool']['timeout_s'])
+
+    def predict_batch(self, files: List[Tuple[str, bytes]], query: Dict[str, str]):
+        """Yield records (or per-image errors) as the pool finishes them"""
+        options = self.predict_options(query)
+        futures = {}
+        for index, (name, data) in enumerate(files):
+            try:
+                image = _decode(data)
+            except APIError as e:
+                yield {'index': index, 'image': name, 'error': str(e)}
+                continue
+            future = self.pool.submit(image=image, class_names=self.class_names, image_name=name, **options)
+            futures[future] = (index, name)
+        # The timeout applies per result, and every image gets a record even if its request never finishes
+        for future, record, error in iter_records(futures, self.config['inference_pool']['timeout_s']):
+            index, name = futures[future]
+            if error is None:
+                yield {'index': index, **record}
+            else:
+                yield {'index': index, 'image': name, 'error': error}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive; every response has a length or is chunked
+    server: 'APIServer'
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, payload):
+        body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_text(self, text: str):
+        body = text.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+
+    def _read_body(self) -> bytes:
+        length = self.headers.get('Content-Length')
+        if length is None:
+            self.close_connection = True
+            raise APIError(411, "Content-Length required")
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True  # the body's extent is unknown, so the stream can't be reused
+            raise APIError(400, "Invalid Content-Length")
+        if length > self.server.max_body_bytes:
+            self.close_connection = True  # the unread body would corrupt the next request
+            raise APIError(413, f"Body exceeds {self.server.max_body_bytes} bytes")
+        return self.rfile.read(length)
+
+    def _route(self):
+        url = urlsplit(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        return url.path.rstrip('/') or '/', query
+
+    def do_GET(self):
+        path, _ = self._route()
+        try:
+            if path == '/health':
+                self._send_json(200, {'status': 'ok', 'pool': self.server.api.pool.stats()})
+            elif path == '/models':
+                self._send_json(200, {'models': self.server.api.models()})
+            elif path == '/metrics':
+                self._send_text(perf.prometheus_text())
+            else:
+                raise APIError(404, f"Unknown endpoint: {path}")
+        except APIError as e:
+            self._send_json(e.status, {'error': str(e)})
+
+    def do_POST(self):
+        path, query = self._route()
+        try:
+            if path == '/predict':
+                body = self._read_body()
+                with perf.span('api.predict'):
+                    record = self.server.api.predict(body, query)
+                self._send_json(200, record)
+            elif path == '/predict/batch':
+                body = self._read_body()
+                files = _multipart_files(self.headers.get('Content-Type', ''), body)
+                if len(files) > self.server.max_batch_images:
+                    raise APIError(413, f"At most {self.server.max_batch_images} images per batch")
+                self._stream_batch(files, query)
+            else:
+                self.close_connection = True
+                raise APIError(404, f"Unknown endpoint: {path}")
+        except APIError as e:
+            self._send_json(e.status, {'error': str(e)})
+        except Exception as e:
+            self._send_json(500, {'error': f"{type(e).__name__}: {e}"})
+
+    def _stream_batch(self, files: List[Tuple[str, bytes]], query: Dict[str, str]):
+        with perf.span('api.predict_batch'):
+            records = self.server.api.predict_batch(files, query)
+            first = next(records, None)  # raises APIError for bad options before any header is sent
+            self.send_response(200)
+            self.send_header('Content-Type', NDJSON)
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            try:
+                if first is not None:
+                    self._write_chunk(json.dumps(first, separators=(',', ':')).encode('utf-8') + b'\n')
+                for record in records:
+                    self._write_chunk(json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n')
+            except Exception as e:
+                # Headers are out; report in-band and end the stream
+                self._write_chunk(json.dumps({'error': f"{type(e).__name__}: {e}"}).encode('utf-8') + b'\n')
+            self._write_chunk(b'')
+
+
+class APIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], api: InferenceAPI, max_body_bytes: int,
+                 max_batch_images: int, quiet: bool = False):
+        super().__init__(address, _Handler)
+        self.api = api
+        self.max_body_bytes = max_body_bytes
+        self.max_batch_images = max_batch_images
+        self.quiet = quiet
+
+
+def make_server(config: Dict, pool: InferencePool, host: str = None, port: int = None,
+                quiet: bool = False) -> APIServer:
+    """
+    Build the API server (call serve_forever to run it)
+
+    Args:
+        config: Application config
+        pool: Inference worker pool the requests run on
+        host: Bind address (default: api.host)
+        port: Port (default: api.port; 0 picks a free one)
+        quiet: Don't log each request to stderr
+
+    Returns:
+        Bound server
+    """
+    api_config = config['api']
+    return APIServer(
+        (host or api_config['host'], api_config['port'] if port is None else port),
+        InferenceAPI(config, pool),
+        max_body_bytes=int(api_config['max_body_mb'] * 1024 * 1024),
+        max_batch_images=api_config['max_batch_images'],
+        quiet=quiet
+    )
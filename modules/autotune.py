@@ -0,0 +1,204 @@
+"""
+Automatic batch size and thread tuning for CPU training
+
+Only knobs the ultralytics trainer honours on CPU are tuned: it forces
+dataloader workers to 0 there, so probes load data in-process as training
+will, and the peak RSS of the process covers the whole data pipeline.
+"""
+import os
+import json
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Callable
+
+import torch
+
+from modules.utils import get_rss_mb, get_available_memory_mb
+
+
+def default_thread_candidates() -> List[int]:
+    """Candidate torch intra-op thread counts derived from the CPU count"""
+    n_cores = os.cpu_count() or 1
+    candidates = {n_cores, max(1, n_cores // 2), max(1, n_cores // 4)}
+    return sorted(candidates, reverse=True)
+
+
+def _load_probe_model(model_name: str, imgsz: int):
+    """Load the model used for probing, prepared for a training step"""
+    from ultralytics import YOLO
+    from ultralytics.cfg import get_cfg
+    from ultralytics.utils import DEFAULT_CFG
+
+    model = YOLO(model_name).model
+    model.args = get_cfg(DEFAULT_CFG, overrides={'imgsz': imgsz, 'task': 'segment'})
+    for param in model.parameters():
+        param.requires_grad = True
+    model.train()
+    return model
+
+
+def _build_probe_dataset(data_yaml: str, imgsz: int, max_batch: int, stride: int):
+    """Build the training dataset once; dataloaders are rebuilt per probe"""
+    from ultralytics.cfg import get_cfg
+    from ultralytics.data import build_yolo_dataset
+    from ultralytics.data.utils import check_det_dataset
+    from ultralytics.utils import DEFAULT_CFG
+
+    cfg = get_cfg(DEFAULT_CFG, overrides={'imgsz': imgsz, 'task': 'segment'})
+    data = check_det_dataset(data_yaml)
+    return build_yolo_dataset(cfg, data['train'], max_batch, data, mode='train', stride=stride)
+
+
+def probe_training_step(model, dataset, batch_size: int, threads: int,
+                        iterations: int = 3, warmup: int = 1) -> Dict:
+    """
+    Time a few forward/backward/optimizer steps for one configuration
+
+    Args:
+        model: Segmentation model in train mode (model.args must be set)
+        dataset: YOLO training dataset
+        batch_size: Batch size to probe
+        threads: Number of torch intra-op threads
+        iterations: Number of timed iterations
+        warmup: Number of untimed warmup iterations
+
+    Returns:
+        Dictionary with throughput (images/s) and peak RSS (MB)
+    """
+    from ultralytics.data import build_dataloader
+
+    previous_threads = torch.get_num_threads()
+    torch.set_num_threads(threads)
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.0)
+    loader = build_dataloader(dataset, batch_size, 0, shuffle=True, rank=-1)
+    peak_rss = get_rss_mb()
+    n_images = 0
+    elapsed = 0.0
+
+    try:
+        batches = iter(loader)
+        for step in range(warmup + iterations):
+            start = time.perf_counter()
+            try:
+                batch = next(batches)
+            except StopIteration:
+                batches = iter(loader)
+                batch = next(batches)
+            batch['img'] = batch['img'].float() / 255
+            loss, _ = model.loss(batch)
+            loss.sum().backward()
+            optimizer.step()
+            optimizer.zero_grad(set_to_none=True)
+
+            if step >= warmup:
+                elapsed += time.perf_counter() - start
+                n_images += batch['img'].shape[0]
+            peak_rss = max(peak_rss, get_rss_mb())
+    finally:
+        torch.set_num_threads(previous_threads)
+        del loader
+
+    return {
+        'batch_size': batch_size,
+        'threads': threads,
+        'throughput': n_images / elapsed if elapsed > 0 else 0.0,
+        'peak_rss_mb': peak_rss
+    }
+
+
+def autotune_cpu_training(model_name: str, data_yaml: str, imgsz: int,
+                          batch_candidates: List[int],
+                          thread_candidates: Optional[List[int]] = None,
+                          memory_budget_mb: Optional[float] = None,
+                          iterations: int = 3, warmup: int = 1,
+                          progress_callback: Optional[Callable[[int, int, Dict], None]] = None) -> Dict:
+    """
+    Pick the highest-throughput CPU training configuration within a memory budget
+
+    The search is staged to keep probing short: thread counts are probed first
+    at the smallest batch size, then batch sizes (ascending, stopping at the
+    first one that exceeds the memory budget).
+
+    Args:
+        model_name: Model weights or name (e.g. yolo11s-seg.pt)
+        data_yaml: Path to dataset data.yaml
+        imgsz: Training image size
+        batch_candidates: Candidate batch sizes
+        thread_candidates: Candidate torch thread counts (default: from CPU count)
+        memory_budget_mb: Peak RSS budget (default: 80% of available memory)
+        iterations: Timed iterations per probe
+        warmup: Warmup iterations per probe
+        progress_callback: Called as (probe_index, n_probes, probe_result)
+
+    Returns:
+        Dictionary with the chosen configuration and all probe results
+    """
+    batch_candidates = sorted(set(batch_candidates))
+    thread_candidates = thread_candidates or default_thread_candidates()
+    if memory_budget_mb is None:
+        memory_budget_mb = get_rss_mb() + 0.8 * get_available_memory_mb()
+
+    model = _load_probe_model(model_name, imgsz)
+    stride = max(int(model.stride.max()), 32)
+    dataset = _build_probe_dataset(data_yaml, imgsz, max(batch_candidates), stride)
+
+    n_probes = len(thread_candidates) + len(batch_candidates)
+    probes = []
+
+    def run_probe(batch_size, threads):
+        try:
+            result = probe_training_step(model, dataset, batch_size, threads,
+                                         iterations=iterations, warmup=warmup)
+            result['within_budget'] = result['peak_rss_mb'] <= memory_budget_mb
+        except RuntimeError as e:  # typically out of memory
+            result = {
+                'batch_size': batch_size, 'threads': threads,
+                'throughput': 0.0, 'peak_rss_mb': None,
+                'within_budget': False, 'error': str(e)
+            }
+        probes.append(result)
+        if progress_callback is not None:
+            progress_callback(len(probes), n_probes, result)
+        return result
+
+    def best_of(results):
+        valid = [r for r in results if r['within_budget'] and r['throughput'] > 0]
+        return max(valid, key=lambda r: r['throughput']) if valid else None
+
+    # Stage 1: threads
+    stage = [run_probe(batch_candidates[0], t) for t in thread_candidates]
+    best = best_of(stage)
+    if best is None:
+        raise RuntimeError("No configuration fits within the memory budget")
+    threads = best['threads']
+
+    # Stage 2: batch size (memory grows with batch size, so stop at the first overrun)
+    stage = [best]
+    for batch_size in batch_candidates[1:]:
+        result = run_probe(batch_size, threads)
+        stage.append(result)
+        if not result['within_budget']:
+            break
+    best = best_of(stage)
+
+    return {
+        'model_name': model_name,
+        'imgsz': imgsz,
+        'batch_size': best['batch_size'],
+        'threads': best['threads'],
+        'throughput': best['throughput'],
+        'peak_rss_mb': best['peak_rss_mb'],
+        'memory_budget_mb': memory_budget_mb,
+        'cpu_count': os.cpu_count(),
+        'timestamp': datetime.now().strftime("%Y%m%d_%H%M%S"),
+        'probes': probes
+    }
+
+
+def save_autotune_result(result: Dict, run_dir: str) -> str:
+    """Save autotune result next to the training run it was used for"""
+    os.makedirs(run_dir, exist_ok=True)
+    output_path = os.path.join(run_dir, 'autotune.json')
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    return output_path
@@ -0,0 +1,294 @@
+"""
+Benchmark suite for the hot paths, with JSON baselines and regression checks
+
+Everything runs on synthetic data in a temporary directory, so the suite
+works offline on a CPU-only machine. End-to-end inference builds an
+untrained yolo11n-seg model from its YAML definition (no weight download).
+Reports carry a fixture version, and a baseline recorded on other fixtures
+is not compared against.
+"""
+import os
+import json
+import time
+import hashlib
+import shutil
+import platform
+import tempfile
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence
+
+import cv2
+import numpy as np
+
+from modules.utils import (
+    save_yolo_annotation, load_yolo_annotation, split_dataset, validate_dataset
+)
+from modules.visualization import draw_detections, draw_annotations
+from modules.synthetic import GENERATOR_VERSION, generate_film, generate_dataset
+
+BASELINE_FILE = 'baseline.json'
+FILM_SIZE = (1536, 768)  # width, height
+# Bump whenever a setup function changes the data it prepares (sizes, counts, seeds)
+FIXTURE_VERSION = 1
+
+
+def _class_ids(classes: List[Dict]) -> Dict[str, int]:
+    return {c['name']: i for i, c in enumerate(classes)}
+
+
+# Each setup function prepares its data in workdir and returns the callable to time
+
+def _setup_label_io(workdir: str, classes: List[Dict]) -> Callable:
+    rng = np.random.default_rng(0)
+    # Label I/O cost depends on polygon and point counts, not on the film size
+    width, height = 320, 160
+    labels_dir = os.path.join(workdir, 'label_io')
+    os.makedirs(labels_dir, exist_ok=True)
+    films = [(f"film_{i:04d}.png", generate_film(rng, width, height, _class_ids(classes), points_per_polygon=60)[1])
+             for i in range(200)]
+
+    def run():
+        for name, annotations in films:
+            save_yolo_annotation(name, annotations, labels_dir, width, height)
+        for name, _ in films:
+            load_yolo_annotation(os.path.join(labels_dir, name[:-4] + '.txt'), width, height)
+    return run
+
+
+def _setup_split_dataset(workdir: str, classes: List[Dict]) -> Callable:
+    source = os.path.join(workdir, 'split_source')
+    generate_dataset(os.path.join(source, 'images'), os.path.join(source, 'labels'), 200,
+                     [c['name'] for c in classes], 320, 160, seed=1, image_format='png', workers=1)
+    dataset_dir = os.path.join(workdir, 'split_dataset')
+
+    def run():
+        shutil.rmtree(dataset_dir, ignore_errors=True)
+        for kind in ('images', 'labels'):
+            for split in ('train', 'val', 'test'):
+                os.makedirs(os.path.join(dataset_dir, kind, split))
+        np.random.seed(0)
+        split_dataset(os.path.join(source, 'images'), os.path.join(source, 'labels'), dataset_dir, 0.7, 0.2, 0.1)
+    return run
+
+
+def _setup_validate_dataset(workdir: str, classes: List[Dict]) -> Callable:
+    dataset_dir = os.path.join(workdir, 'validate_dataset')
+    for split, n_images in (('train', 140), ('val', 40), ('test', 20)):
+        generate_dataset(os.path.join(dataset_dir, 'images', split), os.path.join(dataset_dir, 'labels', split),
+                         n_images, [c['name'] for c in classes], 64, 32, seed=2, image_format='png',
+                         prefix=split, workers=1)
+    return lambda: validate_dataset(dataset_dir)
+
+
+def _setup_visualize_results(workdir: str, classes: List[Dict]) -> Callable:
+    rng = np.random.default_rng(3)
+    width, height = FILM_SIZE
+    image = cv2.cvtColor(generate_film(rng, width, height, {})[0], cv2.COLOR_GRAY2RGB)
+    # Masks at model resolution (imgsz 640 letterboxed to 2:1), as in ultralytics results
+    mask_h, mask_w = 320, 640
+    annotations = generate_film(rng, mask_w, mask_h, _class_ids(classes))[1][:30]
+    masks = np.zeros((len(annotations), mask_h, mask_w), dtype=np.float32)
+    boxes = np.zeros((len(annotations), 6), dtype=np.float32)
+    for i, ann in enumerate(annotations):
+        polygon = np.array(ann['polygon'], np.int32)
+        cv2.fillPoly(masks[i], [polygon], 1.0)
+        x1, y1 = polygon.min(axis=0) * (width / mask_w, height / mask_h)
+        x2, y2 = polygon.max(axis=0) * (width / mask_w, height / mask_h)
+        boxes[i] = (x1, y1, x2, y2, rng.uniform(0.3, 1.0), ann['class_id'])
+    return lambda: draw_detections(image, masks, boxes, classes)
+
+
+def _setup_draw_annotations(workdir: str, classes: List[Dict]) -> Callable:
+    rng = np.random.default_rng(4)
+    width, height = FILM_SIZE
+    image, annotations = generate_film(rng, width, height, _class_ids(classes), points_per_polygon=60)
+    image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+    return lambda: draw_annotations(image, annotations, classes)
+
+
+def _setup_inference(workdir: str, classes: List[Dict]) -> Callable:
+    from ultralytics import YOLO
+
+    rng = np.random.default_rng(5)
+    model = YOLO('yolo11n-seg.yaml', task='segment')
+    images = [cv2.cvtColor(generate_film(rng, *FILM_SIZE, {})[0], cv2.COLOR_GRAY2BGR) for _ in range(4)]
+    return lambda: model.predict(images, imgsz=320, conf=0.001, device='cpu', verbose=False)
+
+
+BENCHMARKS = {
+    'label_io': _setup_label_io,
+    'split_dataset': _setup_split_dataset,
+    'validate_dataset': _setup_validate_dataset,
+    'visualize_results': _setup_visualize_results,
+    'draw_annotations': _setup_draw_annotations,
+    'inference_e2e': _setup_inference,
+}
+
+
+def fixture_version(classes: List[Dict]) -> str:
+    """
+    Digest of everything that shapes the benchmark fixtures
+
+    Covers the generator and fixture versions, the film size and the
+    classes drawn; timings taken on different fixtures are not comparable.
+    """
+    encoded = json.dumps({
+        'generator': GENERATOR_VERSION,
+        'fixtures': FIXTURE_VERSION,
+        'film_size': list(FILM_SIZE),
+        'classes': [c['name'] for c in classes]
+    }, sort_keys=True).encode('utf-8')
+    return hashlib.sha1(encoded).hexdigest()[:12]
+
+
+def environment_info() -> Dict:
+    """Machine and library versions a baseline was recorded on"""
+    info = {
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__
+    }
+    try:
+        import torch
+        info['torch'] = torch.__version__
+        info['torch_threads'] = torch.get_num_threads()
+    except ImportError:
+        pass
+    return info
+
+
+def time_callable(fn: Callable, repeats: int = 5, warmup: int = 1) -> Dict:
+    """
+    Time a callable
+
+    Returns:
+        Median, min, max and mean wall time in milliseconds
+    """
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return {
+        'median_ms': round(float(np.median(times)), 3),
+        'min_ms': round(float(np.min(times)), 3),
+        'max_ms': round(float(np.max(times)), 3),
+        'mean_ms': round(float(np.mean(times)), 3),
+        'repeats': repeats
+    }
+
+
+def run_benchmarks(classes: List[Dict], names: Optional[Sequence[str]] = None, repeats: int = 5,
+                   warmup: int = 1, progress_callback: Optional[Callable[[str], None]] = None) -> Dict:
+    """
+    Run the benchmark suite
+
+    Args:
+        classes: Class definitions from the config
+        names: Benchmarks to run (default: all)
+        repeats: Timed repetitions per benchmark
+        warmup: Untimed repetitions per benchmark
+        progress_callback: Called with each benchmark name before it runs
+
+    Returns:
+        Report with the environment and per-benchmark timings; benchmarks
+        whose dependencies are missing are reported as skipped
+    """
+    names = list(names or BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise ValueError(f"Unknown benchmarks: {', '.join(unknown)}")
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'environment': environment_info(),
+        'fixture_version': fixture_version(classes),
+        'benchmarks': {}
+    }
+    workdir = tempfile.mkdtemp(prefix='vir_bench_')
+    try:
+        for name in names:
+            if progress_callback is not None:
+                progress_callback(name)
+            try:
+                fn = BENCHMARKS[name](workdir, classes)
+            except ImportError as e:
+                report['benchmarks'][name] = {'skipped': str(e)}
+                continue
+            report['benchmarks'][name] = time_callable(fn, repeats, warmup)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def compare_to_baseline(report: Dict, baseline: Dict, max_regression: float = 0.2,
+                        thresholds: Optional[Dict[str, float]] = None,
+                        min_delta_ms: float = 1.0) -> Dict:
+    """
+    Compare median timings against a baseline
+
+    A benchmark regresses when its median is more than max_regression (or
+    its entry in thresholds) slower relative to the baseline and at least
+    min_delta_ms slower in absolute terms.
+
+    Returns:
+        Per-benchmark comparison, the names of regressed benchmarks and
+        whether the environment differs from the baseline's
+
+    Raises:
+        ValueError: If the baseline was recorded on different fixtures
+    """
+    if report.get('fixture_version') != baseline.get('fixture_version'):
+        raise ValueError(
+            f"Baseline fixtures ({baseline.get('fixture_version') or 'unversioned'}) differ from this run's "
+            f"({report.get('fixture_version')}); record a new baseline with --save-baseline"
+        )
+    thresholds = thresholds or {}
+    comparison = {}
+    regressions = []
+    for name, current in report['benchmarks'].items():
+        previous = baseline['benchmarks'].get(name)
+        if 'skipped' in current or previous is None or 'skipped' in previous:
+            continue
+        ratio = current['median_ms'] / previous['median_ms'] if previous['median_ms'] else float('inf')
+        limit = thresholds.get(name, max_regression)
+        regressed = (ratio - 1 > limit and current['median_ms'] - previous['median_ms'] >= min_delta_ms)
+        comparison[name] = {
+            'baseline_ms': previous['median_ms'],
+            'current_ms': current['median_ms'],
+            'change': round(ratio - 1, 4),
+            'threshold': limit,
+            'regressed': regressed
+        }
+        if regressed:
+            regressions.append(name)
+    return {
+        'comparison': comparison,
+        'regressions': regressions,
+        'environment_changed': report['environment'] != baseline.get('environment')
+    }
+
+
+def load_baseline(benchmarks_dir: str) -> Optional[Dict]:
+    path = os.path.join(benchmarks_dir, BASELINE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_report(benchmarks_dir: str, report: Dict, as_baseline: bool = False) -> str:
+    """Write a run report (and optionally make it the baseline); returns its path"""
+    os.makedirs(benchmarks_dir, exist_ok=True)
+    name = BASELINE_FILE if as_baseline else f"run_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    path = os.path.join(benchmarks_dir, name)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp_path, path)
+    return path
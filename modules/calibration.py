@@ -0,0 +1,150 @@
+"""
+Per-class confidence threshold calibration and class-aware filtering at inference
+"""
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+import torch
+from ultralytics.models.yolo.segment import SegmentationPredictor
+
+from modules.evaluation import evaluate_model
+from modules.registry import register_model, get_model_entry
+
+
+def calibrate_class_thresholds(matches: Dict[int, Dict], class_names: List[str],
+                               default_threshold: float = 0.25,
+                               min_threshold: float = 0.01) -> Dict:
+    """
+    Pick, per class, the score threshold that maximizes F1 at IoU 0.5
+
+    Every prefix of the score-sorted predictions is a candidate threshold, so
+    F1 for all candidates comes from one cumulative sum.
+
+    Args:
+        matches: Output of evaluation.match_predictions (on the validation split)
+        class_names: Class names by id
+        default_threshold: Threshold for classes without ground truth or predictions
+        min_threshold: Lower bound on calibrated thresholds
+
+    Returns:
+        Dictionary with 'thresholds' (list by class id) and per-class F1/precision/recall
+    """
+    thresholds = []
+    details = {}
+    for c in range(len(class_names)):
+        data = matches.get(c)
+        if data is None or data['n_gt'] == 0 or len(data['scores']) == 0:
+            thresholds.append(default_threshold)
+            details[class_names[c]] = {'threshold': default_threshold, 'calibrated': False}
+            continue
+
+        tp_cum = np.cumsum(data['tp'][0])
+        n_kept = np.arange(1, len(tp_cum) + 1)
+        precision = tp_cum / n_kept
+        recall = tp_cum / data['n_gt']
+        f1 = 2 * precision * recall / np.maximum(precision + recall, 1e-9)
+        best = int(np.argmax(f1))
+        threshold = max(float(data['scores'][best]), min_threshold)
+
+        thresholds.append(threshold)
+        details[class_names[c]] = {
+            'threshold': threshold,
+            'calibrated': True,
+            'f1': float(f1[best]),
+            'precision': float(precision[best]),
+            'recall': float(recall[best])
+        }
+    return {'thresholds': thresholds, 'classes': details}
+
+
+def calibrate_model(trained_models_dir: str, model_file: str, dataset_dir: str,
+                    cache_root: str, class_names: List[str], split: str = 'val',
+                    default_threshold: float = 0.25, min_threshold: float = 0.01,
+                    **evaluate_args) -> Dict:
+    """
+    Calibrate per-class thresholds from cached validation predictions and store them with the model
+
+    Args:
+        trained_models_dir: Directory with trained models
+        model_file: Model file name inside trained_models_dir
+        dataset_dir: Prepared dataset directory
+        cache_root: Root directory of the prediction cache
+        class_names: Class names by id
+        split: Split to calibrate on
+        default_threshold: Threshold for classes that cannot be calibrated
+        min_threshold: Lower bound on calibrated thresholds
+        **evaluate_args: Extra arguments for evaluation.evaluate_model
+
+    Returns:
+        The updated registry entry
+    """
+    entry = get_model_entry(trained_models_dir, model_file) or {}
+    evaluate_args.setdefault('imgsz', entry.get('imgsz'))
+    result = evaluate_model(os.path.join(trained_models_dir, model_file), dataset_dir,
+                            cache_root, len(class_names), split=split, **evaluate_args)
+    calibration = calibrate_class_thresholds(result['matches'], class_names,
+                                             default_threshold, min_threshold)
+    return register_model(
+        trained_models_dir, model_file,
+        class_thresholds=calibration['thresholds'],
+        calibration={'split': split, 'n_images': result['n_images'], **calibration}
+    )
+
+
+class ClassThresholdSegmentationPredictor(SegmentationPredictor):
+    """Segmentation predictor that drops detections below their class threshold before mask processing"""
+
+    class_thresholds: Optional[torch.Tensor] = None
+
+    def construct_result(self, pred, img, orig_img, img_path, proto):
+        if self.class_thresholds is not None and len(pred):
+            thresholds = self.class_thresholds.to(pred.device)
+            pred = pred[pred[:, 4] >= thresholds[pred[:, 5].long()]]
+        return super().construct_result(pred, img, orig_img, img_path, proto)
+
+
+def filter_by_class_thresholds(result, thresholds: torch.Tensor):
+    """Keep detections whose confidence reaches their class threshold (vectorized)"""
+    if result.boxes is None or len(result.boxes) == 0:
+        return result
+    boxes = result.boxes
+    keep = boxes.conf >= thresholds.to(boxes.conf.device)[boxes.cls.long()]
+    if bool(keep.all()):
+        return result
+    return result[keep]
+
+
+def predict_with_class_thresholds(model, source, class_thresholds: List[float], **predict_args):
+    """
+    Predict with per-class confidence thresholds
+
+    NMS runs at the lowest class threshold; the per-class filter is applied
+    before masks are processed and upsampled, and again on the results for
+    ultralytics versions without the construct_result hook.
+
+    Args:
+        model: Loaded YOLO model
+        source: Image(s) accepted by YOLO.predict
+        class_thresholds: Threshold per class id
+        **predict_args: Extra predict arguments (iou, imgsz, ...)
+
+    Returns:
+        List of results
+    """
+    thresholds = torch.tensor(class_thresholds, dtype=torch.float32)
+    predict_args['conf'] = float(thresholds.min())
+
+    if not isinstance(model.predictor, ClassThresholdSegmentationPredictor):
+        model.predictor = ClassThresholdSegmentationPredictor(
+            overrides={**model.overrides, 'mode': 'predict', 'save': False, **predict_args},
+            _callbacks=model.callbacks
+        )
+        model.predictor.setup_model(model=model.model, verbose=False)
+    model.predictor.class_thresholds = thresholds
+    try:
+        results = model.predict(source, verbose=False, **predict_args)
+    finally:
+        # The predictor is reused by plain predict calls on the same model
+        model.predictor.class_thresholds = None
+    return [filter_by_class_thresholds(result, thresholds) for result in results]
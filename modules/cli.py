@@ -0,0 +1,527 @@
+"""
+Headless command-line interface: python -m modules <command> [options]
+
+Every command prints a JSON summary on stdout (logs go to stderr) and exits
+non-zero on failure (or, for bench, on a performance regression, and for
+validate, on an invalid dataset), so it can be scheduled on worker nodes and
+in CI.
+"""
+import os
+import sys
+import json
+import argparse
+import contextlib
+import traceback
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from modules.utils import load_config
+
+
+def _class_names(config: Dict) -> List[str]:
+    return [c['name'] for c in config['classes']]
+
+
+def _resolve_model(config: Dict, model: Optional[str]) -> str:
+    """Model path from a path, a file name in the trained models directory, or the best registered model"""
+    from modules.registry import list_models
+
+    trained_models_dir = config['paths']['trained_models']
+    if model is None:
+        models = list_models(trained_models_dir)
+        if not models:
+            raise FileNotFoundError("No trained models registered")
+        return os.path.join(trained_models_dir, models[0]['file'])
+    if os.path.exists(model):
+        return model
+    candidate = os.path.join(trained_models_dir, model)
+    if os.path.exists(candidate):
+        return candidate
+    raise FileNotFoundError(f"Model not found: {model}")
+
+
+def _registry_entry(config: Dict, model_path: str) -> Dict:
+    from modules.registry import get_model_entry
+
+    trained_models_dir = config['paths']['trained_models']
+    if os.path.abspath(os.path.dirname(model_path)) != os.path.abspath(trained_models_dir):
+        return {}
+    return get_model_entry(trained_models_dir, os.path.basename(model_path)) or {}
+
+
+def cmd_prepare(args, config: Dict) -> Dict:
+    """Split annotated films into train/val/test and write data.yaml and the manifest"""
+    import numpy as np
+    from modules.utils import split_dataset, create_dataset_yaml, write_dataset_manifest
+
+    dataset_config = config['dataset']
+    # An explicit 0 is a valid ratio, so only a missing option falls back to the config
+    train_ratio = dataset_config['train_ratio'] if args.train_ratio is None else args.train_ratio
+    val_ratio = dataset_config['val_ratio'] if args.val_ratio is None else args.val_ratio
+    test_ratio = 1.0 - train_ratio - val_ratio
+    if test_ratio < 0:
+        raise ValueError("train_ratio + val_ratio must not exceed 1.0")
+
+    dataset_dir = config['paths']['dataset']
+    for kind in ('images', 'labels'):
+        for split in ('train', 'val', 'test'):
+            os.makedirs(os.path.join(dataset_dir, kind, split), exist_ok=True)
+
+    groups = None
+    if args.group_duplicates:
+        from modules.image_hash import HashIndex
+
+        hash_index = HashIndex(config['paths']['image_hashes'])
+        hash_index.update(config['paths']['raw_images'], config['image']['supported_formats'])
+        groups = hash_index.groups(max_distance=config['dedup']['max_distance'])
+
+    if args.seed is not None:
+        np.random.seed(args.seed)
+    counts = split_dataset(config['paths']['raw_images'], config['paths']['annotations'],
+                           dataset_dir, train_ratio, val_ratio, test_ratio, groups=groups)
+    data_yaml = create_dataset_yaml(dataset_dir, _class_names(config))
+    manifest = write_dataset_manifest(dataset_dir)
+    return {
+        'splits': counts,
+        'data_yaml': data_yaml,
+        'manifest_hash': manifest['hash'],
+        'duplicate_groups': len(groups) if groups is not None else None
+    }
+
+
+def cmd_validate(args, config: Dict) -> Dict:
+    """Check the prepared dataset layout and counts"""
+    from modules.utils import validate_dataset
+
+    return validate_dataset(config['paths']['dataset'])
+
+
+def cmd_train(args, config: Dict) -> Dict:
+    """Train a model on the prepared dataset and publish the best weights"""
+    from modules.trainer import run_training, publish_model
+
+    training_config = config['training']
+    data_yaml = os.path.join(config['paths']['dataset'], 'data.yaml')
+    if not os.path.exists(data_yaml):
+        raise FileNotFoundError("Dataset not prepared; run the 'prepare' command first")
+
+    model_name = args.model or training_config['default_model']
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    train_args = dict(
+        epochs=args.epochs or training_config['default_epochs'],
+        batch=args.batch or training_config['default_batch_size'],
+        imgsz=args.imgsz or training_config['default_imgsz'],
+        lr0=args.lr or training_config['default_lr'],
+        patience=training_config['patience'] if args.patience is None else args.patience,
+        save_period=training_config['save_period'],
+        device=args.device,
+        optimizer=args.optimizer,
+        verbose=False
+    )
+    if args.workers is not None:
+        train_args['workers'] = args.workers
+
+    run = run_training(model_name, data_yaml, config['paths']['training_results'],
+                       args.name or f"training_{timestamp}",
+                       record={'base_model': model_name, 'timestamp': timestamp, 'origin': 'cli'},
+                       **train_args)
+    model_file = publish_model(
+        run['best_weights'],
+        config['paths']['trained_models'],
+        timestamp,
+        data_yaml=data_yaml,
+        profile=not args.no_profile,
+        origin='training',
+        source_run=run['run_dir'],
+        base_model=model_name,
+        hyperparameters={k: train_args[k] for k in ('lr0', 'imgsz', 'optimizer', 'batch', 'epochs')},
+        metrics=run['metrics']
+    )
+    return {'run': run, 'published': model_file}
+
+
+def cmd_predict(args, config: Dict) -> Dict:
+    """Predict a batch of films and write one JSON record per film"""
+    from ultralytics import YOLO
+    from modules.prediction import collect_images, predict_images
+
+    model_path = _resolve_model(config, args.model)
+    entry = _registry_entry(config, model_path)
+    image_paths = collect_images(args.source)
+    class_thresholds = entry.get('class_thresholds') if args.class_thresholds else None
+
+    predict_args = {'conf': args.conf if args.conf is not None else config['inference']['default_confidence'],
+                    'iou': args.iou if args.iou is not None else config['inference']['default_iou'],
+                    'max_det': config['inference']['max_det']}
+    imgsz = args.imgsz or entry.get('imgsz')
+    if imgsz:
+        predict_args['imgsz'] = imgsz
+
+    model = YOLO(model_path, task='segment')
+    n_detections = 0
+    output = open(args.output, 'w', encoding='utf-8') if args.output else None
+    try:
+        for record in predict_images(model, image_paths, _class_names(config), args.batch,
+                                     class_thresholds, args.mask_format, **predict_args):
+            n_detections += len(record['detections'])
+            if output is not None:
+                output.write(json.dumps(record) + '\n')
+    finally:
+        if output is not None:
+            output.close()
+    return {
+        'model': os.path.basename(model_path),
+        'images': len(image_paths),
+        'detections': n_detections,
+        'class_thresholds': class_thresholds,
+        'output': args.output
+    }
+
+
+def cmd_evaluate(args, config: Dict) -> Dict:
+    """Evaluate a model on a dataset split with the cached evaluation engine"""
+    from modules.evaluation import evaluate_model, compute_metrics
+
+    eval_config = config['evaluation']
+    model_path = _resolve_model(config, args.model)
+    entry = _registry_entry(config, model_path)
+    class_names = _class_names(config)
+    result = evaluate_model(
+        model_path, config['paths']['dataset'], config['paths']['eval_cache'], len(class_names),
+        split=args.split or eval_config['split'],
+        conf=eval_config['prediction_conf'],
+        iou=config['inference']['default_iou'],
+        imgsz=args.imgsz or entry.get('imgsz'),
+        max_det=config['inference']['max_det'],
+        batch_size=eval_config['batch_size'],
+        max_side=eval_config['eval_max_side'],
+        workers=eval_config['workers'] or None
+    )
+    threshold = entry.get('class_thresholds') if args.class_thresholds else None
+    if not threshold:
+        threshold = args.score_threshold if args.score_threshold is not None \
+            else config['inference']['default_confidence']
+    report = compute_metrics(result['matches'], class_names, threshold)
+    if not args.pr_curves:
+        for metrics in report['per_class'].values():
+            metrics.pop('pr_curve', None)
+    return {
+        'model': result['model'],
+        'split': result['split'],
+        'n_images': result['n_images'],
+        'n_predicted': result['n_predicted'],
+        'score_threshold': threshold,
+        **report
+    }
+
+
+def cmd_export(args, config: Dict) -> Dict:
+    """Export a model to ONNX, or to a quantized int8 ONNX model gated on accuracy"""
+    model_path = _resolve_model(config, args.model)
+    entry = _registry_entry(config, model_path)
+    imgsz = args.imgsz or entry.get('imgsz') or config['training']['default_imgsz']
+
+    if args.format == 'int8':
+        from modules.quantize import quantize_model
+
+        quantization_config = config['quantization']
+        if os.path.abspath(os.path.dirname(model_path)) != os.path.abspath(config['paths']['trained_models']):
+            raise ValueError("int8 export works on registered models in the trained models directory")
+        return quantize_model(
+            config['paths']['trained_models'], os.path.basename(model_path), config['paths']['dataset'],
+            method=quantization_config['method'],
+            max_map_drop=quantization_config['max_map_drop'],
+            calibration_limit=quantization_config['calibration_images'],
+            per_channel=quantization_config['per_channel'],
+            latency_runs=config['registry']['latency_runs']
+        )
+
+    from ultralytics import YOLO
+
+    exported = YOLO(model_path).export(format=args.format, imgsz=imgsz, verbose=False)
+    return {'model': os.path.basename(model_path), 'format': args.format, 'imgsz': imgsz,
+            'exported': str(exported)}
+
+
+def cmd_benchmark(args, config: Dict) -> Dict:
+    """Measure CPU inference latency of a model (and record it in the registry with --register)"""
+    from ultralytics import YOLO
+    from modules.registry import measure_cpu_latency, profile_model
+
+    model_path = _resolve_model(config, args.model)
+    entry = _registry_entry(config, model_path)
+    imgsz = args.imgsz or entry.get('imgsz') or config['training']['default_imgsz']
+    runs = args.runs or config['registry']['latency_runs']
+    warmup = args.warmup if args.warmup is not None else config['registry']['latency_warmup']
+
+    if args.register:
+        if not entry:
+            raise ValueError("--register needs a model in the trained models directory")
+        data_yaml = os.path.join(config['paths']['dataset'], 'data.yaml')
+        return profile_model(config['paths']['trained_models'], os.path.basename(model_path),
+                             data_yaml if os.path.exists(data_yaml) else None, imgsz, runs, warmup)
+
+    images = None
+    if args.images:
+        from modules.prediction import collect_images
+        images = collect_images([args.images])[:runs]
+    latency = measure_cpu_latency(YOLO(model_path, task='segment'), imgsz, images, runs, warmup)
+    return {'model': os.path.basename(model_path), 'imgsz': imgsz, 'latency': latency}
+
+
+def cmd_synth(args, config: Dict) -> Dict:
+    """Generate synthetic panoramic films with YOLO polygon labels for scale testing"""
+    from modules.synthetic import generate_dataset
+
+    synthetic_config = config['synthetic']
+    output_dir = args.output or config['paths']['synthetic']
+    width, height = args.size or synthetic_config['size']
+    return generate_dataset(
+        os.path.join(output_dir, 'images'), os.path.join(output_dir, 'labels'),
+        args.count or synthetic_config['count'],
+        _class_names(config),
+        width, height,
+        seed=args.seed,
+        teeth_per_quadrant=synthetic_config['teeth_per_quadrant'],
+        points_per_polygon=args.points or synthetic_config['points_per_polygon'],
+        findings_rate=args.findings_rate if args.findings_rate is not None else synthetic_config['findings_rate'],
+        image_format=synthetic_config['image_format'],
+        workers=args.workers,
+        chunk_size=synthetic_config['chunk_size'],
+        overwrite=args.overwrite,
+        progress_callback=lambda done, total: print(f"Generated {done}/{total} films", file=sys.stderr)
+    )
+
+
+def cmd_loadtest(args, config: Dict) -> Dict:
+    """Simulate concurrent sessions and report throughput, latency percentiles and peak RSS"""
+    from modules.loadtest import load_test
+
+    loadtest_config = config['loadtest']
+    model_path = None
+    if args.mode in ('core', 'pool'):
+        try:
+            model_path = _resolve_model(config, args.model)
+        except FileNotFoundError:
+            if args.model is None:
+                raise FileNotFoundError(
+                    "No trained models registered; pass --model (e.g. yolo11n-seg.yaml "
+                    "for an untrained model) to load test without one"
+                )
+            # Not a local file: let ultralytics resolve it (model definitions, hub weights)
+            model_path = args.model
+    elif args.mode == 'http':
+        model_path = args.model  # resolved by the API against its registry
+
+    def report(step):
+        print(f"{step['sessions']} sessions: {step['throughput_per_s']} films/s, "
+              f"peak RSS {step['peak_rss_mb']} MB"
+              + (f" (+{step['workers_peak_rss_mb']} MB in workers)" if 'workers_peak_rss_mb' in step else '')
+              + f", {step['n_errors']} errors", file=sys.stderr)
+
+    return load_test(
+        config, args.sessions or loadtest_config['sessions'], mode=args.mode,
+        iterations=args.iterations or loadtest_config['iterations'],
+        model_path=model_path,
+        n_films=loadtest_config['n_films'],
+        film_size=args.size or loadtest_config['film_size'],
+        timeout_s=loadtest_config['timeout_s'],
+        url=args.url,
+        progress_callback=report
+    )
+
+
+def cmd_serve(args, config: Dict) -> Dict:
+    """Serve the HTTP inference API until interrupted"""
+    from modules.api import make_server
+    from modules.inference_pool import get_inference_pool
+
+    pool = get_inference_pool(config)
+    server = make_server(config, pool, args.host, args.port, quiet=args.quiet)
+    host, port = server.server_address[:2]
+    print(f"Serving on http://{host}:{port} with {pool.n_workers} inference workers", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.close()
+    return {'host': host, 'port': port, 'pool': pool.stats()}
+
+
+def cmd_bench(args, config: Dict) -> Dict:
+    """Run the hot-path benchmark suite and compare it against the stored baseline"""
+    from modules.benchmark import run_benchmarks, compare_to_baseline, load_baseline, save_report
+
+    bench_config = config['benchmark']
+    benchmarks_dir = config['paths']['benchmarks']
+    report = run_benchmarks(
+        config['classes'], args.only,
+        repeats=args.repeats or bench_config['repeats'],
+        warmup=bench_config['warmup'],
+        progress_callback=lambda name: print(f"Running {name}", file=sys.stderr)
+    )
+
+    baseline = load_baseline(benchmarks_dir)
+    if args.save_baseline:
+        if baseline is not None and args.only:
+            if baseline.get('fixture_version') != report['fixture_version']:
+                raise ValueError("Baseline fixtures differ from this run's; save a full baseline (without --only)")
+            # Partial runs only replace the benchmarks they ran
+            report = {**report, 'benchmarks': {**baseline['benchmarks'], **report['benchmarks']}}
+        return {'report': report, 'baseline': save_report(benchmarks_dir, report, as_baseline=True)}
+
+    result = {'report': report, 'saved': save_report(benchmarks_dir, report)}
+    if baseline is None:
+        result['note'] = "No baseline yet; record one with --save-baseline"
+        return result
+    result.update(compare_to_baseline(
+        report, baseline,
+        max_regression=args.max_regression if args.max_regression is not None else bench_config['max_regression'],
+        thresholds=bench_config.get('thresholds'),
+        min_delta_ms=bench_config['min_delta_ms']
+    ))
+    return result
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='python -m modules', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--config', default='config/config.yaml', help="Path to config.yaml")
+    parser.add_argument('--json-output', help="Also write the JSON summary to this file")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    prepare = subparsers.add_parser('prepare', help=cmd_prepare.__doc__)
+    prepare.add_argument('--train-ratio', type=float)
+    prepare.add_argument('--val-ratio', type=float)
+    prepare.add_argument('--seed', type=int)
+    prepare.add_argument('--no-group-duplicates', dest='group_duplicates', action='store_false',
+                         help="Do not keep near-duplicate films in the same split")
+    prepare.set_defaults(func=cmd_prepare)
+
+    validate = subparsers.add_parser('validate', help=cmd_validate.__doc__)
+    validate.set_defaults(func=cmd_validate)
+
+    train = subparsers.add_parser('train', help=cmd_train.__doc__)
+    train.add_argument('--model', help="Base model, e.g. yolo11s-seg.pt")
+    train.add_argument('--epochs', type=int)
+    train.add_argument('--batch', type=int)
+    train.add_argument('--imgsz', type=int)
+    train.add_argument('--lr', type=float)
+    train.add_argument('--patience', type=int)
+    train.add_argument('--optimizer', default='auto')
+    train.add_argument('--device', default='cpu')
+    train.add_argument('--workers', type=int)
+    train.add_argument('--name', help="Run name (default: training_<timestamp>)")
+    train.add_argument('--no-profile', action='store_true', help="Skip latency/mAP profiling on publish")
+    train.set_defaults(func=cmd_train)
+
+    predict = subparsers.add_parser('predict', help=cmd_predict.__doc__)
+    predict.add_argument('source', nargs='+', help="Image files or directories")
+    predict.add_argument('--model', help="Model path or registered file (default: best registered)")
+    predict.add_argument('--output', help="NDJSON file for per-image records")
+    predict.add_argument('--conf', type=float)
+    predict.add_argument('--iou', type=float)
+    predict.add_argument('--imgsz', type=int)
+    predict.add_argument('--batch', type=int, default=8)
+    predict.add_argument('--class-thresholds', action='store_true',
+                         help="Use the model's calibrated per-class thresholds")
+    predict.add_argument('--mask-format', choices=['rle', 'polygon'], default='rle')
+    predict.set_defaults(func=cmd_predict)
+
+    evaluate = subparsers.add_parser('evaluate', help=cmd_evaluate.__doc__)
+    evaluate.add_argument('--model', help="Model path or registered file (default: best registered)")
+    evaluate.add_argument('--split', choices=['train', 'val', 'test'])
+    evaluate.add_argument('--imgsz', type=int)
+    evaluate.add_argument('--score-threshold', type=float)
+    evaluate.add_argument('--class-thresholds', action='store_true',
+                          help="Score with the model's calibrated per-class thresholds")
+    evaluate.add_argument('--pr-curves', action='store_true', help="Include PR curves in the output")
+    evaluate.set_defaults(func=cmd_evaluate)
+
+    export = subparsers.add_parser('export', help=cmd_export.__doc__)
+    export.add_argument('--model', help="Model path or registered file (default: best registered)")
+    export.add_argument('--format', default='onnx', help="onnx, int8 or any ultralytics export format")
+    export.add_argument('--imgsz', type=int)
+    export.set_defaults(func=cmd_export)
+
+    benchmark = subparsers.add_parser('benchmark', help=cmd_benchmark.__doc__)
+    benchmark.add_argument('--model', help="Model path or registered file (default: best registered)")
+    benchmark.add_argument('--imgsz', type=int)
+    benchmark.add_argument('--runs', type=int)
+    benchmark.add_argument('--warmup', type=int)
+    benchmark.add_argument('--images', help="Directory of images to time (default: synthetic)")
+    benchmark.add_argument('--register', action='store_true',
+                           help="Record latency and validation mAP in the model registry")
+    benchmark.set_defaults(func=cmd_benchmark)
+
+    synth = subparsers.add_parser('synth', help=cmd_synth.__doc__)
+    synth.add_argument('--count', type=int)
+    synth.add_argument('--size', type=int, nargs=2, metavar=('WIDTH', 'HEIGHT'))
+    synth.add_argument('--points', type=int, help="Points per polygon")
+    synth.add_argument('--findings-rate', type=float, help="Probability of each finding per tooth")
+    synth.add_argument('--seed', type=int, default=0)
+    synth.add_argument('--workers', type=int, help="Worker processes (default: CPU count)")
+    synth.add_argument('--output', help="Output directory with images/ and labels/ (default: paths.synthetic)")
+    synth.add_argument('--overwrite', action='store_true', help="Regenerate films that already exist")
+    synth.set_defaults(func=cmd_synth)
+
+    loadtest = subparsers.add_parser('loadtest', help=cmd_loadtest.__doc__)
+    loadtest.add_argument('--mode', choices=['core', 'pool', 'http', 'app'], default='core',
+                          help="core: threads on the inference path; pool: threads sharing the inference "
+                               "worker pool; http: clients of the HTTP API; app: AppTest sessions of app.py")
+    loadtest.add_argument('--sessions', type=int, nargs='+', help="Concurrent session counts, e.g. 1 2 4 8")
+    loadtest.add_argument('--iterations', type=int, help="Segmentations per session")
+    loadtest.add_argument('--model', help="Model for core, pool and http modes (default: best registered)")
+    loadtest.add_argument('--url', help="HTTP API to test in http mode (default: serve one in-process)")
+    loadtest.add_argument('--size', type=int, nargs=2, metavar=('WIDTH', 'HEIGHT'), help="Synthetic film size")
+    loadtest.set_defaults(func=cmd_loadtest)
+
+    serve = subparsers.add_parser('serve', help=cmd_serve.__doc__)
+    serve.add_argument('--host', help="Bind address (default: api.host)")
+    serve.add_argument('--port', type=int, help="Port (default: api.port)")
+    serve.add_argument('--quiet', action='store_true', help="Don't log each request")
+    serve.set_defaults(func=cmd_serve)
+
+    bench = subparsers.add_parser('bench', help=cmd_bench.__doc__)
+    bench.add_argument('--only', nargs='+',
+                       choices=['label_io', 'split_dataset', 'validate_dataset', 'visualize_results',
+                                'draw_annotations', 'inference_e2e'],
+                       help="Benchmarks to run (default: all)")
+    bench.add_argument('--repeats', type=int)
+    bench.add_argument('--max-regression', type=float, help="Allowed relative slowdown, e.g. 0.2")
+    bench.add_argument('--save-baseline', action='store_true', help="Store this run as the baseline")
+    bench.set_defaults(func=cmd_bench)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    # Keep stdout clean for the JSON summary
+    os.environ.setdefault('YOLO_VERBOSE', 'False')
+
+    try:
+        config = load_config(args.config)
+        with contextlib.redirect_stdout(sys.stderr):
+            result = args.func(args, config)
+        if isinstance(result, dict) and result.get('regressions'):
+            summary = {'command': args.command, 'status': 'regressed', 'result': result}
+            exit_code = 1
+        elif isinstance(result, dict) and result.get('valid') is False:
+            summary = {'command': args.command, 'status': 'invalid', 'result': result}
+            exit_code = 1
+        else:
+            summary = {'command': args.command, 'status': 'completed', 'result': result}
+            exit_code = 0
+    except Exception as e:
+        traceback.print_exc(file=sys.stderr)
+        summary = {'command': args.command, 'status': 'failed', 'error': str(e)}
+        exit_code = 1
+
+    text = json.dumps(summary, indent=2, default=str)
+    print(text)
+    if args.json_output:
+        with open(args.json_output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    return exit_code
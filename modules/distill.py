@@ -0,0 +1,171 @@
+"""
+Knowledge distillation from a trained large segmentation model into a nano/small student
+"""
+from typing import Dict, Optional
+
+import torch
+import torch.nn.functional as F
+from ultralytics import YOLO
+from ultralytics.models.yolo.segment import SegmentationTrainer
+
+from modules.trainer import run_training, DEFAULT_METRIC
+
+
+class SegmentationDistillationLoss:
+    """
+    Segmentation loss plus teacher supervision
+
+    On top of the regular YOLO segmentation loss the student is pulled towards
+    the teacher's class logits and box distributions (logit distillation) and
+    towards the teacher's instance masks at the anchors the teacher is
+    confident about (mask distillation). Both models share strides and the
+    number of mask prototypes, so their anchors and mask coefficients line up.
+    """
+
+    def __init__(self, student, teacher, temperature: float = 2.0, cls_weight: float = 1.0,
+                 dfl_weight: float = 0.5, mask_weight: float = 1.0, mask_conf: float = 0.5,
+                 max_mask_anchors: int = 64):
+        self.base = student.init_criterion()
+        self.teacher = teacher
+        self.nc = student.model[-1].nc
+        self.reg_max = student.model[-1].reg_max
+        self.temperature = temperature
+        self.cls_weight = cls_weight
+        self.dfl_weight = dfl_weight
+        self.mask_weight = mask_weight
+        self.mask_conf = mask_conf
+        self.max_mask_anchors = max_mask_anchors
+
+    def __deepcopy__(self, memo):
+        # EMA and checkpoints deep-copy the model; keep the teacher out of them
+        return None
+
+    def __reduce__(self):
+        return (type(None), ())
+
+    def _split(self, feats):
+        """Flatten per-level head outputs into (box distribution, class logits)"""
+        batch_size = feats[0].shape[0]
+        no = self.nc + self.reg_max * 4
+        flat = torch.cat([xi.view(batch_size, no, -1) for xi in feats], 2)
+        return flat.split((self.reg_max * 4, self.nc), 1)
+
+    def _mask_loss(self, s_coeffs, s_proto, t_coeffs, t_proto, t_conf):
+        """BCE between student and teacher masks at the teacher's confident anchors"""
+        losses = []
+        for b in range(t_conf.shape[0]):
+            k = min(self.max_mask_anchors, t_conf.shape[1])
+            conf, idx = t_conf[b].topk(k)
+            idx = idx[conf > self.mask_conf]
+            if idx.numel() == 0:
+                continue
+            s_logits = torch.einsum('ck,chw->khw', s_coeffs[b][:, idx], s_proto[b])
+            t_masks = torch.einsum('ck,chw->khw', t_coeffs[b][:, idx], t_proto[b]).sigmoid()
+            losses.append(F.binary_cross_entropy_with_logits(s_logits, t_masks))
+        if not losses:
+            return s_coeffs.sum() * 0.0
+        return torch.stack(losses).mean()
+
+    def __call__(self, preds, batch):
+        base_loss, loss_items = self.base(preds, batch)
+        feats, s_coeffs, s_proto = preds if len(preds) == 3 else preds[1]
+
+        img = batch['img']
+        if next(self.teacher.parameters()).device != img.device:
+            self.teacher.to(img.device)
+        with torch.no_grad():
+            t_feats, t_coeffs, t_proto = self.teacher(img)[1]
+
+        s_distri, s_scores = self._split(feats)
+        t_distri, t_scores = self._split(t_feats)
+        T = self.temperature
+
+        # Weight anchors by teacher confidence so background does not dominate
+        t_prob = t_scores.sigmoid()
+        t_conf = t_prob.max(1).values  # (b, anchors)
+        weight = t_conf / t_conf.sum().clamp(min=1.0)
+
+        cls_kd = F.binary_cross_entropy_with_logits(
+            s_scores / T, (t_scores / T).sigmoid(), reduction='none'
+        ).mean(1)
+        cls_kd = (cls_kd * weight).sum() * T * T
+
+        b, _, a = s_distri.shape
+        s_log_dist = F.log_softmax(s_distri.view(b, 4, self.reg_max, a) / T, dim=2)
+        t_dist = F.softmax(t_distri.view(b, 4, self.reg_max, a) / T, dim=2)
+        dfl_kd = F.kl_div(s_log_dist, t_dist, reduction='none').sum(2).mean(1)
+        dfl_kd = (dfl_kd * weight).sum() * T * T
+
+        mask_kd = self._mask_loss(s_coeffs, s_proto, t_coeffs, t_proto, t_conf)
+
+        kd = (self.cls_weight * cls_kd + self.dfl_weight * dfl_kd
+              + self.mask_weight * mask_kd) * img.shape[0]
+        if base_loss.dim() == 0:
+            return base_loss + kd, loss_items
+        return torch.cat([base_loss[:1] + kd, base_loss[1:]]), loss_items
+
+
+def make_distillation_trainer(teacher_path: str, **loss_args):
+    """
+    Create a segmentation trainer class that distills from teacher_path
+
+    Args:
+        teacher_path: Path to trained teacher weights
+        **loss_args: Arguments for SegmentationDistillationLoss
+
+    Returns:
+        Trainer class for YOLO.train(trainer=...)
+    """
+
+    class DistillationTrainer(SegmentationTrainer):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.add_callback('on_pretrain_routine_end', self._attach_teacher)
+
+        def _attach_teacher(self, trainer):
+            student = self.model.module if hasattr(self.model, 'module') else self.model
+            teacher = YOLO(teacher_path).model.float().to(self.device).eval()
+            for param in teacher.parameters():
+                param.requires_grad = False
+
+            if list(teacher.names.values()) != list(student.names.values()):
+                raise ValueError("Teacher and student must be trained on the same classes")
+            student.criterion = SegmentationDistillationLoss(student, teacher, **loss_args)
+
+    return DistillationTrainer
+
+
+def run_distillation(teacher_path: str, student_model: str, data_yaml: str,
+                     project_dir: str, run_name: str, loss_args: Optional[Dict] = None,
+                     metric: str = DEFAULT_METRIC, **train_args) -> Dict:
+    """
+    Train a student model supervised by a trained teacher
+
+    Args:
+        teacher_path: Path to trained teacher weights (e.g. from models/trained)
+        student_model: Student weights/name (e.g. yolo11n-seg.pt)
+        data_yaml: Path to dataset data.yaml
+        project_dir: Directory that holds training runs
+        run_name: Name of this run inside project_dir
+        loss_args: Arguments for SegmentationDistillationLoss
+        metric: Validation metric to report as 'score'
+        **train_args: Extra arguments passed to YOLO.train
+
+    Returns:
+        Same as run_training
+    """
+    loss_args = loss_args or {}
+    return run_training(
+        YOLO(student_model),
+        data_yaml,
+        project_dir,
+        run_name,
+        metric=metric,
+        record={
+            'base_model': student_model,
+            'teacher': teacher_path,
+            'distillation': loss_args
+        },
+        trainer=make_distillation_trainer(teacher_path, **loss_args),
+        **train_args
+    )
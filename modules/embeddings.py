@@ -0,0 +1,355 @@
+"""
+Similar-case retrieval over raw films using pooled backbone embeddings
+"""
+import os
+import json
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from modules.evaluation import model_cache_key
+
+META_FILE = 'index.json'
+VECTORS_FILE = 'vectors.f16'  # Indexes written before vectors files were versioned
+IVF_FILE = 'ivf.npz'
+# How long superseded vectors files are kept for readers still mapping them
+RETIRED_GRACE_S = 600
+# Last layer of the YOLO11 backbone (C2PSA); features are global-average pooled
+DEFAULT_LAYER = 10
+
+
+def embed_images(model, images: Sequence, layer: int = DEFAULT_LAYER,
+                 imgsz: Optional[int] = None) -> np.ndarray:
+    """
+    Pooled, L2-normalized backbone features of a batch of images
+
+    Args:
+        model: Loaded YOLO model
+        images: Image paths or arrays accepted by YOLO.predict
+        layer: Model layer whose output is pooled
+        imgsz: Inference size (model default if None)
+
+    Returns:
+        (N, D) float32 unit vectors
+    """
+    predict_args = {'embed': [layer], 'verbose': False}
+    if imgsz:
+        predict_args['imgsz'] = imgsz
+    # Model.predict merges its arguments into the predictor's, so embed would
+    # stick and later predicts on the same model would return features
+    predictor = getattr(model, 'predictor', None)
+    saved_args = dict(vars(predictor.args)) if predictor is not None else None
+    try:
+        features = model.predict(list(images), **predict_args)
+    finally:
+        if saved_args is not None:
+            vars(model.predictor.args).update(saved_args)
+        elif getattr(model, 'predictor', None) is not None:
+            model.predictor.args.embed = None
+    vectors = np.stack([f.detach().cpu().float().numpy().ravel() for f in features])
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def index_model_key(model_path: str, layer: int = DEFAULT_LAYER) -> str:
+    """Key identifying the model file version and layer an index was built with"""
+    return f"{model_cache_key(model_path)}_l{layer}"
+
+
+def _kmeans(vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means centroids (vectors are unit length)"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(k):
+            members = vectors[assignment == c]
+            if len(members):
+                centroid = members.sum(axis=0)
+                centroids[c] = centroid / max(np.linalg.norm(centroid), 1e-12)
+    return centroids
+
+
+class EmbeddingIndex:
+    """
+    Incremental embedding index stored as a memory-mapped float16 matrix
+
+    Rows are appended as films arrive; rows of deleted or changed films are
+    tombstoned and the matrix is compacted once tombstones pile up. Queries
+    are a brute-force dot product over the matrix, or, when an IVF partition
+    is built, over the closest lists plus rows added since the partition.
+
+    Readers map the matrix while a refresh may be writing it, so the writer
+    never moves rows a saved meta refers to: growing and compacting copy the
+    rows into a new vectors file, which the atomically replaced meta then
+    names. Superseded files are listed in the meta and deleted by a later
+    save once RETIRED_GRACE_S has passed, so readers that still map them keep
+    a consistent view until they reload (see index_version).
+    """
+
+    def __init__(self, index_dir: str, read_only: bool = False):
+        self.index_dir = index_dir
+        self.read_only = read_only
+        # Vectors files created since the last save; no reader can know them yet
+        self._unsaved = set()
+        self.meta = {'model_key': None, 'dim': 0, 'count': 0, 'capacity': 0, 'rows': [], 'files': {}}
+        meta_path = os.path.join(index_dir, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                self.meta = json.load(f)
+        self.vectors = None
+        if self.meta['capacity']:
+            self.vectors = np.memmap(self._vectors_path(), dtype=np.float16, mode='r' if read_only else 'r+',
+                                     shape=(self.meta['capacity'], self.meta['dim']))
+        self._update_live()
+        self.ivf = None
+        ivf_path = os.path.join(index_dir, IVF_FILE)
+        if os.path.exists(ivf_path):
+            data = np.load(ivf_path)
+            self.ivf = {'centroids': data['centroids'], 'assignment': data['assignment'],
+                        'n_rows': int(data['n_rows'])}
+
+    def _update_live(self):
+        self.live = np.array([name is not None for name in self.meta['rows']], dtype=bool)
+
+    def __len__(self) -> int:
+        return len(self.meta['files'])
+
+    def _vectors_path(self) -> str:
+        return os.path.join(self.index_dir, self.meta.get('vectors_file', VECTORS_FILE))
+
+    def _save_meta(self):
+        now = time.time()
+        retired = self.meta.get('retired', [])
+        expired = [entry for entry in retired if now - entry['retired'] >= RETIRED_GRACE_S]
+        self.meta['retired'] = [entry for entry in retired if entry not in expired]
+        os.makedirs(self.index_dir, exist_ok=True)
+        self.meta['updated'] = datetime.now().isoformat(timespec='seconds')
+        meta_path = os.path.join(self.index_dir, META_FILE)
+        tmp_path = meta_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, meta_path)
+        self._unsaved.clear()
+        # Readers of an older meta have had the grace period to reload
+        for entry in expired:
+            try:
+                os.remove(os.path.join(self.index_dir, entry['file']))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                self.meta['retired'].append(entry)  # still mapped somewhere; retried on the next save
+
+    def _retire_vectors_file(self, name: str):
+        """Stop using a vectors file; it is deleted once no reader can still map it"""
+        if name in self._unsaved:
+            self._unsaved.discard(name)
+            os.remove(os.path.join(self.index_dir, name))
+        else:
+            self.meta.setdefault('retired', []).append({'file': name, 'retired': time.time()})
+
+    def _reset(self, model_key: str, dim: int):
+        current = self.meta.get('vectors_file', VECTORS_FILE) if self.meta['capacity'] else None
+        self.meta = {'model_key': model_key, 'dim': dim, 'count': 0, 'capacity': 0, 'rows': [], 'files': {},
+                     'retired': self.meta.get('retired', [])}
+        self.vectors = None
+        if current is not None:
+            self._retire_vectors_file(current)
+        self._drop_ivf()
+
+    def _drop_ivf(self):
+        self.ivf = None
+        ivf_path = os.path.join(self.index_dir, IVF_FILE)
+        if os.path.exists(ivf_path):
+            os.remove(ivf_path)
+
+    def _rewrite_vectors(self, capacity: int, rows: np.ndarray, chunk_size: int = 65536):
+        """Copy the given rows into a new vectors file, current from the next _save_meta"""
+        os.makedirs(self.index_dir, exist_ok=True)
+        name = f"vectors_{uuid.uuid4().hex[:12]}.f16"
+        vectors = np.memmap(os.path.join(self.index_dir, name), dtype=np.float16, mode='w+',
+                            shape=(capacity, self.meta['dim']))
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            vectors[start:start + len(chunk)] = self.vectors[chunk]
+        current = self.meta.get('vectors_file', VECTORS_FILE) if self.meta['capacity'] else None
+        self.vectors = vectors
+        self.meta['vectors_file'] = name
+        self.meta['capacity'] = capacity
+        self._unsaved.add(name)
+        if current is not None:
+            self._retire_vectors_file(current)
+
+    def _ensure_capacity(self, needed: int):
+        """Grow the matrix (geometrically) to hold at least `needed` rows"""
+        if needed <= self.meta['capacity']:
+            return
+        self._rewrite_vectors(max(needed, 2 * self.meta['capacity'], 1024), np.arange(self.meta['count']))
+
+    def _append(self, names: List[str], vectors: np.ndarray, stats: Dict[str, List]):
+        start = self.meta['count']
+        self._ensure_capacity(start + len(names))
+        self.vectors[start:start + len(names)] = vectors.astype(np.float16)
+        for offset, name in enumerate(names):
+            self.meta['rows'].append(name)
+            self.meta['files'][name] = {'row': start + offset, 'size': stats[name][0], 'mtime': stats[name][1]}
+        self.meta['count'] = start + len(names)
+
+    def _compact(self):
+        """Drop tombstoned rows"""
+        live = [(row, name) for row, name in enumerate(self.meta['rows']) if name is not None]
+        self._rewrite_vectors(self.meta['capacity'], np.array([row for row, _ in live], dtype=np.int64))
+        self.meta['rows'] = [name for _, name in live]
+        for row, name in enumerate(self.meta['rows']):
+            self.meta['files'][name]['row'] = row
+        self.meta['count'] = len(live)
+        self._drop_ivf()
+
+    def _scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None,
+                chunk_size: int = 65536) -> np.ndarray:
+        """Dot products of the query with all rows (or the given rows), in float32 chunks"""
+        n = self.meta['count'] if rows is None else len(rows)
+        scores = np.empty(n, dtype=np.float32)
+        for start in range(0, n, chunk_size):
+            end = min(start + chunk_size, n)
+            block = self.vectors[start:end] if rows is None else self.vectors[rows[start:end]]
+            scores[start:end] = np.asarray(block, dtype=np.float32) @ query
+        return scores
+
+    def refresh(self, model, model_path: str, images_dir: str, formats: Sequence[str],
+                layer: int = DEFAULT_LAYER, imgsz: Optional[int] = None, batch_size: int = 16,
+                ivf_min_rows: int = 20000, progress_callback=None) -> Dict:
+        """
+        Embed new or changed films, tombstone deleted ones
+
+        A different model (or model file version) rebuilds the index from
+        scratch. Once the index holds ivf_min_rows rows, an IVF partition is
+        built and rebuilt whenever the index has grown by 20%.
+
+        Returns:
+            Counts of embedded, removed and indexed films
+        """
+        if self.read_only:
+            raise RuntimeError("Embedding index was opened read-only")
+        extensions = tuple(f".{ext.lower()}" for ext in formats)
+        current = {}
+        if os.path.exists(images_dir):
+            for name in os.listdir(images_dir):
+                if name.lower().endswith(extensions):
+                    stat = os.stat(os.path.join(images_dir, name))
+                    current[name] = [stat.st_size, stat.st_mtime]
+
+        model_key = index_model_key(model_path, layer)
+        if self.meta['model_key'] != model_key:
+            self._reset(model_key, 0)
+
+        files = self.meta['files']
+        stale = [name for name, entry in files.items()
+                 if name not in current or [entry['size'], entry['mtime']] != current[name]]
+        for name in stale:
+            self.meta['rows'][files.pop(name)['row']] = None
+        changed = [name for name in sorted(current) if name not in files]
+
+        for start in range(0, len(changed), batch_size):
+            batch = changed[start:start + batch_size]
+            vectors = embed_images(model, [os.path.join(images_dir, name) for name in batch], layer, imgsz)
+            if self.meta['dim'] == 0:
+                self.meta['dim'] = vectors.shape[1]
+            self._append(batch, vectors, current)
+            if progress_callback is not None:
+                progress_callback(min(start + batch_size, len(changed)), len(changed))
+
+        if self.meta['count'] and len(files) < 0.75 * self.meta['count']:
+            self._compact()
+        if self.vectors is not None:
+            self.vectors.flush()
+        self._update_live()
+        self._save_meta()
+        if self.meta['count'] >= ivf_min_rows and (
+                self.ivf is None or self.meta['count'] > 1.2 * self.ivf['n_rows']):
+            self.build_ivf()
+        return {'embedded': len(changed), 'removed': len(stale), 'indexed': len(files)}
+
+    def build_ivf(self, n_lists: Optional[int] = None, sample_size: int = 20000):
+        """Partition the rows into n_lists clusters (default: sqrt of the row count)"""
+        count = self.meta['count']
+        n_lists = n_lists or max(1, int(np.sqrt(count)))
+        rng = np.random.default_rng(0)
+        sample_rows = np.sort(rng.choice(count, min(sample_size, count), replace=False))
+        centroids = _kmeans(np.asarray(self.vectors[sample_rows], dtype=np.float32), min(n_lists, len(sample_rows)))
+        assignment = np.empty(count, dtype=np.int32)
+        for start in range(0, count, 65536):
+            chunk = np.asarray(self.vectors[start:start + 65536], dtype=np.float32)
+            assignment[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+        self.ivf = {'centroids': centroids, 'assignment': assignment, 'n_rows': count}
+        ivf_path = os.path.join(self.index_dir, IVF_FILE)
+        with open(ivf_path + '.tmp', 'wb') as f:
+            np.savez(f, centroids=centroids, assignment=assignment, n_rows=count)
+        os.replace(ivf_path + '.tmp', ivf_path)
+
+    def search(self, query: np.ndarray, k: int = 5, n_probe: int = 8,
+               exclude: Optional[str] = None) -> List[Dict]:
+        """
+        Most similar films to a query embedding (cosine similarity)
+
+        Args:
+            query: (D,) unit vector from embed_images
+            k: Number of results
+            n_probe: IVF lists to scan when an IVF partition exists
+            exclude: Film name to leave out
+
+        Returns:
+            Results with 'image' and 'similarity', most similar first
+        """
+        count = self.meta['count']
+        if count == 0:
+            return []
+        query = np.asarray(query, dtype=np.float32).ravel()
+
+        if self.ivf is not None:
+            probes = np.argsort(-(self.ivf['centroids'] @ query))[:n_probe]
+            rows = np.flatnonzero(np.isin(self.ivf['assignment'], probes))
+            # Rows appended after the partition was built are always scanned
+            rows = np.concatenate([rows, np.arange(self.ivf['n_rows'], count)])
+            scores = self._scores(query, rows)
+        else:
+            rows = np.arange(count)
+            scores = self._scores(query)
+
+        valid = self.live[rows]
+        rows, scores = rows[valid], scores[valid]
+        # One extra candidate in case the excluded film is among the best
+        n_top = min(k + 1, len(scores))
+        top = np.argpartition(-scores, n_top - 1)[:n_top] if n_top < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        names = self.meta['rows']
+        results = [{'image': names[rows[i]], 'similarity': float(scores[i])}
+                   for i in top if names[rows[i]] != exclude]
+        return results[:k]
+
+
+def index_version(index_dir: str) -> str:
+    """Token that changes whenever the index on disk changes (cache key for readers)"""
+    parts = []
+    for name in (META_FILE, IVF_FILE):
+        path = os.path.join(index_dir, name)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            parts.append(f"{name}:{stat.st_mtime_ns}:{stat.st_size}")
+    return '|'.join(parts)
+
+
+def refresh_embedding_index(job, model_path: str, index_dir: str, images_dir: str,
+                            formats: Sequence[str], layer: int = DEFAULT_LAYER,
+                            imgsz: Optional[int] = None, batch_size: int = 16,
+                            ivf_min_rows: int = 20000) -> Dict:
+    """Background job: bring the embedding index up to date with the film directory"""
+    from ultralytics import YOLO
+
+    model = YOLO(model_path, task='segment')
+    return EmbeddingIndex(index_dir).refresh(
+        model, model_path, images_dir, formats, layer, imgsz, batch_size, ivf_min_rows,
+        progress_callback=lambda done, total: job.update(done / total, f"Embedded {done}/{total} films")
+    )
@@ -0,0 +1,435 @@
+"""
+Segmentation evaluation engine with cached predictions
+
+Predictions are run once per model, split and predict settings and cached
+as RLE masks; IoU
+matrices against the ground truth are cached next to them. Because matching
+is greedy in score order, the matches computed once at the lowest confidence
+also hold for any higher score threshold, so re-scoring is a truncation.
+"""
+import os
+import json
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from modules.masks import rle_encode, rle_decode_many, polygons_to_masks, mask_iou_matrix
+
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def model_cache_key(model_path: str) -> str:
+    """Cache key that changes whenever the model file changes"""
+    stat = os.stat(model_path)
+    digest = hashlib.sha1(f"{stat.st_size}:{stat.st_mtime_ns}".encode('utf-8')).hexdigest()[:10]
+    return f"{os.path.basename(model_path).replace('.', '_')}_{digest}"
+
+
+def eval_shape(height: int, width: int, max_side: int) -> Tuple[int, int]:
+    """Resolution at which masks are compared (longest side capped at max_side)"""
+    scale = min(1.0, max_side / max(height, width))
+    return max(1, int(round(height * scale))), max(1, int(round(width * scale)))
+
+
+def _label_hash(label_path: str) -> str:
+    if not os.path.exists(label_path):
+        return ''
+    with open(label_path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def load_ground_truth(label_path: str, shape: Tuple[int, int]) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """
+    Load YOLO polygon labels scaled to a pixel grid
+
+    Args:
+        label_path: Path to the label file
+        shape: (height, width) of the pixel grid
+
+    Returns:
+        Class ids and polygons as (K, 2) pixel arrays
+    """
+    classes = []
+    polygons = []
+    if os.path.exists(label_path):
+        with open(label_path, 'r') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 7:
+                    continue
+                classes.append(int(parts[0]))
+                coords = np.array(parts[1:], dtype=np.float32).reshape(-1, 2)
+                polygons.append(coords * np.array([shape[1], shape[0]], dtype=np.float32))
+    return np.array(classes, dtype=np.int64), polygons
+
+
+def predict_params_key(**params) -> str:
+    """Short digest of the predict settings that shape the cached predictions"""
+    encoded = json.dumps(params, sort_keys=True).encode('utf-8')
+    return hashlib.sha1(encoded).hexdigest()[:10]
+
+
+def _write_json(path: str, data: Dict):
+    """Write JSON atomically so a crash never leaves a truncated cache file"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+class PredictionCache:
+    """
+    Per-model, per-split cache of predictions (one JSON file per image)
+
+    Predictions made with different settings (conf, iou, imgsz, max_det,
+    max_side) are kept in separate directories, so changing a setting
+    predicts again instead of reusing predictions made under the old one.
+    """
+
+    def __init__(self, cache_root: str, model_path: str, split: str, predict_params: Optional[Dict] = None):
+        self.cache_dir = os.path.join(cache_root, model_cache_key(model_path),
+                                      f"{split}_{predict_params_key(**(predict_params or {}))}")
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def path(self, image_name: str) -> str:
+        return os.path.join(self.cache_dir, os.path.splitext(image_name)[0] + '.json')
+
+    def has(self, image_name: str) -> bool:
+        return os.path.exists(self.path(image_name))
+
+    def load(self, image_name: str) -> Dict:
+        with open(self.path(image_name), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save(self, image_name: str, entry: Dict):
+        _write_json(self.path(image_name), entry)
+
+
+def result_to_entry(result, image_name: str, max_side: int) -> Dict:
+    """Convert an ultralytics result into a cache entry with RLE masks at eval resolution"""
+    h, w = result.orig_shape
+    shape = eval_shape(h, w, max_side)
+    entry = {
+        'image': image_name,
+        'orig_shape': [int(h), int(w)],
+        'eval_shape': list(shape),
+        'classes': [],
+        'scores': [],
+        'rles': []
+    }
+    if result.masks is None or len(result.masks) == 0:
+        return entry
+
+    scale = np.array([shape[1] / w, shape[0] / h], dtype=np.float32)
+    masks = polygons_to_masks([xy * scale for xy in result.masks.xy], shape)
+    entry['classes'] = result.boxes.cls.cpu().numpy().astype(int).tolist()
+    entry['scores'] = result.boxes.conf.cpu().numpy().round(5).tolist()
+    entry['rles'] = [rle_encode(mask) for mask in masks]
+    return entry
+
+
+def predict_to_cache(model_path: str, image_paths: List[str], cache: PredictionCache,
+                     conf: float = 0.001, iou: float = 0.7, imgsz: Optional[int] = None,
+                     max_det: int = 300, batch_size: int = 16, max_side: int = 640,
+                     progress_callback: Optional[Callable[[int, int], None]] = None) -> int:
+    """
+    Run predictions for images not yet in the cache
+
+    Args:
+        model_path: Path to model weights
+        image_paths: Images to predict
+        cache: Prediction cache for this model and split
+        conf: Confidence threshold (keep low; higher thresholds are applied at scoring)
+        iou: NMS IoU threshold
+        imgsz: Inference size (default: the model's training size)
+        max_det: Maximum detections per image
+        batch_size: Images per predict call
+        max_side: Longest side of the evaluation resolution
+        progress_callback: Called as (n_done, n_todo)
+
+    Returns:
+        Number of newly predicted images
+    """
+    todo = [p for p in image_paths if not cache.has(os.path.basename(p))]
+    if not todo:
+        return 0
+
+    from ultralytics import YOLO
+
+    model = YOLO(model_path, task='segment')
+    imgsz = imgsz or model.overrides.get('imgsz') or 640
+    for start in range(0, len(todo), batch_size):
+        chunk = todo[start:start + batch_size]
+        results = model.predict(chunk, conf=conf, iou=iou, imgsz=imgsz,
+                                max_det=max_det, verbose=False)
+        for image_path, result in zip(chunk, results):
+            image_name = os.path.basename(image_path)
+            cache.save(image_name, result_to_entry(result, image_name, max_side))
+        if progress_callback is not None:
+            progress_callback(min(start + batch_size, len(todo)), len(todo))
+    return len(todo)
+
+
+def _score_image(args: Tuple[str, str]) -> Dict:
+    """Compute (and cache) the pred x GT mask IoU matrix for one image"""
+    cache_file, label_path = args
+    with open(cache_file, 'r', encoding='utf-8') as f:
+        entry = json.load(f)
+
+    label_hash = _label_hash(label_path)
+    if entry.get('label_hash') != label_hash or 'iou' not in entry:
+        shape = tuple(entry['eval_shape'])
+        gt_classes, gt_polygons = load_ground_truth(label_path, shape)
+        gt_masks = polygons_to_masks(gt_polygons, shape)
+        pred_masks = rle_decode_many(entry['rles'], shape)
+        entry['iou'] = mask_iou_matrix(pred_masks, gt_masks).round(4).tolist()
+        entry['gt_classes'] = gt_classes.tolist()
+        entry['label_hash'] = label_hash
+        _write_json(cache_file, entry)
+
+    return {
+        'image': entry['image'],
+        'classes': np.array(entry['classes'], dtype=np.int64),
+        'scores': np.array(entry['scores'], dtype=np.float32),
+        'gt_classes': np.array(entry['gt_classes'], dtype=np.int64),
+        'iou': np.array(entry['iou'], dtype=np.float32).reshape(len(entry['classes']),
+                                                               len(entry['gt_classes']))
+    }
+
+
+def score_cached(cache: PredictionCache, image_paths: List[str], labels_dir: str,
+                 workers: Optional[int] = None) -> List[Dict]:
+    """
+    Load cached predictions with their IoU matrices, computing missing ones in parallel
+
+    Args:
+        cache: Prediction cache for this model and split
+        image_paths: Images to score (must be in the cache)
+        labels_dir: Directory with YOLO label files
+        workers: Worker processes (default: CPU count)
+
+    Returns:
+        List of per-image dictionaries (classes, scores, gt_classes, iou)
+    """
+    jobs = []
+    for image_path in image_paths:
+        image_name = os.path.basename(image_path)
+        label_path = os.path.join(labels_dir, os.path.splitext(image_name)[0] + '.txt')
+        jobs.append((cache.path(image_name), label_path))
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(jobs) < 2 * workers:
+        return [_score_image(job) for job in jobs]
+    # Spawn: this runs in a job thread of the Streamlit server, where forking can deadlock
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return list(pool.map(_score_image, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+
+
+def _match_class(scores: np.ndarray, iou: np.ndarray, thresholds: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Greedy score-ordered matching of one class in one image, at all IoU thresholds at once
+
+    Args:
+        scores: (P,) prediction scores
+        iou: (P, G) IoU between predictions and ground truths
+        thresholds: (T,) IoU thresholds
+
+    Returns:
+        (T, P) true-positive flags and (P,) IoU of each prediction's match at the first threshold
+    """
+    order = np.argsort(-scores, kind='stable')
+    iou = iou[order]
+    n_pred, n_gt = iou.shape
+    n_thr = len(thresholds)
+    tp = np.zeros((n_thr, n_pred), dtype=bool)
+    matched_iou = np.zeros(n_pred, dtype=np.float32)
+    if n_gt == 0:
+        return tp, matched_iou
+
+    taken = np.zeros((n_thr, n_gt), dtype=bool)
+    rows = np.arange(n_thr)
+    for k in range(n_pred):
+        candidates = (iou[k][None, :] >= thresholds[:, None]) & ~taken
+        masked = np.where(candidates, iou[k][None, :], -1.0)
+        best = masked.argmax(1)
+        ok = candidates.any(1)
+        tp[ok, k] = True
+        taken[rows[ok], best[ok]] = True
+        if ok[0]:
+            matched_iou[k] = iou[k, best[0]]
+    return tp, matched_iou
+
+
+def match_predictions(scored: List[Dict], n_classes: int,
+                      thresholds: np.ndarray = IOU_THRESHOLDS) -> Dict[int, Dict]:
+    """
+    Match predictions to ground truth for every class across all images
+
+    Args:
+        scored: Output of score_cached
+        n_classes: Number of classes
+        thresholds: IoU thresholds
+
+    Returns:
+        Per class: scores (sorted descending), tp (T, P), matched IoU (P,) and n_gt
+    """
+    per_class = {c: {'scores': [], 'tp': [], 'matched_iou': [], 'n_gt': 0} for c in range(n_classes)}
+    for image in scored:
+        for c in range(n_classes):
+            pred_idx = np.flatnonzero(image['classes'] == c)
+            gt_idx = np.flatnonzero(image['gt_classes'] == c)
+            per_class[c]['n_gt'] += len(gt_idx)
+            if len(pred_idx) == 0:
+                continue
+            scores = image['scores'][pred_idx]
+            tp, matched_iou = _match_class(scores, image['iou'][np.ix_(pred_idx, gt_idx)], thresholds)
+            per_class[c]['scores'].append(np.sort(scores)[::-1])
+            per_class[c]['tp'].append(tp)
+            per_class[c]['matched_iou'].append(matched_iou)
+
+    matches = {}
+    for c, data in per_class.items():
+        if data['scores']:
+            scores = np.concatenate(data['scores'])
+            tp = np.concatenate(data['tp'], axis=1)
+            matched_iou = np.concatenate(data['matched_iou'])
+            order = np.argsort(-scores, kind='stable')
+            scores, tp, matched_iou = scores[order], tp[:, order], matched_iou[order]
+        else:
+            scores = np.zeros(0, dtype=np.float32)
+            tp = np.zeros((len(thresholds), 0), dtype=bool)
+            matched_iou = np.zeros(0, dtype=np.float32)
+        matches[c] = {'scores': scores, 'tp': tp, 'matched_iou': matched_iou, 'n_gt': data['n_gt']}
+    return matches
+
+
+def _average_precision(precision: np.ndarray, recall: np.ndarray) -> np.ndarray:
+    """COCO-style 101-point interpolated AP for each row of (T, P) precision/recall"""
+    n_thr, n_pred = precision.shape
+    if n_pred == 0:
+        return np.zeros(n_thr)
+    envelope = np.maximum.accumulate(precision[:, ::-1], axis=1)[:, ::-1]
+    recall_points = np.linspace(0, 1, 101)
+    ap = np.zeros(n_thr)
+    for t in range(n_thr):
+        idx = np.searchsorted(recall[t], recall_points, side='left')
+        valid = idx < n_pred
+        ap[t] = envelope[t, idx[valid]].sum() / len(recall_points)
+    return ap
+
+
+def compute_metrics(matches: Dict[int, Dict], class_names: List[str],
+                    score_threshold=0.0, pr_points: int = 200) -> Dict:
+    """
+    Per-class mask AP, precision/recall/F1, matched IoU and PR curves
+
+    Args:
+        matches: Output of match_predictions
+        class_names: Class names by id
+        score_threshold: Global threshold, or a per-class list/dict of thresholds
+        pr_points: Maximum number of points kept per PR curve
+
+    Returns:
+        Dictionary with per-class metrics and their means over classes with ground truth
+    """
+    per_class = {}
+    for c, data in matches.items():
+        threshold = score_threshold[c] if isinstance(score_threshold, (list, tuple, dict)) else score_threshold
+        keep = int(np.searchsorted(-data['scores'], -threshold, side='right'))
+        tp = data['tp'][:, :keep]
+        n_gt = data['n_gt']
+
+        tp_cum = np.cumsum(tp, axis=1)
+        fp_cum = np.arange(1, keep + 1)[None, :] - tp_cum
+        recall = tp_cum / max(n_gt, 1)
+        precision = tp_cum / np.maximum(tp_cum + fp_cum, 1)
+        ap = _average_precision(precision, recall)
+
+        n_tp = int(tp_cum[0, -1]) if keep else 0
+        p = n_tp / keep if keep else 0.0
+        r = n_tp / n_gt if n_gt else 0.0
+        step = max(1, keep // pr_points)
+        name = class_names[c] if c < len(class_names) else f"class_{c}"
+        matched = data['matched_iou'][:keep][tp[0]] if keep else np.zeros(0)
+        per_class[name] = {
+            'class_id': c,
+            'n_gt': n_gt,
+            'n_pred': keep,
+            'ap50': float(ap[0]),
+            'ap50_95': float(ap.mean()),
+            'precision': p,
+            'recall': r,
+            'f1': 2 * p * r / (p + r) if p + r else 0.0,
+            'mean_iou': float(matched.mean()) if len(matched) else 0.0,
+            'pr_curve': {
+                'recall': recall[0, ::step].round(4).tolist(),
+                'precision': precision[0, ::step].round(4).tolist()
+            }
+        }
+
+    with_gt = [m for m in per_class.values() if m['n_gt'] > 0]
+    return {
+        'per_class': per_class,
+        'map50': float(np.mean([m['ap50'] for m in with_gt])) if with_gt else 0.0,
+        'map50_95': float(np.mean([m['ap50_95'] for m in with_gt])) if with_gt else 0.0,
+        'mean_iou': float(np.mean([m['mean_iou'] for m in with_gt])) if with_gt else 0.0
+    }
+
+
+def list_split_images(dataset_dir: str, split: str) -> List[str]:
+    """Image paths of a dataset split"""
+    images_dir = os.path.join(dataset_dir, 'images', split)
+    if not os.path.exists(images_dir):
+        return []
+    return [os.path.join(images_dir, f) for f in sorted(os.listdir(images_dir))
+            if f.lower().endswith(IMAGE_EXTENSIONS)]
+
+
+def evaluate_model(model_path: str, dataset_dir: str, cache_root: str, n_classes: int,
+                   split: str = 'test', conf: float = 0.001, iou: float = 0.7,
+                   imgsz: Optional[int] = None, max_det: int = 300, batch_size: int = 16,
+                   max_side: int = 640, workers: Optional[int] = None,
+                   progress_callback: Optional[Callable[[int, int], None]] = None) -> Dict:
+    """
+    Predict (cached), score and match a model on a dataset split
+
+    Args:
+        model_path: Path to model weights
+        dataset_dir: Prepared dataset directory
+        cache_root: Root directory of the prediction cache
+        n_classes: Number of classes
+        split: Dataset split
+        conf: Prediction confidence floor
+        iou: NMS IoU threshold
+        imgsz: Inference size (default: the model's training size)
+        max_det: Maximum detections per image
+        batch_size: Images per predict call
+        max_side: Longest side of the evaluation resolution
+        workers: Scoring worker processes (default: CPU count)
+        progress_callback: Called as (n_done, n_todo) while predicting
+
+    Returns:
+        Dictionary with the number of images, newly predicted images and matches
+        (pass matches to compute_metrics for any score threshold)
+    """
+    image_paths = list_split_images(dataset_dir, split)
+    if not image_paths:
+        raise FileNotFoundError(f"No images in split '{split}'")
+
+    cache = PredictionCache(cache_root, model_path, split,
+                            {'conf': conf, 'iou': iou, 'imgsz': imgsz, 'max_det': max_det, 'max_side': max_side})
+    n_new = predict_to_cache(model_path, image_paths, cache, conf=conf, iou=iou, imgsz=imgsz,
+                             max_det=max_det, batch_size=batch_size, max_side=max_side,
+                             progress_callback=progress_callback)
+    scored = score_cached(cache, image_paths, os.path.join(dataset_dir, 'labels', split), workers)
+    return {
+        'model': os.path.basename(model_path),
+        'split': split,
+        'n_images': len(image_paths),
+        'n_predicted': n_new,
+        'matches': match_predictions(scored, n_classes)
+    }
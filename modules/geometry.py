@@ -0,0 +1,175 @@
+"""
+Polygon simplification with a maximum-deviation guarantee
+"""
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from modules.utils import get_image_dimensions, find_image
+
+
+def simplify_polygon(polygon: Sequence[Sequence[float]], tolerance_px: float) -> np.ndarray:
+    """
+    Simplify a closed polygon with Douglas-Peucker
+
+    Every dropped vertex lies within tolerance_px of the simplified outline.
+    Polygons that would collapse below 3 points are returned unchanged.
+
+    Args:
+        polygon: (K, 2) x, y pixel coordinates
+        tolerance_px: Maximum allowed deviation in pixels
+
+    Returns:
+        Simplified (K', 2) float32 array
+    """
+    points = np.asarray(polygon, dtype=np.float32).reshape(-1, 2)
+    if tolerance_px <= 0 or len(points) <= 3:
+        return points
+    simplified = cv2.approxPolyDP(points.reshape(-1, 1, 2), tolerance_px, True).reshape(-1, 2)
+    return simplified if len(simplified) >= 3 else points
+
+
+def max_deviation(original: Sequence[Sequence[float]], simplified: Sequence[Sequence[float]]) -> float:
+    """Largest distance from an original vertex to the simplified closed outline (vectorized)"""
+    points = np.asarray(original, dtype=np.float64).reshape(-1, 2)
+    starts = np.asarray(simplified, dtype=np.float64).reshape(-1, 2)
+    if len(points) == 0 or len(starts) == 0:
+        return 0.0
+    ends = np.roll(starts, -1, axis=0)
+    direction = ends - starts
+    length_sq = np.maximum((direction ** 2).sum(axis=1), 1e-12)
+    # (N, M): projection of every point onto every segment
+    rel = points[:, None, :] - starts[None, :, :]
+    t = np.clip((rel * direction[None]).sum(axis=2) / length_sq[None], 0.0, 1.0)
+    closest = starts[None] + t[..., None] * direction[None]
+    distances = np.sqrt(((points[:, None, :] - closest) ** 2).sum(axis=2))
+    return float(distances.min(axis=1).max())
+
+
+def simplify_annotations(annotations: List[Dict], tolerance_px: float) -> Tuple[List[Dict], Dict]:
+    """
+    Simplify the polygons of a list of annotations
+
+    Args:
+        annotations: Annotation dictionaries with 'class_id' and 'polygon' (pixels)
+        tolerance_px: Maximum allowed deviation in pixels
+
+    Returns:
+        Simplified annotations (integer pixel polygons) and stats with point
+        counts before/after and the measured max deviation
+    """
+    simplified_annotations = []
+    stats = {'points_before': 0, 'points_after': 0, 'max_deviation_px': 0.0}
+    for ann in annotations:
+        simplified = simplify_polygon(ann['polygon'], tolerance_px)
+        polygon = [tuple(point) for point in np.round(simplified).astype(int).tolist()]
+        stats['points_before'] += len(ann['polygon'])
+        stats['points_after'] += len(polygon)
+        stats['max_deviation_px'] = max(stats['max_deviation_px'], max_deviation(ann['polygon'], polygon))
+        simplified_annotations.append({**ann, 'polygon': polygon})
+    return simplified_annotations, stats
+
+
+def simplify_label_file(label_path: str, img_width: int, img_height: int,
+                        tolerance_px: float, dry_run: bool = False,
+                        backup_dir: Optional[str] = None) -> Dict:
+    """
+    Simplify every polygon of a YOLO label file in place
+
+    Coordinates are simplified in pixel space at full float precision and
+    written back in the same normalized 6-decimal format. The file is
+    replaced atomically, and only if its content changes.
+
+    Args:
+        label_path: Path to the label file
+        img_width: Image width in pixels
+        img_height: Image height in pixels
+        tolerance_px: Maximum allowed deviation in pixels
+        dry_run: Compute stats without writing
+        backup_dir: Copy the original here before replacing it
+
+    Returns:
+        Stats with points and bytes before/after, the max deviation in pixels
+        and whether the content changed
+    """
+    scale = np.array([img_width, img_height], dtype=np.float64)
+    with open(label_path, 'r') as f:
+        original = f.read()
+    lines = original.splitlines()
+
+    stats = {'points_before': 0, 'points_after': 0, 'max_deviation_px': 0.0,
+             'bytes_before': os.path.getsize(label_path)}
+    new_lines = []
+    for line in lines:
+        parts = line.split()
+        if len(parts) < 7:
+            if parts:
+                new_lines.append(line)
+            continue
+        polygon = np.array(parts[1:], dtype=np.float64).reshape(-1, 2) * scale
+        simplified = simplify_polygon(polygon, tolerance_px).astype(np.float64)
+        stats['points_before'] += len(polygon)
+        stats['points_after'] += len(simplified)
+        stats['max_deviation_px'] = max(stats['max_deviation_px'], max_deviation(polygon, simplified))
+        normalized = (simplified / scale).ravel()
+        new_lines.append(f"{parts[0]} " + " ".join(f"{coord:.6f}" for coord in normalized))
+
+    content = "".join(line + '\n' for line in new_lines)
+    stats['bytes_after'] = len(content.encode('utf-8'))
+    stats['changed'] = content != original
+    if stats['changed'] and not dry_run:
+        if backup_dir is not None:
+            os.makedirs(backup_dir, exist_ok=True)
+            shutil.copy2(label_path, os.path.join(backup_dir, os.path.basename(label_path)))
+        tmp_path = label_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(content)
+        os.replace(tmp_path, label_path)
+    return stats
+
+
+def simplify_label_directory(labels_dir: str, images_dir: str, tolerance_px: float,
+                             formats: Sequence[str], dry_run: bool = False,
+                             backup_dir: Optional[str] = None) -> Dict:
+    """
+    Bulk-simplify all label files of a directory
+
+    Args:
+        labels_dir: Directory with YOLO label files
+        images_dir: Directory with the matching images (for pixel dimensions)
+        tolerance_px: Maximum allowed deviation in pixels
+        formats: Image extensions to look for
+        dry_run: Report the reduction without rewriting files
+        backup_dir: Directory that receives the original of every rewritten file
+
+    Returns:
+        Totals over all files plus the names of labels that changed (or would
+        change, for a dry run) and of labels without a matching image
+    """
+    totals = {'files': 0, 'points_before': 0, 'points_after': 0,
+              'bytes_before': 0, 'bytes_after': 0, 'max_deviation_px': 0.0,
+              'tolerance_px': tolerance_px, 'changed': [], 'missing_images': []}
+    if not os.path.exists(labels_dir):
+        return totals
+
+    for label_file in sorted(os.listdir(labels_dir)):
+        if not label_file.endswith('.txt'):
+            continue
+        image_path = find_image(images_dir, Path(label_file).stem, formats)
+        if image_path is None:
+            totals['missing_images'].append(label_file)
+            continue
+        img_width, img_height = get_image_dimensions(image_path)
+        stats = simplify_label_file(os.path.join(labels_dir, label_file),
+                                    img_width, img_height, tolerance_px, dry_run, backup_dir)
+        totals['files'] += 1
+        if stats['changed']:
+            totals['changed'].append(label_file)
+        for key in ('points_before', 'points_after', 'bytes_before', 'bytes_after'):
+            totals[key] += stats[key]
+        totals['max_deviation_px'] = max(totals['max_deviation_px'], stats['max_deviation_px'])
+    return totals
@@ -0,0 +1,277 @@
+"""
+Perceptual-hash near-duplicate index over raw films
+"""
+import os
+import json
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+INDEX_FILE = 'hashes.json'
+HASH_SIZE = 8
+_DCT_SIZE = 32
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II matrix, so that dct2(X) = D @ X @ D.T"""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.sqrt(2.0 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT = _dct_matrix(_DCT_SIZE)
+
+
+def _pack_bits(bits: np.ndarray) -> np.ndarray:
+    """(N, 64) bool -> (N,) uint64"""
+    return np.packbits(bits.astype(np.uint8), axis=1).view('>u8').ravel().astype(np.uint64)
+
+
+def phash_batch(gray: np.ndarray) -> np.ndarray:
+    """
+    DCT perceptual hashes of a batch of grayscale thumbnails
+
+    Args:
+        gray: (N, 32, 32) float32 images
+
+    Returns:
+        (N,) uint64 hashes: low-frequency 8x8 DCT coefficients above their median
+    """
+    coeffs = np.einsum('ij,njk,lk->nil', _DCT, gray, _DCT)[:, :HASH_SIZE, :HASH_SIZE]
+    flat = coeffs.reshape(len(gray), -1)
+    # The DC term dominates the median, so it is left out of it
+    median = np.median(flat[:, 1:], axis=1, keepdims=True)
+    return _pack_bits(flat > median)
+
+
+def dhash_batch(gray: np.ndarray) -> np.ndarray:
+    """
+    Difference hashes of a batch of grayscale thumbnails
+
+    Args:
+        gray: (N, 8, 9) float32 images
+
+    Returns:
+        (N,) uint64 hashes: horizontal gradient signs
+    """
+    return _pack_bits((gray[:, :, 1:] > gray[:, :, :-1]).reshape(len(gray), -1))
+
+
+def _thumbnails(image_path: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    # Decoding at reduced resolution is much faster for large films
+    image = cv2.imread(image_path, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if image is None:
+        return None
+    image = image.astype(np.float32)
+    return (cv2.resize(image, (_DCT_SIZE, _DCT_SIZE), interpolation=cv2.INTER_AREA),
+            cv2.resize(image, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA))
+
+
+def compute_hashes(image_paths: Sequence[str]) -> Dict[str, Dict]:
+    """
+    pHash and dHash of images (hashes computed as one vectorized batch)
+
+    Returns:
+        Image name -> {'phash', 'dhash'} as 16-digit hex strings; unreadable images are skipped
+    """
+    names, p_thumbs, d_thumbs = [], [], []
+    for path in image_paths:
+        thumbs = _thumbnails(path)
+        if thumbs is not None:
+            names.append(os.path.basename(path))
+            p_thumbs.append(thumbs[0])
+            d_thumbs.append(thumbs[1])
+    if not names:
+        return {}
+    phashes = phash_batch(np.stack(p_thumbs))
+    dhashes = dhash_batch(np.stack(d_thumbs))
+    return {name: {'phash': f"{int(p):016x}", 'dhash': f"{int(d):016x}"}
+            for name, p, d in zip(names, phashes, dhashes)}
+
+
+def hamming(a: int, b: int) -> int:
+    """Hamming distance of two 64-bit hashes"""
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """Burkhard-Keller tree over 64-bit hashes for Hamming-radius queries"""
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, value: int, key: str):
+        node = [value, [key], {}]
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = hamming(value, current[0])
+            if distance == 0:
+                current[1].append(key)
+                return
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def query(self, value: int, radius: int) -> List[Tuple[str, int]]:
+        """Keys within radius of value, as (key, distance)"""
+        if self.root is None:
+            return []
+        matches = []
+        stack = [self.root]
+        while stack:
+            node_value, keys, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= radius:
+                matches.extend((key, distance) for key in keys)
+            for child_distance, child in children.items():
+                # Triangle inequality: only these subtrees can hold matches
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        return matches
+
+
+class HashIndex:
+    """Persisted perceptual-hash index of a film directory with a BK-tree for queries"""
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        self.entries: Dict[str, Dict] = {}
+        index_path = os.path.join(index_dir, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)['images']
+        self._build_tree()
+
+    def _build_tree(self):
+        self.tree = BKTree()
+        for name, entry in self.entries.items():
+            self.tree.add(int(entry['phash'], 16), name)
+
+    def save(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+        index_path = os.path.join(self.index_dir, INDEX_FILE)
+        tmp_path = index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'updated': datetime.now().isoformat(timespec='seconds'),
+                       'images': self.entries}, f)
+        os.replace(tmp_path, index_path)
+
+    def update(self, images_dir: str, formats: Sequence[str], batch_size: int = 256) -> Dict:
+        """
+        Bring the index up to date with a directory: hash new or changed films, drop deleted ones
+
+        Returns:
+            Counts of hashed, removed and indexed films
+        """
+        extensions = tuple(f".{ext.lower()}" for ext in formats)
+        current = {}
+        if os.path.exists(images_dir):
+            for name in os.listdir(images_dir):
+                if name.lower().endswith(extensions):
+                    stat = os.stat(os.path.join(images_dir, name))
+                    current[name] = (stat.st_size, stat.st_mtime)
+
+        removed = [name for name in self.entries if name not in current]
+        for name in removed:
+            del self.entries[name]
+        changed = [name for name, (size, mtime) in current.items()
+                   if name not in self.entries
+                   or (self.entries[name]['size'], self.entries[name]['mtime']) != (size, mtime)]
+
+        for start in range(0, len(changed), batch_size):
+            batch = changed[start:start + batch_size]
+            hashes = compute_hashes([os.path.join(images_dir, name) for name in batch])
+            for name, entry in hashes.items():
+                size, mtime = current[name]
+                self.entries[name] = {**entry, 'size': size, 'mtime': mtime}
+
+        self._build_tree()
+        self.save()
+        return {'hashed': len(changed), 'removed': len(removed), 'indexed': len(self.entries)}
+
+    def add_image(self, image_path: str, hashes: Optional[Dict] = None):
+        """Index one film (e.g. right after upload), optionally with its precomputed hashes"""
+        name = os.path.basename(image_path)
+        hashes = {name: hashes} if hashes is not None else compute_hashes([image_path])
+        if name not in hashes:
+            return
+        stat = os.stat(image_path)
+        replaced = name in self.entries
+        self.entries[name] = {**hashes[name], 'size': stat.st_size, 'mtime': stat.st_mtime}
+        if replaced:
+            self._build_tree()
+        else:
+            self.tree.add(int(hashes[name]['phash'], 16), name)
+        self.save()
+
+    def query(self, hashes: Dict, max_distance: int = 8, dhash_distance: Optional[int] = None,
+              exclude: Optional[str] = None) -> List[Dict]:
+        """
+        Near-duplicates of a film, closest first
+
+        Candidates come from the BK-tree on pHash; dHash (default: same
+        radius) must agree as well.
+
+        Args:
+            hashes: {'phash', 'dhash'} of the query film
+            max_distance: Maximum pHash Hamming distance
+            dhash_distance: Maximum dHash Hamming distance
+            exclude: Film name to leave out (the query film itself)
+
+        Returns:
+            Matches with 'image', 'phash_distance' and 'dhash_distance'
+        """
+        dhash_distance = max_distance if dhash_distance is None else dhash_distance
+        query_dhash = int(hashes['dhash'], 16)
+        matches = []
+        for name, distance in self.tree.query(int(hashes['phash'], 16), max_distance):
+            if name == exclude:
+                continue
+            d_distance = hamming(query_dhash, int(self.entries[name]['dhash'], 16))
+            if d_distance <= dhash_distance:
+                matches.append({'image': name, 'phash_distance': distance, 'dhash_distance': d_distance})
+        return sorted(matches, key=lambda m: (m['phash_distance'], m['dhash_distance']))
+
+    def groups(self, names: Optional[Sequence[str]] = None, max_distance: int = 8,
+               dhash_distance: Optional[int] = None) -> List[List[str]]:
+        """
+        Connected groups of near-duplicate films (union-find over radius queries)
+
+        Args:
+            names: Restrict to these films (default: all indexed films)
+            max_distance, dhash_distance: See query
+
+        Returns:
+            Groups with at least two films
+        """
+        names = [n for n in (names if names is not None else self.entries) if n in self.entries]
+        allowed = set(names)
+        parent = {name: name for name in names}
+
+        def find(name):
+            while parent[name] != name:
+                parent[name] = parent[parent[name]]
+                name = parent[name]
+            return name
+
+        for name in names:
+            for match in self.query(self.entries[name], max_distance, dhash_distance, exclude=name):
+                if match['image'] in allowed:
+                    root_a, root_b = find(name), find(match['image'])
+                    if root_a != root_b:
+                        parent[root_b] = root_a
+
+        grouped: Dict[str, List[str]] = {}
+        for name in names:
+            grouped.setdefault(find(name), []).append(name)
+        return [sorted(group) for group in grouped.values() if len(group) > 1]
+
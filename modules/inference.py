@@ -1,16 +1,29 @@
 """
 Inference module for YOLO11 segmentation models
 """
+import io
 import os
+import json
 import streamlit as st
 from ultralytics import YOLO
 import cv2
 import numpy as np
 from PIL import Image
 from typing import Dict, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
 import supervision as sv
 from datetime import datetime
-from modules.utils import load_config, hex_to_rgb, rgb_to_bgr
+from modules.utils import load_config
+from modules.registry import list_models, format_model_entry, get_model_entry
+from modules.calibration import predict_with_class_thresholds
+from modules.embeddings import (
+    EmbeddingIndex, embed_images, index_model_key, index_version, refresh_embedding_index
+)
+from modules.jobs import start_job, list_jobs
+from modules.visualization import draw_detections
+from modules.prediction import record_to_arrays, result_to_record
+from modules.inference_pool import get_inference_pool, iter_records
+from modules import perf
 
 
 class InferenceInterface:
@@ -26,8 +39,14 @@ class InferenceInterface:
             st.session_state.loaded_model = None
         if 'loaded_model_name' not in st.session_state:
             st.session_state.loaded_model_name = None
+        if 'loaded_model_entry' not in st.session_state:
+            st.session_state.loaded_model_entry = None
         if 'inference_results' not in st.session_state:
             st.session_state.inference_results = None
+        if 'batch_results' not in st.session_state:
+            st.session_state.batch_results = None
+        if 'batch_overlays' not in st.session_state:
+            st.session_state.batch_overlays = {}
     
     def render(self):
         """Render the inference interface"""
@@ -51,12 +70,24 @@ class InferenceInterface:
         st.markdown("### Model Seçimi")
         
         if os.path.exists(self.trained_models_dir):
-            model_files = [f for f in os.listdir(self.trained_models_dir) if f.endswith('.pt')]
+            sort_options = {
+                'mask_map': "Maske mAP (yüksekten düşüğe)",
+                'latency': "CPU Gecikmesi (hızlıdan yavaşa)",
+                'newest': "En Yeni"
+            }
+            sort_by = st.selectbox(
+                "Sıralama",
+                options=list(sort_options.keys()),
+                format_func=lambda x: sort_options[x],
+                index=list(sort_options.keys()).index(self.config['registry']['sort_by'])
+            )
+            models = {entry['file']: entry for entry in list_models(self.trained_models_dir, sort_by)}
             
-            if model_files:
+            if models:
                 selected_model = st.selectbox(
                     "Eğitilmiş Model",
-                    options=sorted(model_files, reverse=True),
+                    options=list(models.keys()),
+                    format_func=lambda x: format_model_entry(models[x]),
                     help="Kullanmak istediğiniz eğitilmiş modeli seçin"
                 )
                 
@@ -65,8 +96,11 @@ class InferenceInterface:
                     with st.spinner("Model yükleniyor..."):
                         try:
                             model_path = os.path.join(self.trained_models_dir, selected_model)
-                            st.session_state.loaded_model = YOLO(model_path)
+                            st.session_state.loaded_model = YOLO(model_path, task='segment')
                             st.session_state.loaded_model_name = selected_model
+                            st.session_state.loaded_model_entry = get_model_entry(
+                                self.trained_models_dir, selected_model
+                            )
                             st.success(f"✅ Model yüklendi: {selected_model}")
                         except Exception as e:
                             st.error(f"❌ Model yükleme hatası: {str(e)}")
@@ -86,12 +120,29 @@ class InferenceInterface:
         # Inference parameters
         st.markdown("### Tahmin Parametreleri")
         
+        entry = st.session_state.loaded_model_entry or {}
+        class_thresholds = entry.get('class_thresholds')
+        use_class_thresholds = False
+        if class_thresholds:
+            use_class_thresholds = st.checkbox(
+                "Sınıf Bazlı Eşikleri Kullan",
+                value=True,
+                help="Doğrulama setinde F1 skoruna göre kalibre edilmiş sınıf eşikleri"
+            )
+            if use_class_thresholds:
+                with st.expander("🎯 Kalibre Edilmiş Eşikler", expanded=False):
+                    for class_id, threshold in enumerate(class_thresholds):
+                        name = (self.config['classes'][class_id]['name']
+                                if class_id < len(self.config['classes']) else str(class_id))
+                        st.write(f"- {name}: {threshold:.3f}")
+        
         confidence = st.slider(
             "Güven Eşiği",
             min_value=0.0,
             max_value=1.0,
             value=self.config['inference']['default_confidence'],
             step=0.05,
+            disabled=use_class_thresholds,
             help="Minimum güven skoru (düşük değer = daha fazla tespit)"
         )
         
@@ -117,6 +168,7 @@ class InferenceInterface:
         # Store parameters in session state
         st.session_state.inference_params = {
             'confidence': confidence,
+            'class_thresholds': class_thresholds if use_class_thresholds else None,
             'iou': iou_threshold,
             'show_labels': show_labels,
             'show_confidence': show_confidence,
@@ -139,6 +191,12 @@ class InferenceInterface:
             st.info("👉 Lütfen sağ panelden bir model yükleyin")
             return
         
+        mode = st.radio("Yükleme Modu", ["Tek Film", "Çoklu Film"], horizontal=True,
+                        key="inference_upload_mode")
+        if mode == "Çoklu Film":
+            self._render_batch_area()
+            return
+        
         # Image upload
         uploaded_file = st.file_uploader(
             "Panoramik X-Ray Yükle",
@@ -148,12 +206,14 @@ class InferenceInterface:
         
         if uploaded_file is not None:
             # Load image
-            image = Image.open(uploaded_file)
-            img_array = np.array(image)
+            with perf.span('inference.decode'):
+                image = Image.open(uploaded_file)
+                img_array = np.array(image)
             
             # Display original image
             st.subheader("Original Image")
-            st.image(image, use_container_width=True)
+            with perf.span('inference.display_original'):
+                st.image(image, use_container_width=True)
             
             # Run inference button
             if st.button("🚀 Run Segmentation", type="primary", use_container_width=True):
@@ -163,6 +223,8 @@ class InferenceInterface:
             # Display results
             if st.session_state.inference_results is not None:
                 self._display_results()
+            
+            self._render_similar_films(img_array, uploaded_file.name)
     
     def _run_inference(self, image: np.ndarray, image_name: str):
         """Run inference on image"""
@@ -170,16 +232,31 @@ class InferenceInterface:
             params = st.session_state.inference_params
             
             # Run model
-            results = st.session_state.loaded_model.predict(
-                image,
-                conf=params['confidence'],
-                iou=params['iou'],
-                verbose=False
-            )
+            with perf.span('inference.predict'):
+                if self.config['inference_pool']['enabled']:
+                    masks, boxes = self._run_pooled_inference(image, image_name, params)
+                elif params.get('class_thresholds'):
+                    results = predict_with_class_thresholds(
+                        st.session_state.loaded_model,
+                        image,
+                        params['class_thresholds'],
+                        iou=params['iou']
+                    )
+                else:
+                    results = st.session_state.loaded_model.predict(
+                        image,
+                        conf=params['confidence'],
+                        iou=params['iou'],
+                        verbose=False
+                    )
+            if not self.config['inference_pool']['enabled']:
+                perf.record_predict_speed('inference.predict', results)
+                masks, boxes = self._result_arrays(results[0])
             
             # Store results
             st.session_state.inference_results = {
-                'results': results,
+                'masks': masks,
+                'boxes': boxes,
                 'image': image,
                 'image_name': image_name
             }
@@ -189,149 +266,319 @@ class InferenceInterface:
         except Exception as e:
             st.error(f"❌ Segmentasyon hatası: {str(e)}")
     
+    def _render_batch_area(self):
+        """Multi-film mode: parallel decode, batched inference and a lazily rendered gallery"""
+        uploaded_files = st.file_uploader(
+            "Panoramik X-Ray'leri Yükle",
+            type=self.config['image']['supported_formats'],
+            accept_multiple_files=True,
+            key="batch_uploads",
+            help="Bir hastanın film serisini tek seferde segmente edin"
+        )
+        if not uploaded_files:
+            return
+        
+        st.caption(f"{len(uploaded_files)} film seçildi")
+        if st.button("🚀 Toplu Segmentasyon", type="primary", use_container_width=True):
+            self._run_batch_inference(uploaded_files)
+        
+        batch = st.session_state.batch_results
+        if batch is None:
+            return
+        if [r['image'] for r in batch['records']] != [f.name for f in uploaded_files]:
+            st.info("ℹ️ Yüklenen filmler değişti; aşağıdaki sonuçlar önceki seriye ait.")
+        self._render_gallery(batch, {f.name: f for f in uploaded_files})
+    
+    def _run_batch_inference(self, uploaded_files: List):
+        """Decode the uploads in parallel and segment them in batches"""
+        try:
+            params = st.session_state.inference_params
+            inference_config = self.config['inference']
+            names = [f.name for f in uploaded_files]
+            class_names = [c['name'] for c in self.config['classes']]
+            progress = st.progress(0.0, text="Filmler açılıyor...")
+            
+            # Image decoders release the GIL, so threads decode in parallel
+            with perf.span('inference.batch.decode'):
+                with ThreadPoolExecutor(inference_config['decode_workers']) as executor:
+                    images = list(executor.map(_decode_upload, [f.getvalue() for f in uploaded_files]))
+            
+            records = [None] * len(images)
+            with perf.span('inference.batch.predict'):
+                if self.config['inference_pool']['enabled']:
+                    pool = get_inference_pool(self.config)
+                    model_path = os.path.join(self.trained_models_dir, st.session_state.loaded_model_name)
+                    futures = {
+                        pool.submit(model_path, image, class_names,
+                                    predict_args={'conf': params['confidence'], 'iou': params['iou']},
+                                    class_thresholds=params.get('class_thresholds'),
+                                    image_name=name): index
+                        for index, (image, name) in enumerate(zip(images, names))
+                    }
+                    futures_done = iter_records(futures, self.config['inference_pool']['timeout_s'])
+                    for done, (future, record, error) in enumerate(futures_done, 1):
+                        index = futures[future]
+                        if error is not None:
+                            # Keep the rest of the series; the film shows up without detections
+                            height, width = images[index].shape[:2]
+                            record = {'image': names[index], 'width': width, 'height': height,
+                                      'detections': [], 'error': error}
+                        records[index] = record
+                        progress.progress(done / len(images), text=f"Segmentasyon: {done}/{len(images)}")
+                else:
+                    batch_size = inference_config['batch_size']
+                    for start in range(0, len(images), batch_size):
+                        chunk = images[start:start + batch_size]
+                        if params.get('class_thresholds'):
+                            results = predict_with_class_thresholds(
+                                st.session_state.loaded_model, chunk, params['class_thresholds'],
+                                iou=params['iou']
+                            )
+                        else:
+                            results = st.session_state.loaded_model.predict(
+                                chunk, conf=params['confidence'], iou=params['iou'], verbose=False
+                            )
+                        perf.record_predict_speed('inference.batch.predict', results)
+                        for offset, result in enumerate(results):
+                            records[start + offset] = result_to_record(result, class_names, 'rle',
+                                                                       names[start + offset])
+                        done = min(start + batch_size, len(images))
+                        progress.progress(done / len(images), text=f"Segmentasyon: {done}/{len(images)}")
+            
+            # Only small thumbnails stay in the session; full size is re-decoded on demand
+            width = inference_config['thumbnail_width']
+            st.session_state.batch_results = {
+                'records': records,
+                'thumbnails': [_thumbnail(image, width) for image in images],
+                'model': st.session_state.loaded_model_name,
+                'params': {'confidence': params['confidence'], 'iou': params['iou'],
+                           'class_thresholds': params.get('class_thresholds')}
+            }
+            st.session_state.batch_overlays = {}
+            progress.empty()
+            failed = [r['image'] for r in records if 'error' in r]
+            st.success(f"✅ {len(records) - len(failed)} film segmente edildi!")
+            if failed:
+                st.warning(f"⚠️ {len(failed)} film segmente edilemedi: {', '.join(failed)}")
+            
+        except Exception as e:
+            st.error(f"❌ Segmentasyon hatası: {str(e)}")
+    
+    def _render_gallery(self, batch: Dict, uploads: Dict):
+        """Paged results gallery; overlays are drawn only for the visible page"""
+        st.markdown("---")
+        st.subheader("Segmentation Results")
+        records = batch['records']
+        inference_config = self.config['inference']
+        
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Film Sayısı", len(records))
+        col2.metric("Toplam Tespit", sum(len(r['detections']) for r in records))
+        with col3:
+            if st.button("💾 Tümünü Kaydet", use_container_width=True):
+                self._save_batch_results(batch)
+        
+        page_size = inference_config['gallery_page_size']
+        n_pages = (len(records) + page_size - 1) // page_size
+        page = 1
+        if n_pages > 1:
+            page = st.number_input("Sayfa", min_value=1, max_value=n_pages, value=1, step=1)
+        
+        columns = st.columns(inference_config['gallery_columns'])
+        start = (page - 1) * page_size
+        with perf.span('inference.batch.gallery'):
+            for slot, index in enumerate(range(start, min(start + page_size, len(records)))):
+                record = records[index]
+                with columns[slot % len(columns)]:
+                    status = f"hata: {record['error']}" if 'error' in record else f"{len(record['detections'])} tespit"
+                    st.image(self._batch_overlay(batch, index),
+                             caption=f"{record['image']} · {status}",
+                             use_container_width=True)
+        
+        # Full resolution for one film at a time
+        selected = st.selectbox("Film Detayı", range(len(records)),
+                                format_func=lambda i: records[i]['image'])
+        if st.toggle("🔍 Tam çözünürlükte göster", key="batch_full_resolution"):
+            upload = uploads.get(records[selected]['image'])
+            if upload is None:
+                st.warning("⚠️ Bu film artık yüklü değil")
+                return
+            image = _decode_upload(upload.getvalue())
+            masks, boxes = record_to_arrays(records[selected])
+            st.image(self._visualize_results(image, masks, boxes, st.session_state.inference_params),
+                     caption=records[selected]['image'], use_container_width=True)
+            with st.expander("📋 Tespit Detayları", expanded=False):
+                self._display_detection_details(boxes)
+    
+    def _batch_overlay(self, batch: Dict, index: int) -> np.ndarray:
+        """Thumbnail with predictions drawn, cached until the visualization options change"""
+        params = st.session_state.inference_params
+        view_key = (params['show_masks'], params['show_labels'], params['show_confidence'], params['mask_alpha'])
+        cache = st.session_state.batch_overlays
+        if cache.get('view_key') != view_key:
+            cache.clear()
+            cache['view_key'] = view_key
+        
+        if index not in cache:
+            thumbnail = batch['thumbnails'][index]
+            record = batch['records'][index]
+            masks, boxes = record_to_arrays(record, thumbnail.shape[:2])
+            cache[index] = self._visualize_results(thumbnail.copy(), masks, boxes, params)
+        return cache[index]
+    
+    def _save_batch_results(self, batch: Dict):
+        """Save the whole batch as compact records (as python -m modules predict writes them)"""
+        try:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            output_dir = os.path.join(self.inference_results_dir, f"batch_{timestamp}")
+            os.makedirs(output_dir, exist_ok=True)
+            
+            with open(os.path.join(output_dir, "predictions.jsonl"), 'w', encoding='utf-8') as f:
+                for record in batch['records']:
+                    f.write(json.dumps(record) + '\n')
+            with open(os.path.join(output_dir, "batch.json"), 'w', encoding='utf-8') as f:
+                json.dump({
+                    'model': batch['model'],
+                    'timestamp': timestamp,
+                    **batch['params'],
+                    'images': len(batch['records']),
+                    'failed': sum('error' in r for r in batch['records']),
+                    'detections': sum(len(r['detections']) for r in batch['records'])
+                }, f, indent=2)
+            
+            st.success(f"✅ Sonuçlar kaydedildi: {output_dir}")
+            
+        except Exception as e:
+            st.error(f"❌ Kaydetme hatası: {str(e)}")
+    
+    def _run_pooled_inference(self, image: np.ndarray, image_name: str, params: Dict):
+        """Run the loaded model in the shared worker pool instead of this session"""
+        pool = get_inference_pool(self.config)
+        record = pool.predict(
+            os.path.join(self.trained_models_dir, st.session_state.loaded_model_name),
+            image,
+            [c['name'] for c in self.config['classes']],
+            timeout=self.config['inference_pool']['timeout_s'],
+            predict_args={'conf': params['confidence'], 'iou': params['iou']},
+            class_thresholds=params.get('class_thresholds'),
+            image_name=image_name
+        )
+        return record_to_arrays(record)
+    
+    @staticmethod
+    def _result_arrays(result) -> Tuple[np.ndarray, np.ndarray]:
+        """Masks and (N, 6) boxes of an ultralytics result"""
+        if result.masks is None:
+            return np.zeros((0, 1, 1)), np.zeros((0, 6))
+        return result.masks.data.cpu().numpy(), result.boxes.data.cpu().numpy()
+    
+    def _render_similar_films(self, image: np.ndarray, image_name: str):
+        """Show prior films whose backbone embeddings are closest to the uploaded film"""
+        st.markdown("---")
+        with st.expander("🔎 Benzer Filmler", expanded=False):
+            embedding_config = self.config['embeddings']
+            index_dir = self.config['paths']['embeddings']
+            model_path = os.path.join(self.trained_models_dir, st.session_state.loaded_model_name)
+            layer = embedding_config['layer']
+            imgsz = (st.session_state.loaded_model_entry or {}).get('imgsz')
+            
+            index = _load_embedding_index(index_dir, index_version(index_dir))
+            index_current = index.meta['model_key'] == index_model_key(model_path, layer)
+            
+            jobs = list_jobs(self.config['paths']['jobs'], kind='embedding_index')
+            running = bool(jobs) and jobs[0]['status'] == 'running'
+            if running:
+                st.progress(jobs[0]['progress'], text=jobs[0]['message'])
+            
+            label = "🔄 Dizini Güncelle" if index_current else "🧱 Dizini Oluştur"
+            if st.button(label, disabled=running, key="refresh_embedding_index"):
+                start_job(
+                    'embedding_index', refresh_embedding_index, self.config['paths']['jobs'],
+                    model_path, index_dir, self.config['paths']['raw_images'],
+                    self.config['image']['supported_formats'],
+                    layer=layer, imgsz=imgsz,
+                    batch_size=embedding_config['batch_size'],
+                    ivf_min_rows=embedding_config['ivf_min_rows']
+                )
+                st.rerun()
+            
+            if not index_current or len(index) == 0:
+                st.info("Benzer film araması için yüklü modelle film dizini oluşturulmalı")
+                return
+            
+            # Embed the uploaded film once per film and model
+            cache_key = (image_name, index.meta['model_key'])
+            if st.session_state.get('similar_query_key') != cache_key:
+                # The index is built from files read as BGR
+                if image.ndim == 2:
+                    query_image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+                elif image.shape[2] == 4:
+                    query_image = cv2.cvtColor(image, cv2.COLOR_RGBA2BGR)
+                else:
+                    query_image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+                st.session_state.similar_query = embed_images(
+                    st.session_state.loaded_model, [query_image], layer, imgsz
+                )[0]
+                st.session_state.similar_query_key = cache_key
+            
+            matches = index.search(st.session_state.similar_query,
+                                   k=embedding_config['top_k'],
+                                   n_probe=embedding_config['n_probe'],
+                                   exclude=image_name)
+            st.caption(f"{len(index)} film dizinde")
+            columns = st.columns(len(matches)) if matches else []
+            for column, match in zip(columns, matches):
+                match_path = os.path.join(self.config['paths']['raw_images'], match['image'])
+                if os.path.exists(match_path):
+                    column.image(match_path, use_container_width=True)
+                column.caption(f"{match['image']}\nBenzerlik {match['similarity']:.3f}")
+    
     def _display_results(self):
         """Display inference results"""
         st.markdown("---")
         st.subheader("Segmentation Results")
         
         results_data = st.session_state.inference_results
-        results = results_data['results'][0]
+        masks, boxes = results_data['masks'], results_data['boxes']
         image = results_data['image']
         params = st.session_state.inference_params
         
         # Get detections
-        if results.masks is not None:
-            n_detections = len(results.masks)
+        if len(masks) > 0:
+            n_detections = len(masks)
             st.metric("Tespit Edilen Yapı Sayısı", n_detections)
             
             # Visualize results
-            annotated_image = self._visualize_results(
-                image.copy(),
-                results,
-                params
-            )
+            with perf.span('inference.visualize'):
+                annotated_image = self._visualize_results(
+                    image.copy(),
+                    masks,
+                    boxes,
+                    params
+                )
             
-            st.image(annotated_image, caption="Segmentasyon Sonucu", use_container_width=True)
+            with perf.span('inference.display_result'):
+                st.image(annotated_image, caption="Segmentasyon Sonucu", use_container_width=True)
             
             # Display detection details
             with st.expander("📋 Tespit Detayları", expanded=False):
-                self._display_detection_details(results)
+                self._display_detection_details(boxes)
         else:
             st.warning("⚠️ Hiçbir yapı tespit edilemedi. Güven eşiğini düşürmeyi deneyin.")
     
-    def _visualize_results(self, image: np.ndarray, results, params: Dict) -> np.ndarray:
+    def _visualize_results(self, image: np.ndarray, masks: np.ndarray, boxes: np.ndarray,
+                           params: Dict) -> np.ndarray:
         """Visualize segmentation results on image"""
-        # Convert to BGR for OpenCV
-        if len(image.shape) == 2:
-            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
-        elif image.shape[2] == 3:
-            image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
-        
-        if results.masks is None:
-            return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        
-        # Get masks and boxes
-        masks = results.masks.data.cpu().numpy()
-        boxes = results.boxes.data.cpu().numpy()
-        
-        # Draw each detection
-        for idx, (mask, box) in enumerate(zip(masks, boxes)):
-            class_id = int(box[5])
-            confidence = float(box[4])
-            
-            # Get class info
-            if class_id < len(self.config['classes']):
-                class_info = self.config['classes'][class_id]
-                class_name = class_info['name_tr']
-                hex_color = class_info['color']
-                rgb_color = hex_to_rgb(hex_color)
-                bgr_color = rgb_to_bgr(rgb_color)
-            else:
-                class_name = f"Class {class_id}"
-                bgr_color = (255, 0, 0)
-            
-            # Draw mask
-            if params['show_masks']:
-                # Resize mask to image size
-                mask_resized = cv2.resize(
-                    mask.astype(np.uint8),
-                    (image.shape[1], image.shape[0])
-                )
-                
-                # Create colored mask
-                colored_mask = np.zeros_like(image)
-                colored_mask[mask_resized > 0.5] = bgr_color
-                
-                # Blend with image
-                image = cv2.addWeighted(
-                    image,
-                    1.0,
-                    colored_mask,
-                    params['mask_alpha'],
-                    0
-                )
-            
-            # Draw contours
-            mask_resized = cv2.resize(
-                mask.astype(np.uint8),
-                (image.shape[1], image.shape[0])
-            )
-            contours, _ = cv2.findContours(
-                mask_resized,
-                cv2.RETR_EXTERNAL,
-                cv2.CHAIN_APPROX_SIMPLE
-            )
-            cv2.drawContours(image, contours, -1, bgr_color, 2)
-            
-            # Draw label
-            if params['show_labels'] or params['show_confidence']:
-                x1, y1 = int(box[0]), int(box[1])
-                
-                label_parts = []
-                if params['show_labels']:
-                    label_parts.append(class_name)
-                if params['show_confidence']:
-                    label_parts.append(f"{confidence:.2f}")
-                
-                label = " - ".join(label_parts)
-                
-                # Draw label background
-                (text_width, text_height), _ = cv2.getTextSize(
-                    label,
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    0.6,
-                    2
-                )
-                
-                cv2.rectangle(
-                    image,
-                    (x1, y1 - text_height - 10),
-                    (x1 + text_width + 10, y1),
-                    bgr_color,
-                    -1
-                )
-                
-                # Draw label text
-                cv2.putText(
-                    image,
-                    label,
-                    (x1 + 5, y1 - 5),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    0.6,
-                    (255, 255, 255),
-                    2
-                )
-        
-        # Convert back to RGB
-        return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        return draw_detections(
+            image, masks, boxes, self.config['classes'],
+            show_masks=params['show_masks'],
+            show_labels=params['show_labels'],
+            show_confidence=params['show_confidence'],
+            mask_alpha=params['mask_alpha']
+        )
     
-    def _display_detection_details(self, results):
+    def _display_detection_details(self, boxes: np.ndarray):
         """Display detailed detection information"""
-        if results.masks is None:
-            return
-        
-        boxes = results.boxes.data.cpu().numpy()
-        
         for idx, box in enumerate(boxes):
             class_id = int(box[5])
             confidence = float(box[4])
@@ -339,7 +586,8 @@ class InferenceInterface:
             
             # Get class name
             if class_id < len(self.config['classes']):
-                class_name = self.config['classes'][class_id]['name_tr']
+                class_info = self.config['classes'][class_id]
+                class_name = class_info.get('name_tr', class_info['name'])
             else:
                 class_name = f"Class {class_id}"
             
@@ -354,7 +602,7 @@ class InferenceInterface:
             results_data = st.session_state.inference_results
             image = results_data['image']
             image_name = results_data['image_name']
-            results = results_data['results'][0]
+            masks, boxes = results_data['masks'], results_data['boxes']
             params = st.session_state.inference_params
             
             # Create timestamp
@@ -370,7 +618,8 @@ class InferenceInterface:
             # Save annotated image
             annotated_image = self._visualize_results(
                 image.copy(),
-                results,
+                masks,
+                boxes,
                 params
             )
             annotated_path = os.path.join(output_dir, f"annotated_{image_name}")
@@ -381,8 +630,7 @@ class InferenceInterface:
             cv2.imwrite(original_path, cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
             
             # Save masks
-            if results.masks is not None:
-                masks = results.masks.data.cpu().numpy()
+            if len(masks) > 0:
                 for idx, mask in enumerate(masks):
                     mask_path = os.path.join(output_dir, f"mask_{idx}.png")
                     mask_resized = cv2.resize(
@@ -397,11 +645,13 @@ class InferenceInterface:
                 f.write(f"Model: {st.session_state.loaded_model_name}\n")
                 f.write(f"Image: {image_name}\n")
                 f.write(f"Timestamp: {timestamp}\n")
-                f.write(f"Confidence Threshold: {params['confidence']}\n")
+                if params.get('class_thresholds'):
+                    f.write(f"Class Thresholds: {params['class_thresholds']}\n")
+                else:
+                    f.write(f"Confidence Threshold: {params['confidence']}\n")
                 f.write(f"IoU Threshold: {params['iou']}\n\n")
                 
-                if results.masks is not None:
-                    boxes = results.boxes.data.cpu().numpy()
+                if len(boxes) > 0:
                     f.write(f"Total Detections: {len(boxes)}\n\n")
                     
                     for idx, box in enumerate(boxes):
@@ -409,7 +659,8 @@ class InferenceInterface:
                         confidence = float(box[4])
                         
                         if class_id < len(self.config['classes']):
-                            class_name = self.config['classes'][class_id]['name_tr']
+                            class_info = self.config['classes'][class_id]
+                            class_name = class_info.get('name_tr', class_info['name'])
                         else:
                             class_name = f"Class {class_id}"
                         
@@ -424,6 +675,25 @@ class InferenceInterface:
             st.error(f"❌ Kaydetme hatası: {str(e)}")
 
 
+def _decode_upload(data: bytes) -> np.ndarray:
+    """Decode an uploaded film into an RGB array"""
+    return np.array(Image.open(io.BytesIO(data)).convert('RGB'))
+
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def _load_embedding_index(index_dir: str, version: str) -> EmbeddingIndex:
+    """Read-only index shared by all sessions, reloaded only when a refresh changes it"""
+    return EmbeddingIndex(index_dir, read_only=True)
+
+
+def _thumbnail(image: np.ndarray, width: int) -> np.ndarray:
+    """Downscale an image to at most the given width"""
+    if image.shape[1] <= width:
+        return image
+    height = round(image.shape[0] * width / image.shape[1])
+    return cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+
+
 def render_inference_page(config: Dict):
     """Main function to render inference page"""
     interface = InferenceInterface(config)
@@ -0,0 +1,389 @@
+"""
+Shared out-of-process inference service
+
+K worker processes each keep a small cache of loaded models. Callers hand
+over images through multiprocessing.shared_memory blocks (workers predict
+directly on a view of the block, nothing is pickled) and get back compact
+records from modules.prediction.result_to_record. A crashing or bloated
+worker is replaced without taking the UI process down with it.
+
+Workers coalesce requests: after taking one off the queue a worker waits
+up to batch_window_ms for more (up to max_batch_size) and runs requests
+for the same model and settings as one batched predict. Under light load
+requests run alone; once they queue up faster than the workers drain
+them, batches fill without waiting.
+"""
+import os
+import time
+import queue
+import atexit
+import signal
+import itertools
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from multiprocessing import connection, shared_memory
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from modules import perf
+
+
+class WorkerCrashed(RuntimeError):
+    """The worker processing a request died before answering"""
+
+
+def _collect_batch(requests, max_batch_size: int, window_s: float):
+    """
+    Block for one request, then take whatever else arrives within the window
+
+    Returns:
+        (batch, stop): requests to run and whether a stop sentinel was seen
+    """
+    first = requests.get()
+    if first is None:
+        return [], True
+    batch = [first]
+    deadline = time.monotonic() + window_s
+    while len(batch) < max_batch_size:
+        try:
+            # A spent window still drains requests that are already queued
+            request = requests.get(timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Empty:
+            break
+        if request is None:
+            return batch, True
+        batch.append(request)
+    return batch, False
+
+
+def _batch_key(request: Dict):
+    """Requests with equal keys can share one predict call"""
+    return (request['model'], repr(sorted(request['predict_args'].items())), repr(request['class_thresholds']))
+
+
+def _run_group(group: List[Dict], models: OrderedDict, max_models: int, threads: int,
+               unclosed: List[shared_memory.SharedMemory]) -> List[Dict]:
+    """Predict a group of compatible requests as one batch"""
+    # Imported here so a broken install fails requests instead of crash-looping the worker
+    import torch
+    from ultralytics import YOLO
+    from modules.calibration import predict_with_class_thresholds
+    from modules.prediction import result_to_record
+
+    torch.set_num_threads(threads)
+    images = []
+    for request in group:
+        shm = shared_memory.SharedMemory(name=request['shm'])
+        unclosed.append(shm)
+        images.append(np.ndarray(request['shape'], dtype=request['dtype'], buffer=shm.buf))
+
+    path = group[0]['model']
+    model = models.pop(path, None)
+    if model is None:
+        model = YOLO(path, task='segment')
+        if len(models) >= max_models:
+            models.popitem(last=False)
+    models[path] = model  # most recently used last
+
+    predict_args = dict(group[0]['predict_args'])
+    if group[0]['class_thresholds']:
+        predict_args.pop('conf', None)
+        results = predict_with_class_thresholds(model, images, group[0]['class_thresholds'], **predict_args)
+    else:
+        results = model.predict(images, verbose=False, **predict_args)
+    return [result_to_record(result, request['class_names'], request['mask_format'], request['image_name'])
+            for request, result in zip(group, results)]
+
+
+def _worker_main(worker_id: int, requests, responses: connection.Connection, threads: int, max_models: int,
+                 max_rss_mb: Optional[float], max_batch_size: int, batch_window_s: float):
+    os.environ.setdefault('YOLO_VERBOSE', 'False')
+    # Ctrl-C reaches the whole process group; the parent stops workers with sentinels
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from modules.utils import get_rss_mb
+
+    models: OrderedDict = OrderedDict()
+    # Blocks still referenced by the last predictor batch; closed on a later request
+    unclosed: List[shared_memory.SharedMemory] = []
+
+    stop = False
+    while not stop:
+        batch, stop = _collect_batch(requests, max_batch_size, batch_window_s)
+        if not batch:
+            break
+        # Pipe writes are synchronous, so the parent learns what was taken even if we crash next
+        responses.send(('started', worker_id, [request['id'] for request in batch]))
+
+        groups: Dict[tuple, List[Dict]] = {}
+        for request in batch:
+            groups.setdefault(_batch_key(request), []).append(request)
+        for group in groups.values():
+            records, error = [None] * len(group), None
+            try:
+                records = _run_group(group, models, max_models, threads, unclosed)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            for request, record in zip(group, records):
+                responses.send(('done', worker_id, request['id'], record, error))
+
+        for block in list(unclosed):
+            try:
+                block.close()
+                unclosed.remove(block)
+            except BufferError:
+                pass  # still exported (e.g. by the predictor's last batch)
+
+        if max_rss_mb and get_rss_mb() > max_rss_mb:
+            break  # exit cleanly; the pool starts a fresh worker
+
+
+class InferencePool:
+    """
+    Pool of inference worker processes shared by all sessions of a server
+
+    Args:
+        n_workers: Worker processes (default: CPU count / threads_per_worker)
+        threads_per_worker: Torch threads per worker
+        max_models: Models cached per worker (least recently used is dropped)
+        max_worker_rss_mb: Replace a worker once its RSS exceeds this (None = never)
+        max_batch_size: Most requests a worker runs as one batch
+        batch_window_ms: How long a worker waits for more requests to batch
+    """
+
+    def __init__(self, n_workers: Optional[int] = None, threads_per_worker: int = 1,
+                 max_models: int = 2, max_worker_rss_mb: Optional[float] = None,
+                 max_batch_size: int = 1, batch_window_ms: float = 0.0):
+        self.threads_per_worker = max(1, threads_per_worker)
+        self.n_workers = n_workers or max(1, (os.cpu_count() or 1) // self.threads_per_worker)
+        self.max_models = max_models
+        self.max_worker_rss_mb = max_worker_rss_mb
+        self.max_batch_size = max(1, max_batch_size)
+        self.batch_window_ms = batch_window_ms
+        self._context = multiprocessing.get_context('spawn')
+        self._requests = self._context.Queue()
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._pending: Dict[int, tuple] = {}  # request id -> (future, shared memory, submit time)
+        self._in_flight: Dict[int, set] = {}  # worker id -> request ids of its current batch
+        self._workers: Dict[int, multiprocessing.Process] = {}
+        self._responses: Dict[int, connection.Connection] = {}  # worker id -> its result pipe
+        self._closed = False
+        self.completed = 0
+        self.failed = 0
+        self.restarts = 0
+        for worker_id in range(self.n_workers):
+            self._start_worker(worker_id)
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def _start_worker(self, worker_id: int):
+        reader, writer = self._context.Pipe(duplex=False)
+        process = self._context.Process(
+            target=_worker_main,
+            args=(worker_id, self._requests, writer, self.threads_per_worker,
+                  self.max_models, self.max_worker_rss_mb, self.max_batch_size,
+                  self.batch_window_ms / 1000),
+            daemon=True
+        )
+        process.start()
+        writer.close()  # the worker holds the only write end, so its exit shows up as EOF
+        self._workers[worker_id] = process
+        self._responses[worker_id] = reader
+
+    def submit(self, model_path: str, image: np.ndarray, class_names: Sequence[str],
+               predict_args: Optional[Dict] = None, class_thresholds: Optional[List[float]] = None,
+               mask_format: str = 'rle', image_name: str = '') -> Future:
+        """
+        Queue an image for segmentation
+
+        Args:
+            model_path: Model weights (loaded by the worker on first use)
+            image: Image array (BGR or RGB as the model expects, any dtype)
+            class_names: Class names by id
+            predict_args: Predict arguments (conf, iou, imgsz, ...)
+            class_thresholds: Per-class confidence thresholds (overrides conf)
+            mask_format: 'rle' or 'polygon'
+            image_name: Name recorded in the result
+
+        Returns:
+            Future resolving to a result_to_record dictionary
+        """
+        if self._closed:
+            raise RuntimeError("Inference pool is closed")
+        image = np.ascontiguousarray(image)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, image.nbytes))
+        np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf)[...] = image
+
+        future = Future()
+        request_id = next(self._ids)
+        with self._lock:
+            self._pending[request_id] = (future, shm, time.perf_counter())
+            queued = len(self._pending) - sum(len(ids) for ids in self._in_flight.values())
+        perf.observe('inference_pool.queue_depth', queued)
+        self._requests.put({
+            'id': request_id, 'shm': shm.name, 'shape': image.shape, 'dtype': image.dtype.str,
+            'model': model_path, 'class_names': list(class_names), 'predict_args': predict_args or {},
+            'class_thresholds': class_thresholds, 'mask_format': mask_format, 'image_name': image_name
+        })
+        return future
+
+    def predict(self, model_path: str, image: np.ndarray, class_names: Sequence[str],
+                timeout: Optional[float] = None, **kwargs) -> Dict:
+        """Blocking submit; raises on worker errors, crashes and timeouts"""
+        return self.submit(model_path, image, class_names, **kwargs).result(timeout)
+
+    def _finish(self, request_id: int, record: Optional[Dict] = None, error: Optional[BaseException] = None):
+        with self._lock:
+            entry = self._pending.pop(request_id, None)
+        if entry is None:
+            return
+        future, shm, _ = entry
+        shm.close()
+        shm.unlink()
+        if error is None:
+            self.completed += 1
+            future.set_result(record)
+        else:
+            self.failed += 1
+            future.set_exception(error)
+
+    def _collect(self):
+        while not self._closed:
+            readers = {reader: worker_id for worker_id, reader in self._responses.items()}
+            for reader in connection.wait(list(readers), timeout=0.5):
+                try:
+                    self._handle(reader.recv())
+                except (EOFError, OSError):
+                    pass  # worker exited; _check_workers replaces it
+            self._check_workers()
+
+    def _handle(self, message: tuple):
+        if message[0] == 'started':
+            _, worker_id, request_ids = message
+            now = time.perf_counter()
+            with self._lock:
+                self._in_flight[worker_id] = set(request_ids)
+                submitted = [self._pending[i][2] for i in request_ids if i in self._pending]
+            perf.observe('inference_pool.batch_size', len(request_ids))
+            for submit_time in submitted:
+                perf.record('inference_pool.queue_wait', now - submit_time)
+        else:
+            _, worker_id, request_id, record, error = message
+            with self._lock:
+                self._in_flight.get(worker_id, set()).discard(request_id)
+            self._finish(request_id, record, RuntimeError(error) if error else None)
+
+    def _check_workers(self):
+        """Fail the requests of any dead worker and start a replacement"""
+        if self._closed:
+            return
+        for worker_id, process in list(self._workers.items()):
+            if process.is_alive():
+                continue
+            reader = self._responses.pop(worker_id)
+            try:
+                while reader.poll():
+                    self._handle(reader.recv())
+            except (EOFError, OSError):
+                pass
+            reader.close()
+            with self._lock:
+                request_ids = self._in_flight.pop(worker_id, set())
+            for request_id in request_ids:
+                self._finish(request_id, error=WorkerCrashed(
+                    f"Inference worker {worker_id} exited with code {process.exitcode}"))
+            with self._lock:
+                if self._closed:
+                    return  # close() is joining the workers; don't start new ones behind it
+                self.restarts += 1
+                self._start_worker(worker_id)
+
+    def worker_pids(self) -> List[int]:
+        """Process ids of the current workers (replacements included)"""
+        return [p.pid for p in list(self._workers.values()) if p.pid is not None]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            pending = len(self._pending)
+            busy = sum(len(ids) for ids in self._in_flight.values())
+        return {
+            'workers': self.n_workers,
+            'alive': sum(p.is_alive() for p in self._workers.values()),
+            'pending': pending,
+            'busy': busy,
+            'completed': self.completed,
+            'failed': self.failed,
+            'restarts': self.restarts
+        }
+
+    def close(self, timeout: float = 10.0):
+        """Stop the workers and fail anything still pending"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        for _ in self._workers:
+            self._requests.put(None)
+        for process in self._workers.values():
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._collector.join(timeout)
+        for reader in self._responses.values():
+            reader.close()
+        for request_id in list(self._pending):
+            self._finish(request_id, error=RuntimeError("Inference pool closed"))
+
+
+def iter_records(futures: Iterable[Future], timeout: float) -> Iterator[Tuple[Future, Optional[Dict], Optional[str]]]:
+    """
+    Yield (future, record, error) for submitted requests in completion order
+
+    The timeout applies to each result rather than the whole series, so a
+    batch of any size is waited on while results keep arriving. Requests
+    still pending once none has finished for `timeout` seconds, and
+    requests that failed, are yielded with an error message instead of a
+    record.
+    """
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            for future in pending:
+                yield future, None, f"No result within {timeout:g} s"
+            return
+        for future in done:
+            try:
+                yield future, future.result(), None
+            except Exception as e:
+                yield future, None, str(e) or type(e).__name__
+
+
+_pool: Optional[InferencePool] = None
+_pool_lock = threading.Lock()
+
+
+def get_inference_pool(config: Dict) -> InferencePool:
+    """The process-wide pool (started on first use and shared by all Streamlit sessions)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            pool_config = config['inference_pool']
+            _pool = InferencePool(
+                n_workers=pool_config['workers'] or None,
+                threads_per_worker=pool_config['threads_per_worker'],
+                max_models=pool_config['max_models'],
+                max_worker_rss_mb=pool_config['max_worker_rss_mb'] or None,
+                max_batch_size=pool_config['max_batch_size'],
+                batch_window_ms=pool_config['batch_window_ms']
+            )
+            atexit.register(_pool.close)
+        return _pool
+
+
+def running_inference_pool() -> Optional[InferencePool]:
+    """The process-wide pool if it has been started"""
+    return _pool
@@ -0,0 +1,108 @@
+"""
+Background jobs for long-running work started from the Streamlit pages
+"""
+import os
+import json
+import threading
+import traceback
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+
+class JobContext:
+    """Handle passed to a job function to report progress"""
+
+    def __init__(self, job_id: str, jobs_dir: str, kind: str):
+        self.job_id = job_id
+        self.jobs_dir = jobs_dir
+        self.state = {
+            'job_id': job_id,
+            'kind': kind,
+            'status': 'running',
+            'progress': 0.0,
+            'message': '',
+            'started': datetime.now().isoformat(timespec='seconds'),
+            'finished': None,
+            'result': None,
+            'error': None
+        }
+        self._lock = threading.Lock()
+        self._write()
+
+    def update(self, progress: Optional[float] = None, message: Optional[str] = None, **data):
+        """Update job progress (0-1), message and any extra fields"""
+        with self._lock:
+            if progress is not None:
+                self.state['progress'] = float(progress)
+            if message is not None:
+                self.state['message'] = message
+            self.state.update(data)
+            self._write()
+
+    def finish(self, status: str, result=None, error: Optional[str] = None):
+        """Mark job as finished"""
+        with self._lock:
+            self.state['status'] = status
+            self.state['result'] = result
+            self.state['error'] = error
+            self.state['finished'] = datetime.now().isoformat(timespec='seconds')
+            if status == 'completed':
+                self.state['progress'] = 1.0
+            self._write()
+
+    def _write(self):
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        job_path = os.path.join(self.jobs_dir, f"{self.job_id}.json")
+        tmp_path = job_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=2, default=str)
+        os.replace(tmp_path, job_path)
+
+
+def start_job(kind: str, fn: Callable, jobs_dir: str, *args, **kwargs) -> str:
+    """
+    Run fn(job, *args, **kwargs) in a daemon thread, persisting its status
+
+    Args:
+        kind: Job kind (e.g. 'sweep')
+        fn: Job function; receives a JobContext as first argument
+        jobs_dir: Directory for job status files
+
+    Returns:
+        Job id
+    """
+    job_id = f"{kind}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+    job = JobContext(job_id, jobs_dir, kind)
+
+    def target():
+        try:
+            result = fn(job, *args, **kwargs)
+            job.finish('completed', result=result)
+        except Exception as e:
+            job.finish('failed', error=f"{e}\n{traceback.format_exc()}")
+
+    threading.Thread(target=target, name=job_id, daemon=True).start()
+    return job_id
+
+
+def load_job(jobs_dir: str, job_id: str) -> Optional[Dict]:
+    """Load job status"""
+    job_path = os.path.join(jobs_dir, f"{job_id}.json")
+    if not os.path.exists(job_path):
+        return None
+    with open(job_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def list_jobs(jobs_dir: str, kind: Optional[str] = None) -> List[Dict]:
+    """List jobs, newest first"""
+    if not os.path.exists(jobs_dir):
+        return []
+    jobs = []
+    for job_file in os.listdir(jobs_dir):
+        if not job_file.endswith('.json'):
+            continue
+        job = load_job(jobs_dir, job_file[:-len('.json')])
+        if job is not None and (kind is None or job['kind'] == kind):
+            jobs.append(job)
+    return sorted(jobs, key=lambda j: j['started'], reverse=True)
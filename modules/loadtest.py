@@ -0,0 +1,374 @@
+"""
+Concurrent-session load testing: N simulated clinicians against one instance
+
+Two drivers:
+- 'app': each session is a streamlit.testing AppTest of app.py that
+  navigates the pages and loads a model through the sidebar, then runs
+  segmentation with its own loaded model (AppTest cannot drive file
+  uploads, so the upload/segment step runs the page's core path:
+  decode, predict, visualize and PNG encoding as st.image does).
+- 'core': each session is a thread running that core path in a loop with
+  its own model, without Streamlit.
+- 'pool': like 'core', but all sessions share the inference worker pool
+  (modules.inference_pool) instead of holding a model each.
+- 'http': each session is a keep-alive client of the HTTP inference API
+  (modules.api), posting films to /predict.
+
+For each session count the harness reports throughput, per-action
+latency percentiles, errors and peak RSS. With a worker pool in this
+process ('pool', and 'http' without a URL) the summed peak RSS of the
+workers is reported as well; a remote server's memory is not visible.
+"""
+import io
+import os
+import json
+import time
+import http.client
+import threading
+from typing import Callable, Dict, List, Optional, Sequence
+from urllib.parse import urlencode, urlsplit
+
+import numpy as np
+from PIL import Image
+
+from modules.utils import get_rss_mb
+from modules.synthetic import generate_film
+from modules.visualization import draw_detections
+
+APP_PAGES = ("🏠 Home", "🖊️ Annotation", "🎓 Model Training", "🔍 AI Segmentation")
+LOAD_MODEL_BUTTON = "📥 Modeli Yükle"
+
+
+class ActionLog:
+    """Thread-safe per-action latency samples and errors"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: List[str] = []
+        self._lock = threading.Lock()
+
+    def time(self, action: str, fn: Callable, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            self.error(action, e)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.samples.setdefault(action, []).append(elapsed)
+
+    def error(self, action: str, e: Exception):
+        """Record an exception once, at the innermost action it passed through"""
+        if getattr(e, '_load_test_logged', False):
+            return
+        e._load_test_logged = True
+        with self._lock:
+            self.errors.append(f"{action}: {type(e).__name__}: {e}")
+
+    def summary(self) -> Dict[str, Dict]:
+        summary = {}
+        for action, samples in sorted(self.samples.items()):
+            ms = np.array(samples) * 1000
+            p50, p95, p99 = np.percentile(ms, (50, 95, 99))
+            summary[action] = {'count': len(ms), 'p50_ms': round(float(p50), 1),
+                               'p95_ms': round(float(p95), 1), 'p99_ms': round(float(p99), 1),
+                               'mean_ms': round(float(ms.mean()), 1), 'max_ms': round(float(ms.max()), 1)}
+        return summary
+
+
+class RssSampler:
+    """Background thread tracking the peak RSS of this process and, optionally, of worker processes"""
+
+    def __init__(self, interval_s: float = 0.05,
+                 worker_pids: Optional[Callable[[], List[int]]] = None):
+        """
+        Args:
+            interval_s: Sampling interval
+            worker_pids: Returns the worker pids to sample (called each time,
+                so replaced workers are followed); their RSS is summed
+        """
+        self.interval_s = interval_s
+        self.worker_pids = worker_pids
+        self.start_mb = self.peak_mb = get_rss_mb()
+        self.workers_start_mb = self.workers_peak_mb = self._workers_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _workers_rss(self) -> Optional[float]:
+        if self.worker_pids is None:
+            return None
+        return sum(get_rss_mb(pid) for pid in self.worker_pids())
+
+    def _sample(self):
+        self.peak_mb = max(self.peak_mb, get_rss_mb())
+        if self.worker_pids is not None:
+            self.workers_peak_mb = max(self.workers_peak_mb, self._workers_rss())
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            self._sample()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+def synthetic_uploads(classes: List[Dict], n_films: int, size: Sequence[int], seed: int = 0) -> List[bytes]:
+    """PNG-encoded synthetic films, as a browser would upload them"""
+    class_ids = {c['name']: i for i, c in enumerate(classes)}
+    uploads = []
+    for index in range(n_films):
+        image, _ = generate_film(np.random.default_rng([seed, index]), size[0], size[1], class_ids)
+        buffer = io.BytesIO()
+        Image.fromarray(image).save(buffer, format='PNG')
+        uploads.append(buffer.getvalue())
+    return uploads
+
+
+def local_predictor(model, predict_args: Dict) -> Callable:
+    """Predict with a model held by the session; returns masks and (N, 6) boxes"""
+    def predict(image):
+        result = model.predict(image, verbose=False, **predict_args)[0]
+        if result.masks is None:
+            return np.zeros((0, 1, 1)), np.zeros((0, 6))
+        return result.masks.data.cpu().numpy(), result.boxes.data.cpu().numpy()
+    return predict
+
+
+def pool_predictor(pool, model_path: str, classes: List[Dict], predict_args: Dict,
+                   timeout_s: Optional[float] = None) -> Callable:
+    """Predict in the shared worker pool; returns masks and (N, 6) boxes"""
+    from modules.prediction import record_to_arrays
+
+    names = [c['name'] for c in classes]
+
+    def predict(image):
+        return record_to_arrays(pool.predict(model_path, image, names, timeout=timeout_s,
+                                             predict_args=predict_args))
+    return predict
+
+
+def segment_upload(predict: Callable, upload: bytes, classes: List[Dict], log: ActionLog):
+    """The inference page's work for one film: decode, predict, visualize, encode for display"""
+    image = log.time('decode', lambda: np.array(Image.open(io.BytesIO(upload))))
+    masks, boxes = log.time('predict', predict, image)
+    annotated = log.time('visualize', draw_detections, image, masks, boxes, classes)
+    # st.image re-encodes numpy images before sending them to the browser
+    log.time('encode', lambda: Image.fromarray(annotated).save(io.BytesIO(), format='PNG'))
+
+
+def _core_session(log: ActionLog, model_path: str, uploads: List[bytes], iterations: int,
+                  classes: List[Dict], predict_args: Dict, barrier: threading.Barrier):
+    from ultralytics import YOLO
+
+    # Each session holds its own model, as with st.session_state in the app
+    model = log.time('load_model', YOLO, model_path, task='segment')
+    predict = local_predictor(model, predict_args)
+    barrier.wait()
+    for i in range(iterations):
+        log.time('segment', segment_upload, predict, uploads[i % len(uploads)], classes, log)
+
+
+def _pool_session(log: ActionLog, pool, model_path: str, uploads: List[bytes], iterations: int,
+                  classes: List[Dict], predict_args: Dict, timeout_s: float, barrier: threading.Barrier):
+    predict = pool_predictor(pool, model_path, classes, predict_args, timeout_s)
+    barrier.wait()
+    for i in range(iterations):
+        log.time('segment', segment_upload, predict, uploads[i % len(uploads)], classes, log)
+
+
+def _post_predict(connection: http.client.HTTPConnection, upload: bytes, query: str) -> Dict:
+    connection.request('POST', f"/predict?{query}", body=upload, headers={'Content-Type': 'image/png'})
+    response = connection.getresponse()
+    body = response.read()
+    if response.status != 200:
+        raise RuntimeError(f"HTTP {response.status}: {body[:200].decode('utf-8', 'replace')}")
+    return json.loads(body)
+
+
+def _http_session(log: ActionLog, host: str, port: int, uploads: List[bytes], iterations: int,
+                  query: str, timeout_s: float, barrier: threading.Barrier):
+    # One keep-alive connection per session
+    connection = http.client.HTTPConnection(host, port, timeout=timeout_s)
+    try:
+        barrier.wait()
+        for i in range(iterations):
+            log.time('segment', _post_predict, connection, uploads[i % len(uploads)], query)
+    finally:
+        connection.close()
+
+
+def _app_session(log: ActionLog, app_path: str, uploads: List[bytes], iterations: int,
+                 classes: List[Dict], predict_args: Dict, timeout_s: float, barrier: threading.Barrier):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(app_path, default_timeout=timeout_s)
+    barrier.wait()
+    log.time('rerun.home', app.run)
+    for page in APP_PAGES[1:]:
+        log.time(f"rerun.{page.split(' ', 1)[1].lower().replace(' ', '_')}",
+                 app.sidebar.radio[0].set_value(page).run)
+        if app.exception:
+            raise RuntimeError(app.exception[0].message)
+
+    buttons = [b for b in app.button if b.label == LOAD_MODEL_BUTTON]
+    if not buttons:
+        raise RuntimeError("No trained model to load on the inference page")
+    log.time('load_model', buttons[0].click().run)
+    predict = local_predictor(app.session_state['loaded_model'], predict_args)
+    for i in range(iterations):
+        log.time('segment', segment_upload, predict, uploads[i % len(uploads)], classes, log)
+        # The page reruns after each interaction
+        log.time('rerun.ai_segmentation', app.run)
+
+
+def run_load_step(n_sessions: int, session_fn: Callable, *args,
+                  worker_pids: Optional[Callable[[], List[int]]] = None) -> Dict:
+    """Run n_sessions concurrent sessions and summarize them (worker_pids: see RssSampler)"""
+    log = ActionLog()
+    barrier = threading.Barrier(n_sessions + 1)
+
+    def target():
+        try:
+            session_fn(log, *args, barrier)
+        except threading.BrokenBarrierError:
+            pass
+        except Exception as e:
+            log.error('session', e)
+            barrier.abort()
+
+    threads = [threading.Thread(target=target, daemon=True) for _ in range(n_sessions)]
+    with RssSampler(worker_pids=worker_pids) as rss:
+        for thread in threads:
+            thread.start()
+        try:
+            barrier.wait()  # start the clock once every session has its model
+        except threading.BrokenBarrierError:
+            pass
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        duration = time.perf_counter() - start
+
+    segmentations = len(log.samples.get('segment', []))
+    step = {
+        'sessions': n_sessions,
+        'duration_s': round(duration, 2),
+        'segmentations': segmentations,
+        'throughput_per_s': round(segmentations / duration, 3) if duration > 0 else 0.0,
+        'latency': log.summary(),
+        'errors': log.errors[:20],
+        'n_errors': len(log.errors),
+        'rss_start_mb': round(rss.start_mb, 1),
+        'peak_rss_mb': round(rss.peak_mb, 1)
+    }
+    if worker_pids is not None:
+        step['workers_rss_start_mb'] = round(rss.workers_start_mb, 1)
+        step['workers_peak_rss_mb'] = round(rss.workers_peak_mb, 1)
+    return step
+
+
+def load_test(config: Dict, session_counts: Sequence[int], mode: str = 'core', iterations: int = 5,
+              model_path: Optional[str] = None, app_path: str = 'app.py', n_films: int = 4,
+              film_size: Sequence[int] = (2048, 1024), timeout_s: float = 120.0,
+              url: Optional[str] = None, progress_callback: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """
+    Ramp the number of concurrent sessions and measure each step
+
+    Args:
+        config: Application config
+        session_counts: Concurrent session counts to test, e.g. [1, 2, 4, 8]
+        mode: 'core' (threads on the core path), 'pool' (threads sharing the
+            inference worker pool), 'http' (clients of the HTTP API) or 'app'
+            (AppTest sessions)
+        iterations: Segmentations per session
+        model_path: Model for 'core' and 'pool' modes, registered model name
+            for 'http' mode ('app' mode loads the first registered model)
+        app_path: Streamlit script for 'app' mode
+        n_films: Distinct synthetic films uploaded in rotation
+        film_size: Synthetic film width and height
+        timeout_s: Per-rerun timeout for AppTest (per-request for 'pool' and 'http')
+        url: API base URL for 'http' mode (default: serve one in this process)
+        progress_callback: Called with each step's result
+
+    Returns:
+        Steps with throughput, latency percentiles and peak RSS (of this
+        process and of the pool workers) per session count
+    """
+    classes = config['classes']
+    uploads = synthetic_uploads(classes, n_films, film_size)
+    predict_args = {'conf': config['inference']['default_confidence'],
+                    'iou': config['inference']['default_iou']}
+
+    server = None
+    worker_pids = None  # the models live in these processes in 'pool' and local 'http' modes
+    if mode == 'core':
+        session_fn, args = _core_session, (model_path, uploads, iterations, classes, predict_args)
+    elif mode == 'pool':
+        from modules.inference_pool import get_inference_pool
+
+        pool = get_inference_pool(config)
+        # Warm every worker's model cache before the clock starts
+        warmup = [pool.submit(model_path, np.zeros((64, 64, 3), np.uint8), [c['name'] for c in classes])
+                  for _ in range(pool.n_workers)]
+        for future in warmup:
+            future.result(timeout_s)
+        worker_pids = pool.worker_pids
+        session_fn, args = _pool_session, (pool, model_path, uploads, iterations, classes, predict_args, timeout_s)
+    elif mode == 'http':
+        if url is None:
+            from modules.api import make_server
+            from modules.inference_pool import get_inference_pool
+
+            pool = get_inference_pool(config)
+            worker_pids = pool.worker_pids
+            server = make_server(config, pool, '127.0.0.1', 0, quiet=True)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            host, port = server.server_address[:2]
+        else:
+            parts = urlsplit(url)
+            host, port = parts.hostname, parts.port or 80
+        query = {'conf': predict_args['conf'], 'iou': predict_args['iou']}
+        if model_path:
+            query['model'] = model_path
+        # Warm the server's model cache before the clock starts
+        warmup = http.client.HTTPConnection(host, port, timeout=timeout_s)
+        try:
+            _post_predict(warmup, uploads[0], urlencode(query))
+        finally:
+            warmup.close()
+        session_fn, args = _http_session, (host, port, uploads, iterations, urlencode(query), timeout_s)
+    elif mode == 'app':
+        session_fn, args = _app_session, (app_path, uploads, iterations, classes, predict_args, timeout_s)
+    else:
+        raise ValueError(f"Unknown load test mode: {mode}")
+
+    steps = []
+    try:
+        for n_sessions in session_counts:
+            step = run_load_step(n_sessions, session_fn, *args, worker_pids=worker_pids)
+            steps.append(step)
+            if progress_callback is not None:
+                progress_callback(step)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+    report = {
+        'mode': mode,
+        'model': model_path if mode in ('core', 'pool', 'http') else None,
+        'iterations': iterations,
+        'film_size': list(film_size),
+        'cpu_count': os.cpu_count(),
+        'steps': steps
+    }
+    if worker_pids is not None:
+        report['pool'] = pool.stats()
+    return report
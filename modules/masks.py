@@ -0,0 +1,137 @@
+"""
+Binary mask utilities: run-length encoding, rasterization and box-pruned IoU
+"""
+from typing import Dict, List, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+
+def rle_encode(mask: np.ndarray) -> Dict:
+    """
+    Run-length encode a binary mask (column-major, COCO-style uncompressed counts)
+
+    Args:
+        mask: HxW binary mask
+
+    Returns:
+        Dictionary with 'size' [h, w] and 'counts' (alternating 0/1 run lengths, starting with 0s)
+    """
+    h, w = mask.shape
+    flat = np.asarray(mask, dtype=bool).ravel(order='F')
+    # Positions where the value changes, plus both ends
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    boundaries = np.concatenate([[0], changes, [flat.size]])
+    counts = np.diff(boundaries)
+    if flat.size and flat[0]:
+        counts = np.concatenate([[0], counts])
+    return {'size': [int(h), int(w)], 'counts': counts.astype(int).tolist()}
+
+
+def rle_decode(rle: Dict) -> np.ndarray:
+    """Decode an RLE produced by rle_encode into an HxW bool mask"""
+    h, w = rle['size']
+    counts = np.asarray(rle['counts'], dtype=np.int64)
+    values = np.zeros(len(counts), dtype=bool)
+    values[1::2] = True
+    flat = np.repeat(values, counts)
+    return flat.reshape((w, h)).T
+
+
+def rle_area(rle: Dict) -> int:
+    """Number of foreground pixels of an RLE"""
+    return int(sum(rle['counts'][1::2]))
+
+
+def rle_decode_many(rles: Sequence[Dict], shape: Tuple[int, int]) -> np.ndarray:
+    """
+    Decode RLEs into an (N, H, W) bool array
+
+    RLEs of another size are resized to shape one at a time (nearest
+    neighbour), so only a single mask is ever held at the RLE resolution.
+    """
+    masks = np.zeros((len(rles), shape[0], shape[1]), dtype=bool)
+    for i, rle in enumerate(rles):
+        mask = rle_decode(rle)
+        if mask.shape != tuple(shape):
+            mask = cv2.resize(mask.view(np.uint8), (shape[1], shape[0]), interpolation=cv2.INTER_NEAREST) > 0
+        masks[i] = mask
+    return masks
+
+
+def polygons_to_masks(polygons: Sequence[np.ndarray], shape: Tuple[int, int]) -> np.ndarray:
+    """
+    Rasterize polygons into an (N, H, W) bool array
+
+    Args:
+        polygons: Polygons as (K, 2) arrays of x, y pixel coordinates
+        shape: (height, width) of the masks
+
+    Returns:
+        Stacked masks
+    """
+    masks = np.zeros((len(polygons), shape[0], shape[1]), dtype=np.uint8)
+    for i, polygon in enumerate(polygons):
+        if len(polygon) >= 3:
+            cv2.fillPoly(masks[i], [np.round(polygon).astype(np.int32).reshape(-1, 1, 2)], 1)
+    return masks.astype(bool)
+
+
+def mask_boxes(masks: np.ndarray) -> np.ndarray:
+    """
+    Bounding boxes of a stack of binary masks
+
+    Args:
+        masks: (N, H, W) bool masks
+
+    Returns:
+        (N, 4) int boxes as x1, y1, x2, y2 with exclusive ends (all zero for empty masks)
+    """
+    boxes = np.zeros((len(masks), 4), dtype=np.int64)
+    rows, cols = masks.any(axis=2), masks.any(axis=1)
+    for i in np.flatnonzero(rows.any(axis=1)):
+        ys, xs = np.flatnonzero(rows[i]), np.flatnonzero(cols[i])
+        boxes[i] = xs[0], ys[0], xs[-1] + 1, ys[-1] + 1
+    return boxes
+
+
+def mask_iou_matrix(masks_a: np.ndarray, masks_b: np.ndarray) -> np.ndarray:
+    """
+    Pairwise IoU between two stacks of binary masks
+
+    Only pairs whose bounding boxes overlap are compared, each within the
+    overlap of the two boxes, so memory stays at the size of the masks
+    themselves however many pairs there are.
+
+    Args:
+        masks_a: (N, H, W) bool masks
+        masks_b: (M, H, W) bool masks
+
+    Returns:
+        (N, M) IoU matrix
+    """
+    iou = np.zeros((len(masks_a), len(masks_b)), dtype=np.float32)
+    if len(masks_a) == 0 or len(masks_b) == 0:
+        return iou
+    masks_a, masks_b = masks_a.astype(bool, copy=False), masks_b.astype(bool, copy=False)
+    area_a = np.count_nonzero(masks_a.reshape(len(masks_a), -1), axis=1)
+    area_b = np.count_nonzero(masks_b.reshape(len(masks_b), -1), axis=1)
+    boxes_a, boxes_b = mask_boxes(masks_a), mask_boxes(masks_b)
+
+    x1 = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    y1 = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    x2 = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    y2 = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    for i, j in zip(*np.nonzero((x2 > x1) & (y2 > y1))):
+        window = (slice(y1[i, j], y2[i, j]), slice(x1[i, j], x2[i, j]))
+        intersection = np.count_nonzero(masks_a[i][window] & masks_b[j][window])
+        iou[i, j] = intersection / max(area_a[i] + area_b[j] - intersection, 1)
+    return iou
+
+
+def rle_iou_matrix(rles_a: List[Dict], rles_b: List[Dict]) -> np.ndarray:
+    """Pairwise IoU between two lists of same-size RLEs"""
+    if not rles_a or not rles_b:
+        return np.zeros((len(rles_a), len(rles_b)), dtype=np.float32)
+    shape = tuple(rles_a[0]['size'])
+    return mask_iou_matrix(rle_decode_many(rles_a, shape), rle_decode_many(rles_b, shape))
@@ -0,0 +1,238 @@
+"""
+Lightweight in-process timing spans and value observations with rolling percentiles and Prometheus export
+"""
+import os
+import time
+import tempfile
+import threading
+import functools
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Histogram bucket upper bounds in seconds (Prometheus 'le' labels)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+DEFAULT_WINDOW = 1000
+
+
+class StageStats:
+    """Durations of one stage: a rolling window for percentiles plus cumulative histogram counts"""
+
+    def __init__(self, window: int = DEFAULT_WINDOW):
+        self.recent = deque(maxlen=window)
+        self.bucket_counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+
+    def add(self, seconds: float):
+        self.recent.append(seconds)
+        self.count += 1
+        self.total += seconds
+        self.last = time.time()
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+                break
+
+    def summary(self) -> Dict:
+        recent = np.fromiter(self.recent, dtype=np.float64) * 1000
+        p50, p95, p99 = np.percentile(recent, (50, 95, 99)) if len(recent) else (0.0, 0.0, 0.0)
+        return {
+            'count': self.count,
+            'window': len(recent),
+            'p50_ms': round(float(p50), 2),
+            'p95_ms': round(float(p95), 2),
+            'p99_ms': round(float(p99), 2),
+            'mean_ms': round(float(recent.mean()), 2) if len(recent) else 0.0,
+            'max_ms': round(float(recent.max()), 2) if len(recent) else 0.0,
+            'total_s': round(self.total, 3),
+            'last': self.last
+        }
+
+
+class ValueStats:
+    """Unitless observations (batch sizes, queue depths) over a rolling window"""
+
+    def __init__(self, window: int = DEFAULT_WINDOW):
+        self.recent = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+
+    def add(self, value: float):
+        self.recent.append(value)
+        self.count += 1
+        self.total += value
+        self.last = time.time()
+
+    def summary(self) -> Dict:
+        recent = np.fromiter(self.recent, dtype=np.float64)
+        p50, p95, p99 = np.percentile(recent, (50, 95, 99)) if len(recent) else (0.0, 0.0, 0.0)
+        return {
+            'count': self.count,
+            'window': len(recent),
+            'p50': round(float(p50), 2),
+            'p95': round(float(p95), 2),
+            'p99': round(float(p99), 2),
+            'mean': round(float(recent.mean()), 2) if len(recent) else 0.0,
+            'max': round(float(recent.max()), 2) if len(recent) else 0.0,
+            'last': self.last
+        }
+
+
+# Module state survives Streamlit reruns (the module is imported once per process)
+_stages: Dict[str, StageStats] = {}
+_values: Dict[str, ValueStats] = {}
+_lock = threading.Lock()
+_window = DEFAULT_WINDOW
+_last_export = 0.0
+# Separate from _lock: prometheus_text takes _lock while the file is written
+_export_lock = threading.Lock()
+
+
+def configure(window: int = DEFAULT_WINDOW):
+    """Set the rolling window size for stages created from now on"""
+    global _window
+    _window = window
+
+
+def record(stage: str, seconds: float):
+    """Record a duration for a stage"""
+    with _lock:
+        stats = _stages.get(stage)
+        if stats is None:
+            stats = _stages[stage] = StageStats(_window)
+        stats.add(seconds)
+
+
+def observe(name: str, value: float):
+    """Record a unitless value (e.g. a batch size)"""
+    with _lock:
+        stats = _values.get(name)
+        if stats is None:
+            stats = _values[name] = ValueStats(_window)
+        stats.add(value)
+
+
+@contextmanager
+def span(stage: str):
+    """Time the enclosed block as one sample of a stage (also recorded when it raises)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def timed(stage: str):
+    """Decorator form of span"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_predict_speed(stage: str, results):
+    """Record ultralytics per-image preprocess/inference/postprocess times (reported in ms)"""
+    for result in results:
+        for phase, ms in (getattr(result, 'speed', None) or {}).items():
+            if ms is not None:
+                record(f"{stage}.{phase}", ms / 1000)
+
+
+def snapshot() -> List[Dict]:
+    """Per-stage summaries sorted by stage name"""
+    with _lock:
+        return [{'stage': stage, **stats.summary()} for stage, stats in sorted(_stages.items())]
+
+
+def value_snapshot() -> List[Dict]:
+    """Per-value summaries sorted by name"""
+    with _lock:
+        return [{'name': name, **stats.summary()} for name, stats in sorted(_values.items())]
+
+
+def reset():
+    with _lock:
+        _stages.clear()
+        _values.clear()
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text(prefix: str = 'virai') -> str:
+    """Prometheus text exposition: a duration histogram and rolling-quantile gauges per stage, a summary per value"""
+    with _lock:
+        stages = [(stage, list(stats.bucket_counts), stats.count, stats.total, stats.summary())
+                  for stage, stats in sorted(_stages.items())]
+        values = [(name, stats.count, stats.total, stats.summary()) for name, stats in sorted(_values.items())]
+
+    histogram = f"{prefix}_stage_duration_seconds"
+    quantiles = f"{prefix}_stage_duration_quantile_seconds"
+    lines = [f"# HELP {histogram} Duration of instrumented stages.",
+             f"# TYPE {histogram} histogram"]
+    for stage, bucket_counts, count, total, _ in stages:
+        label = f'stage="{_escape(stage)}"'
+        cumulative = 0
+        for bound, n in zip(BUCKETS, bucket_counts):
+            cumulative += n
+            lines.append(f'{histogram}_bucket{{{label},le="{bound}"}} {cumulative}')
+        lines.append(f'{histogram}_bucket{{{label},le="+Inf"}} {count}')
+        lines.append(f'{histogram}_sum{{{label}}} {total:.6f}')
+        lines.append(f'{histogram}_count{{{label}}} {count}')
+    lines += [f"# HELP {quantiles} Rolling-window duration quantiles of instrumented stages.",
+              f"# TYPE {quantiles} gauge"]
+    for stage, _, _, _, summary in stages:
+        label = f'stage="{_escape(stage)}"'
+        for quantile, key in (('0.5', 'p50_ms'), ('0.95', 'p95_ms'), ('0.99', 'p99_ms')):
+            lines.append(f'{quantiles}{{{label},quantile="{quantile}"}} {summary[key] / 1000:.6f}')
+    if values:
+        observed = f"{prefix}_observed_value"
+        lines += [f"# HELP {observed} Rolling-window quantiles of observed values.",
+                  f"# TYPE {observed} summary"]
+        for name, count, total, summary in values:
+            label = f'name="{_escape(name)}"'
+            for quantile, key in (('0.5', 'p50'), ('0.95', 'p95'), ('0.99', 'p99')):
+                lines.append(f'{observed}{{{label},quantile="{quantile}"}} {summary[key]}')
+            lines.append(f'{observed}_sum{{{label}}} {total}')
+            lines.append(f'{observed}_count{{{label}}} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def export_prometheus(path: str, prefix: str = 'virai') -> str:
+    """Write the Prometheus text file atomically (for node_exporter's textfile collector)"""
+    with _export_lock:
+        return _export_prometheus(path, prefix)
+
+
+def _export_prometheus(path: str, prefix: str = 'virai') -> str:
+    global _last_export
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    # A temp file of its own, in the same directory so os.replace stays atomic
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(prometheus_text(prefix))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    _last_export = time.time()
+    return path
+
+
+def maybe_export_prometheus(path: str, min_interval_s: float = 30.0) -> Optional[str]:
+    """Export unless the last export is more recent than min_interval_s"""
+    with _export_lock:
+        if time.time() - _last_export < min_interval_s or not (_stages or _values):
+            return None
+        return _export_prometheus(path)
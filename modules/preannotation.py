@@ -0,0 +1,173 @@
+"""
+Model-assisted pre-annotation: predicted masks converted to editable draft polygons
+"""
+import os
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from modules.geometry import simplify_polygon
+
+# Model loaded once per worker process
+_worker_model = None
+
+
+def draft_path(drafts_dir: str, image_name: str) -> str:
+    """Path of the draft file for an image"""
+    return os.path.join(drafts_dir, Path(image_name).stem + '.json')
+
+
+def load_draft(drafts_dir: str, image_name: str) -> Optional[Dict]:
+    """Load the draft annotations of an image, if any"""
+    path = draft_path(drafts_dir, image_name)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        draft = json.load(f)
+    for ann in draft['annotations']:
+        ann['polygon'] = [tuple(point) for point in ann['polygon']]
+    return draft
+
+
+def discard_draft(drafts_dir: str, image_name: str):
+    """Remove the draft of an image (after it was accepted or rejected)"""
+    path = draft_path(drafts_dir, image_name)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def result_to_annotations(result, epsilon_px: float = 2.0) -> List[Dict]:
+    """
+    Convert an ultralytics segmentation result to annotation polygons
+
+    Contours come from ultralytics (largest contour per mask, in original
+    image coordinates) and are reduced with Douglas-Peucker at epsilon_px.
+
+    Args:
+        result: Ultralytics result
+        epsilon_px: Maximum deviation of the simplified polygon in pixels
+
+    Returns:
+        Annotation dictionaries with 'class_id', 'polygon' and 'confidence'
+    """
+    if result.masks is None or len(result.masks) == 0:
+        return []
+    classes = result.boxes.cls.cpu().numpy().astype(int)
+    confidences = result.boxes.conf.cpu().numpy()
+
+    annotations = []
+    for class_id, confidence, contour in zip(classes, confidences, result.masks.xy):
+        if len(contour) < 3:
+            continue
+        polygon = np.round(simplify_polygon(contour, epsilon_px)).astype(int)
+        annotations.append({
+            'class_id': int(class_id),
+            'polygon': [tuple(point) for point in polygon.tolist()],
+            'confidence': round(float(confidence), 4)
+        })
+    return annotations
+
+
+def _init_worker(model_path: str, threads: int):
+    import torch
+    from ultralytics import YOLO
+
+    global _worker_model
+    torch.set_num_threads(threads)
+    _worker_model = YOLO(model_path, task='segment')
+
+
+def _preannotate_chunk(image_paths: List[str], drafts_dir: str, model_name: str,
+                       predict_args: Dict, epsilon_px: float, batch_size: int) -> Dict[str, int]:
+    """Pre-annotate a chunk of images in a worker process; returns polygon counts per image"""
+    counts = {}
+    for start in range(0, len(image_paths), batch_size):
+        batch = image_paths[start:start + batch_size]
+        results = _worker_model.predict(batch, verbose=False, **predict_args)
+        for path, result in zip(batch, results):
+            image_name = os.path.basename(path)
+            height, width = result.orig_shape
+            annotations = result_to_annotations(result, epsilon_px)
+            draft = {
+                'image': image_name,
+                'model': model_name,
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'width': int(width),
+                'height': int(height),
+                'annotations': annotations
+            }
+            tmp_path = draft_path(drafts_dir, image_name) + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(draft, f)
+            os.replace(tmp_path, draft_path(drafts_dir, image_name))
+            counts[image_name] = len(annotations)
+    return counts
+
+
+def preannotate_images(job, model_path: str, image_paths: List[str], drafts_dir: str,
+                       conf: float = 0.25, iou: float = 0.45, imgsz: Optional[int] = None,
+                       epsilon_px: float = 2.0, n_workers: Optional[int] = None,
+                       threads_per_worker: int = 2, chunk_size: int = 32,
+                       batch_size: int = 4, overwrite: bool = False) -> Dict:
+    """
+    Background job: write draft annotations for many films with a worker pool
+
+    Each worker process loads the model once and handles chunks of images,
+    predicting in batches. Films that already have a draft are skipped unless
+    overwrite is set.
+
+    Args:
+        job: JobContext from modules.jobs
+        model_path: Model used for pre-annotation
+        image_paths: Films to pre-annotate
+        drafts_dir: Directory for draft files
+        conf: Confidence threshold for draft polygons
+        iou: NMS IoU threshold
+        imgsz: Inference size (model default if None)
+        epsilon_px: Polygon simplification tolerance in pixels
+        n_workers: Worker processes (default: cores / threads_per_worker)
+        threads_per_worker: Torch threads per worker
+        chunk_size: Images per worker task
+        batch_size: Images per predict call
+        overwrite: Replace existing drafts
+
+    Returns:
+        Summary with the number of films and polygons drafted
+    """
+    os.makedirs(drafts_dir, exist_ok=True)
+    if not overwrite:
+        image_paths = [p for p in image_paths
+                       if not os.path.exists(draft_path(drafts_dir, os.path.basename(p)))]
+    if not image_paths:
+        return {'films': 0, 'polygons': 0}
+
+    predict_args = {'conf': conf, 'iou': iou}
+    if imgsz:
+        predict_args['imgsz'] = imgsz
+    n_workers = n_workers or max(1, (os.cpu_count() or 1) // max(1, threads_per_worker))
+    n_workers = min(n_workers, (len(image_paths) + chunk_size - 1) // chunk_size)
+    chunks = [image_paths[i:i + chunk_size] for i in range(0, len(image_paths), chunk_size)]
+    model_name = os.path.basename(model_path)
+
+    done = 0
+    counts = {}
+    job.update(0.0, f"Pre-annotating {len(image_paths)} films with {n_workers} workers")
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=context,
+                             initializer=_init_worker,
+                             initargs=(model_path, threads_per_worker)) as pool:
+        futures = [pool.submit(_preannotate_chunk, chunk, drafts_dir, model_name,
+                               predict_args, epsilon_px, batch_size)
+                   for chunk in chunks]
+        for future in as_completed(futures):
+            chunk_counts = future.result()
+            counts.update(chunk_counts)
+            done += len(chunk_counts)
+            job.update(done / len(image_paths), f"Drafted {done}/{len(image_paths)} films")
+
+    return {'films': len(counts), 'polygons': sum(counts.values())}
@@ -0,0 +1,126 @@
+"""
+Streamlit-free batch prediction with compact, JSON-serializable results
+"""
+import os
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from modules.masks import rle_encode, rle_decode_many, polygons_to_masks
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def collect_images(sources: Sequence[str]) -> List[str]:
+    """Expand files and directories into a sorted list of image paths"""
+    image_paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            image_paths.extend(os.path.join(source, f) for f in sorted(os.listdir(source))
+                               if f.lower().endswith(IMAGE_EXTENSIONS))
+        elif os.path.isfile(source):
+            image_paths.append(source)
+        else:
+            raise FileNotFoundError(f"Image source not found: {source}")
+    return image_paths
+
+
+def result_to_record(result, class_names: Sequence[str], mask_format: str = 'rle',
+                     image_name: Optional[str] = None) -> Dict:
+    """
+    Convert an ultralytics segmentation result into a compact record
+
+    Args:
+        result: Ultralytics result
+        class_names: Class names by id
+        mask_format: 'rle' (column-major RLE at original resolution, see
+            modules.masks) or 'polygon' (contour in original pixels)
+        image_name: Name to record (default: from the result path)
+
+    Returns:
+        Dictionary with the image size and one entry per detection
+    """
+    height, width = result.orig_shape
+    record = {
+        'image': image_name or os.path.basename(result.path or ''),
+        'width': int(width),
+        'height': int(height),
+        'detections': []
+    }
+    if result.masks is None or len(result.masks) == 0:
+        return record
+
+    classes = result.boxes.cls.cpu().numpy().astype(int)
+    confidences = result.boxes.conf.cpu().numpy()
+    boxes = result.boxes.xyxy.cpu().numpy()
+    for class_id, confidence, box, polygon in zip(classes, confidences, boxes, result.masks.xy):
+        detection = {
+            'class_id': int(class_id),
+            'class_name': class_names[class_id] if class_id < len(class_names) else str(class_id),
+            'confidence': round(float(confidence), 4),
+            'box': np.round(box, 1).tolist()
+        }
+        if mask_format == 'rle':
+            detection['mask'] = rle_encode(polygons_to_masks([polygon], (height, width))[0])
+        else:
+            detection['polygon'] = np.round(polygon, 1).tolist()
+        record['detections'].append(detection)
+    return record
+
+
+def record_to_arrays(record: Dict, shape: Optional[Tuple[int, int]] = None):
+    """
+    Expand a record from result_to_record back into arrays for drawing and saving
+
+    Args:
+        record: Record from result_to_record
+        shape: (height, width) to scale masks and boxes to, e.g. a
+            thumbnail's (default: original resolution)
+
+    Returns:
+        (N, H, W) bool masks and (N, 6) boxes as x1, y1, x2, y2,
+        confidence, class id
+    """
+    detections = record['detections']
+    shape = tuple(shape or (record['height'], record['width']))
+    scale = np.array([shape[1] / record['width'], shape[0] / record['height']], dtype=np.float32)
+    if detections and 'mask' in detections[0]:
+        masks = rle_decode_many([d['mask'] for d in detections], shape)
+    else:
+        masks = polygons_to_masks([np.asarray(d.get('polygon', []), dtype=np.float32).reshape(-1, 2) * scale
+                                   for d in detections], shape)
+    boxes = np.array([d['box'] + [d['confidence'], d['class_id']] for d in detections],
+                     dtype=np.float32).reshape(-1, 6)
+    boxes[:, :4] *= np.tile(scale, 2)
+    return masks, boxes
+
+
+def predict_images(model, image_paths: Sequence, class_names: Sequence[str], batch_size: int = 8,
+                   class_thresholds: Optional[List[float]] = None, mask_format: str = 'rle',
+                   **predict_args) -> Iterator[Dict]:
+    """
+    Predict images in batches and yield one compact record per image
+
+    Args:
+        model: Loaded YOLO model
+        image_paths: Image paths
+        class_names: Class names by id
+        batch_size: Images per predict call
+        class_thresholds: Per-class confidence thresholds (overrides conf)
+        mask_format: 'rle' or 'polygon'
+        **predict_args: Extra predict arguments (conf, iou, imgsz, ...)
+
+    Yields:
+        Records from result_to_record
+    """
+    from modules.calibration import predict_with_class_thresholds
+
+    for start in range(0, len(image_paths), batch_size):
+        batch = list(image_paths[start:start + batch_size])
+        if class_thresholds:
+            predict_args.pop('conf', None)
+            results = predict_with_class_thresholds(model, batch, class_thresholds, **predict_args)
+        else:
+            results = model.predict(batch, verbose=False, **predict_args)
+        for path, result in zip(batch, results):
+            yield result_to_record(result, class_names, mask_format, os.path.basename(str(path)))
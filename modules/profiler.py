@@ -0,0 +1,176 @@
+"""
+Opt-in per-rerun profiling: cProfile and tracemalloc captures kept in a bounded ring buffer
+"""
+import io
+import os
+import json
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+REPORT_SUFFIX = '.json'
+STATS_SUFFIX = '.prof'
+
+# tracemalloc is process-wide; concurrent sessions share one trace
+_trace_lock = threading.Lock()
+_trace_users = 0
+
+
+def _start_trace(frames: int) -> bool:
+    """Start tracemalloc unless someone else already runs it; returns whether we own a reference"""
+    global _trace_users
+    with _trace_lock:
+        if _trace_users == 0:
+            if tracemalloc.is_tracing():
+                return False  # started outside this module; leave it alone
+            tracemalloc.start(frames)
+        _trace_users += 1
+        return True
+
+
+def _stop_trace():
+    global _trace_users
+    with _trace_lock:
+        _trace_users -= 1
+        if _trace_users == 0:
+            tracemalloc.stop()
+
+
+def _top_functions(profile: cProfile.Profile, top_n: int) -> List[Dict]:
+    stats = pstats.Stats(profile)
+    rows = []
+    for (filename, line, name), (_, n_calls, total, cumulative, _) in stats.stats.items():
+        rows.append({'function': f"{os.path.basename(filename)}:{line}({name})",
+                     'calls': n_calls,
+                     'tottime_s': round(total, 4),
+                     'cumtime_s': round(cumulative, 4)})
+    return sorted(rows, key=lambda r: r['cumtime_s'], reverse=True)[:top_n]
+
+
+def _top_allocations(snapshot: tracemalloc.Snapshot, top_n: int) -> List[Dict]:
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ])
+    return [{'location': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+             'size_kb': round(stat.size / 1024, 1),
+             'count': stat.count}
+            for stat in snapshot.statistics('lineno')[:top_n]]
+
+
+def _prune(profiles_dir: str, max_entries: int):
+    """Keep only the newest max_entries captures"""
+    reports = sorted(f for f in os.listdir(profiles_dir) if f.endswith(REPORT_SUFFIX))
+    for name in reports[:max(0, len(reports) - max_entries)]:
+        for suffix in (REPORT_SUFFIX, STATS_SUFFIX):
+            path = os.path.join(profiles_dir, name[:-len(REPORT_SUFFIX)] + suffix)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def profile_call(label: str, fn: Callable, *args, profiles_dir: str = 'outputs/profiles',
+                 top_n: int = 30, max_entries: int = 50, trace_frames: int = 1, **kwargs):
+    """
+    Run fn under cProfile and tracemalloc and store the capture
+
+    The capture is written even when fn raises (Streamlit's st.rerun and
+    st.stop work by raising), and the exception is propagated.
+
+    Args:
+        label: What was profiled (e.g. the page name)
+        fn: Callable to profile
+        profiles_dir: Ring buffer directory
+        top_n: Functions and allocation sites kept in the report
+        max_entries: Captures kept in the ring buffer
+        trace_frames: Frames stored per allocation by tracemalloc
+
+    Returns:
+        fn's return value
+    """
+    profile = cProfile.Profile()
+    owns_trace = _start_trace(trace_frames)
+    if owns_trace:
+        tracemalloc.reset_peak()
+    started = datetime.now()
+    start_wall, start_cpu = time.perf_counter(), time.thread_time()
+    outcome = 'completed'
+    try:
+        profile.enable()
+    except ValueError:
+        # Another profiler is active in this thread; run unprofiled
+        profile = None
+    try:
+        return fn(*args, **kwargs)
+    except BaseException as e:
+        outcome = type(e).__name__
+        raise
+    finally:
+        if profile is not None:
+            profile.disable()
+        duration = time.perf_counter() - start_wall
+        cpu = time.thread_time() - start_cpu
+        allocations, peak_mb = [], None
+        if owns_trace:
+            peak_mb = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 2)
+            allocations = _top_allocations(tracemalloc.take_snapshot(), top_n)
+            _stop_trace()
+        if profile is not None:
+            _save_capture(profiles_dir, max_entries, profile, {
+                'label': label,
+                'started': started.isoformat(timespec='milliseconds'),
+                'duration_s': round(duration, 4),
+                'cpu_s': round(cpu, 4),
+                'peak_traced_mb': peak_mb,
+                'outcome': outcome,
+                'pid': os.getpid(),
+                'top_functions': _top_functions(profile, top_n),
+                'top_allocations': allocations
+            })
+
+
+def _save_capture(profiles_dir: str, max_entries: int, profile: cProfile.Profile, report: Dict):
+    os.makedirs(profiles_dir, exist_ok=True)
+    capture_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{report['label']}"
+    report['id'] = capture_id
+    profile.dump_stats(os.path.join(profiles_dir, capture_id + STATS_SUFFIX))
+    report_path = os.path.join(profiles_dir, capture_id + REPORT_SUFFIX)
+    tmp_path = report_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp_path, report_path)
+    _prune(profiles_dir, max_entries)
+
+
+def list_profiles(profiles_dir: str, sort_by: str = 'duration_s') -> List[Dict]:
+    """Stored capture reports, slowest first (or newest first with sort_by='started')"""
+    if not os.path.exists(profiles_dir):
+        return []
+    reports = []
+    for name in os.listdir(profiles_dir):
+        if name.endswith(REPORT_SUFFIX):
+            try:
+                with open(os.path.join(profiles_dir, name), 'r', encoding='utf-8') as f:
+                    reports.append(json.load(f))
+            except (OSError, json.JSONDecodeError):
+                continue  # pruned or being written
+    return sorted(reports, key=lambda r: r[sort_by], reverse=True)
+
+
+def stats_path(profiles_dir: str, capture_id: str) -> str:
+    return os.path.join(profiles_dir, capture_id + STATS_SUFFIX)
+
+
+def format_stats(profiles_dir: str, capture_id: str, sort: str = 'cumulative',
+                 limit: int = 40) -> Optional[str]:
+    """pstats text listing of a capture"""
+    path = stats_path(profiles_dir, capture_id)
+    if not os.path.exists(path):
+        return None
+    stream = io.StringIO()
+    pstats.Stats(path, stream=stream).strip_dirs().sort_stats(sort).print_stats(limit)
+    return stream.getvalue()
@@ -0,0 +1,247 @@
+"""
+Structured channel pruning of trained segmentation models
+"""
+import os
+import copy
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+import numpy as np
+import torch
+import torch.nn as nn
+from ultralytics import YOLO
+from ultralytics.models.yolo.segment import SegmentationTrainer
+
+from modules.trainer import run_training, publish_model, DEFAULT_METRIC
+
+# Modules whose output channels are never pruned: the segmentation head has
+# fixed output layouts and the attention blocks tie channels to head sizes
+_IGNORED_MODULES = ('Segment', 'Detect', 'C2PSA', 'PSABlock', 'Attention')
+
+
+def _split_conv(conv: nn.Module, start: int, end: int) -> nn.Module:
+    """Copy of an ultralytics Conv keeping output channels [start, end)"""
+    new = copy.deepcopy(conv)
+    src = conv.conv
+    new.conv = nn.Conv2d(src.in_channels, end - start, src.kernel_size, src.stride,
+                         src.padding, src.dilation, src.groups, bias=src.bias is not None)
+    new.conv.weight.data = src.weight.data[start:end].clone()
+    if src.bias is not None:
+        new.conv.bias.data = src.bias.data[start:end].clone()
+    if hasattr(conv, 'bn'):
+        bn = conv.bn
+        new.bn = nn.BatchNorm2d(end - start, eps=bn.eps, momentum=bn.momentum)
+        new.bn.weight.data = bn.weight.data[start:end].clone()
+        new.bn.bias.data = bn.bias.data[start:end].clone()
+        new.bn.running_mean = bn.running_mean[start:end].clone()
+        new.bn.running_var = bn.running_var[start:end].clone()
+    return new
+
+
+class C2fSplit(nn.Module):
+    """
+    C2f/C3k2 block with its chunked cv1 split into two convs
+
+    Equivalent to the original block, but without the tensor.chunk that the
+    pruning dependency graph cannot follow. Lives in this module so pruned
+    checkpoints unpickle through the normal YOLO(...) loading path.
+    """
+
+    def __init__(self, block: nn.Module):
+        super().__init__()
+        self.c = block.c
+        self.cv0 = _split_conv(block.cv1, 0, self.c)
+        self.cv1 = _split_conv(block.cv1, self.c, 2 * self.c)
+        self.cv2 = block.cv2
+        self.m = block.m
+        # Graph bookkeeping used by ultralytics' forward pass
+        for attr in ('i', 'f', 'type', 'np'):
+            if hasattr(block, attr):
+                setattr(self, attr, getattr(block, attr))
+
+    def forward(self, x):
+        y = [self.cv0(x), self.cv1(x)]
+        y.extend(m(y[-1]) for m in self.m)
+        return self.cv2(torch.cat(y, 1))
+
+
+def _replace_c2f_blocks(module: nn.Module):
+    """Replace C2f-family blocks with C2fSplit, recursively"""
+    from ultralytics.nn.modules.block import C2f
+
+    for name, child in module.named_children():
+        if isinstance(child, C2f):
+            setattr(module, name, C2fSplit(child))
+        else:
+            _replace_c2f_blocks(child)
+
+
+def _module_latency_ms(model: nn.Module, imgsz: int, runs: int = 5) -> float:
+    """Median CPU forward latency of a bare model"""
+    model.eval()
+    x = torch.zeros(1, 3, imgsz, imgsz)
+    timings = []
+    with torch.no_grad():
+        model(x)
+        for _ in range(runs):
+            start = time.perf_counter()
+            model(x)
+            timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def prune_channels(model: nn.Module, imgsz: int, target_flops_ratio: Optional[float] = None,
+                   target_latency_ms: Optional[float] = None, max_pruning_ratio: float = 0.8,
+                   iterative_steps: int = 20, round_to: int = 8,
+                   progress_callback=None) -> Dict:
+    """
+    Remove low-importance channels (L2 magnitude) until a budget is met
+
+    Args:
+        model: Segmentation model (pruned in place)
+        imgsz: Input size used for tracing, FLOP counting and latency
+        target_flops_ratio: Stop when FLOPs <= this fraction of the original
+        target_latency_ms: Stop when CPU forward latency <= this many ms
+        max_pruning_ratio: Upper bound on the fraction of channels removed per layer
+        iterative_steps: Number of pruning steps to reach max_pruning_ratio
+        round_to: Keep channel counts multiples of this
+        progress_callback: Called as (step, iterative_steps, stats)
+
+    Returns:
+        Dictionary with FLOPs/params/latency before and after and the steps taken
+    """
+    import torch_pruning as tp
+
+    if target_flops_ratio is None and target_latency_ms is None:
+        raise ValueError("Set a FLOP ratio or latency budget")
+
+    _replace_c2f_blocks(model)
+    model.float().eval()
+    for param in model.parameters():
+        param.requires_grad = True
+
+    example_inputs = torch.zeros(1, 3, imgsz, imgsz)
+    base_macs, base_params = tp.utils.count_ops_and_params(model, example_inputs)
+    base_latency = _module_latency_ms(model, imgsz)
+
+    ignored = [m for m in model.modules() if type(m).__name__ in _IGNORED_MODULES]
+    pruner = tp.pruner.MetaPruner(
+        model,
+        example_inputs,
+        importance=tp.importance.MagnitudeImportance(p=2),
+        pruning_ratio=max_pruning_ratio,
+        iterative_steps=iterative_steps,
+        ignored_layers=ignored,
+        round_to=round_to
+    )
+
+    stats = {'macs': base_macs, 'params': base_params, 'latency_ms': base_latency}
+    steps = 0
+    for step in range(1, iterative_steps + 1):
+        pruner.step()
+        steps = step
+        macs, params = tp.utils.count_ops_and_params(model, example_inputs)
+        stats = {'macs': macs, 'params': params}
+        if target_latency_ms is not None:
+            stats['latency_ms'] = _module_latency_ms(model, imgsz)
+        if progress_callback is not None:
+            progress_callback(step, iterative_steps, stats)
+
+        flops_met = target_flops_ratio is None or macs <= target_flops_ratio * base_macs
+        latency_met = target_latency_ms is None or stats['latency_ms'] <= target_latency_ms
+        if flops_met and latency_met:
+            break
+
+    if 'latency_ms' not in stats:
+        stats['latency_ms'] = _module_latency_ms(model, imgsz)
+
+    return {
+        'macs_before': base_macs,
+        'macs_after': stats['macs'],
+        'params_before': base_params,
+        'params_after': stats['params'],
+        'latency_before_ms': base_latency,
+        'latency_after_ms': stats['latency_ms'],
+        'flops_ratio': stats['macs'] / base_macs,
+        'steps': steps,
+        'target_flops_ratio': target_flops_ratio,
+        'target_latency_ms': target_latency_ms
+    }
+
+
+class PrunedSegmentationTrainer(SegmentationTrainer):
+    """Trainer that fine-tunes the given (pruned) model instead of rebuilding it from YAML"""
+
+    def get_model(self, cfg=None, weights=None, verbose=True):
+        if not isinstance(weights, nn.Module):
+            raise ValueError("Pruned fine-tuning needs the pruned model as weights")
+        return weights
+
+
+def prune_model(trained_models_dir: str, model_file: str, dataset_dir: str,
+                training_results_dir: str, target_flops_ratio: Optional[float] = None,
+                target_latency_ms: Optional[float] = None, max_pruning_ratio: float = 0.8,
+                iterative_steps: int = 20, finetune_epochs: int = 10,
+                metric: str = DEFAULT_METRIC, progress_callback=None, **train_args) -> Dict:
+    """
+    Prune a trained model to a budget, fine-tune it briefly and register it
+
+    Args:
+        trained_models_dir: Directory with trained models
+        model_file: Parent model file name inside trained_models_dir
+        dataset_dir: Prepared dataset directory
+        training_results_dir: Directory that holds training runs
+        target_flops_ratio: FLOP budget as a fraction of the parent's FLOPs
+        target_latency_ms: CPU forward latency budget in ms
+        max_pruning_ratio: Upper bound on the fraction of channels removed per layer
+        iterative_steps: Number of pruning steps
+        finetune_epochs: Fine-tuning epochs after pruning
+        metric: Validation metric to report as 'score'
+        progress_callback: Called as (step, iterative_steps, stats) while pruning
+        **train_args: Extra arguments passed to YOLO.train for fine-tuning
+
+    Returns:
+        Dictionary with pruning stats, the fine-tuning run and the published model file
+    """
+    parent_path = os.path.join(trained_models_dir, model_file)
+    yolo = YOLO(parent_path)
+    imgsz = train_args.pop('imgsz', None) or yolo.overrides.get('imgsz') or 640
+
+    pruning = prune_channels(
+        yolo.model, imgsz,
+        target_flops_ratio=target_flops_ratio,
+        target_latency_ms=target_latency_ms,
+        max_pruning_ratio=max_pruning_ratio,
+        iterative_steps=iterative_steps,
+        progress_callback=progress_callback
+    )
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    run = run_training(
+        yolo,
+        os.path.join(dataset_dir, 'data.yaml'),
+        training_results_dir,
+        f"prune_{timestamp}",
+        metric=metric,
+        record={'base_model': model_file, 'pruned_from': model_file, 'pruning': pruning,
+                'timestamp': timestamp},
+        trainer=PrunedSegmentationTrainer,
+        epochs=finetune_epochs,
+        imgsz=imgsz,
+        warmup_epochs=0,
+        **train_args
+    )
+
+    pruned_file = publish_model(
+        run['best_weights'],
+        trained_models_dir,
+        timestamp,
+        origin='pruning',
+        parent=model_file,
+        source_run=run['run_dir'],
+        base_model=model_file,
+        pruning=pruning,
+        metrics=run['metrics']
+    )
+    return {'pruning': pruning, 'run': run, 'published': pruned_file}
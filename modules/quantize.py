@@ -0,0 +1,231 @@
+"""
+Post-training int8 quantization of trained models for CPU deployment
+"""
+import os
+import shutil
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from modules.registry import (
+    get_model_entry, register_model, evaluate_per_class_map, measure_cpu_latency
+)
+
+
+def letterbox(image: np.ndarray, imgsz: int) -> np.ndarray:
+    """Resize keeping aspect ratio and pad to imgsz x imgsz (ultralytics-style, pad value 114)"""
+    h, w = image.shape[:2]
+    scale = min(imgsz / h, imgsz / w)
+    new_w, new_h = int(round(w * scale)), int(round(h * scale))
+    resized = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    padded = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top = (imgsz - new_h) // 2
+    left = (imgsz - new_w) // 2
+    padded[top:top + new_h, left:left + new_w] = resized
+    return padded
+
+
+def preprocess_for_onnx(image_path: str, imgsz: int) -> Optional[np.ndarray]:
+    """Load an image as a 1x3xHxW float32 RGB tensor in [0, 1] (None if it cannot be decoded)"""
+    image = cv2.imread(image_path, cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    image = cv2.cvtColor(letterbox(image, imgsz), cv2.COLOR_BGR2RGB)
+    return (image.transpose(2, 0, 1)[None].astype(np.float32) / 255.0)
+
+
+class ImageCalibrationReader:
+    """onnxruntime CalibrationDataReader over a directory of images (unreadable images are skipped)"""
+
+    def __init__(self, image_paths: List[str], input_name: str, imgsz: int):
+        self.image_paths = image_paths
+        self.input_name = input_name
+        self.imgsz = imgsz
+        self._index = 0
+
+    def get_next(self):
+        while self._index < len(self.image_paths):
+            image_path = self.image_paths[self._index]
+            self._index += 1
+            tensor = preprocess_for_onnx(image_path, self.imgsz)
+            if tensor is not None:
+                return {self.input_name: tensor}
+        return None
+
+    def rewind(self):
+        self._index = 0
+
+
+def export_onnx(model_path: str, imgsz: int) -> str:
+    """Export a .pt model to a static-shape fp32 ONNX model next to it"""
+    from ultralytics import YOLO
+
+    return YOLO(model_path).export(format='onnx', imgsz=imgsz, dynamic=False,
+                                   simplify=True, verbose=False)
+
+
+def quantize_onnx(fp32_path: str, int8_path: str, method: str = 'static',
+                  calibration_images: Optional[List[str]] = None, imgsz: int = 640,
+                  per_channel: bool = True) -> str:
+    """
+    Quantize an ONNX model to int8 with the ONNX Runtime quantizer
+
+    Args:
+        fp32_path: Path to fp32 ONNX model
+        int8_path: Output path
+        method: 'static' (calibrated activations, QDQ) or 'dynamic' (weights only)
+        calibration_images: Image paths for static calibration
+        imgsz: Model input size
+        per_channel: Per-channel weight quantization
+
+    Returns:
+        Path to int8 model
+    """
+    import onnx
+    import onnxruntime
+    from onnxruntime.quantization import (
+        quantize_static, quantize_dynamic, QuantFormat, QuantType
+    )
+
+    if method == 'dynamic':
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8,
+                         per_channel=per_channel)
+    else:
+        if not calibration_images:
+            raise ValueError("Static quantization needs calibration images")
+        session = onnxruntime.InferenceSession(fp32_path, providers=['CPUExecutionProvider'])
+        reader = ImageCalibrationReader(calibration_images, session.get_inputs()[0].name, imgsz)
+        quantize_static(fp32_path, int8_path, reader,
+                        quant_format=QuantFormat.QDQ,
+                        activation_type=QuantType.QUInt8,
+                        weight_type=QuantType.QInt8,
+                        per_channel=per_channel)
+
+    # Keep ultralytics metadata (names, stride, imgsz, task) so YOLO() can load it
+    fp32_model = onnx.load(fp32_path)
+    int8_model = onnx.load(int8_path)
+    del int8_model.metadata_props[:]
+    int8_model.metadata_props.extend(fp32_model.metadata_props)
+    onnx.save(int8_model, int8_path)
+    return int8_path
+
+
+def _calibration_images(val_images_dir: str, limit: int) -> List[str]:
+    if not os.path.exists(val_images_dir):
+        return []
+    images = sorted(f for f in os.listdir(val_images_dir)
+                    if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')))
+    return [os.path.join(val_images_dir, f) for f in images[:limit]]
+
+
+def quantize_model(trained_models_dir: str, model_file: str, dataset_dir: str,
+                   method: str = 'static', max_map_drop: float = 0.01,
+                   calibration_limit: int = 100, per_channel: bool = True,
+                   latency_runs: int = 20, include_pt: bool = False) -> Dict:
+    """
+    Quantize a trained model to int8 and publish it only if accuracy holds
+
+    The fp32 ONNX export and its int8 quantization are both validated (mask
+    mAP) and timed on CPU, so the comparison isolates quantization from the
+    change of runtime; the int8 artifact is registered only if the mask mAP
+    drop is within max_map_drop.
+
+    Args:
+        trained_models_dir: Directory with trained models
+        model_file: fp32 .pt model file name inside trained_models_dir
+        dataset_dir: Prepared dataset (val split is used for calibration and validation)
+        method: 'static' or 'dynamic'
+        max_map_drop: Maximum allowed absolute mask mAP50-95 drop
+        calibration_limit: Maximum number of calibration images
+        per_channel: Per-channel weight quantization
+        latency_runs: Number of timed predictions per model
+        include_pt: Also validate and time the .pt model (reported as 'pt', not gated on)
+
+    Returns:
+        Report with fp32/int8 metrics and latency, the drop, the validation
+        images that could not be decoded, and the published file (or None)
+    """
+    from ultralytics import YOLO
+
+    model_path = os.path.join(trained_models_dir, model_file)
+    data_yaml = os.path.join(dataset_dir, 'data.yaml')
+    entry = get_model_entry(trained_models_dir, model_file) or {}
+    pt_model = YOLO(model_path)
+    imgsz = entry.get('imgsz') or pt_model.overrides.get('imgsz') or 640
+
+    val_images = _calibration_images(os.path.join(dataset_dir, 'images', 'val'), calibration_limit)
+    if not val_images:
+        raise FileNotFoundError("Validation split is empty; prepare the dataset first")
+    # Films that fail to decode would stop calibration and latency runs; leave them out
+    unreadable = [path for path in val_images if cv2.imread(path, cv2.IMREAD_UNCHANGED) is None]
+    val_images = [path for path in val_images if path not in unreadable]
+    if not val_images:
+        raise ValueError("No validation image could be decoded for calibration")
+
+    # Work on copies so the exported/quantized files never shadow the published model
+    stem = os.path.splitext(model_file)[0]
+    work_dir = os.path.join(trained_models_dir, '.quantization', stem)
+    os.makedirs(work_dir, exist_ok=True)
+    work_model = os.path.join(work_dir, model_file)
+    shutil.copy2(model_path, work_model)
+    fp32_onnx = export_onnx(work_model, imgsz)
+    int8_onnx = quantize_onnx(fp32_onnx, os.path.join(work_dir, f"{stem}_int8.onnx"),
+                              method, val_images, imgsz, per_channel)
+
+    fp32_model = YOLO(fp32_onnx, task='segment')
+    int8_model = YOLO(int8_onnx, task='segment')
+    fp32_metrics = evaluate_per_class_map(fp32_model, data_yaml, imgsz)
+    int8_metrics = evaluate_per_class_map(int8_model, data_yaml, imgsz)
+    latency_images = val_images[:latency_runs]
+    fp32_latency = measure_cpu_latency(fp32_model, imgsz, latency_images, latency_runs)
+    int8_latency = measure_cpu_latency(int8_model, imgsz, latency_images, latency_runs)
+
+    drop = fp32_metrics['mask_map'] - int8_metrics['mask_map']
+    report = {
+        'parent': model_file,
+        'method': method,
+        'imgsz': imgsz,
+        'fp32': {**fp32_metrics, 'latency': fp32_latency},
+        'int8': {**int8_metrics, 'latency': int8_latency},
+        'map_drop': drop,
+        'max_map_drop': max_map_drop,
+        'unreadable': [os.path.basename(path) for path in unreadable],
+        'published': None
+    }
+    if include_pt:
+        report['pt'] = {**evaluate_per_class_map(pt_model, data_yaml, imgsz),
+                        'latency': measure_cpu_latency(pt_model, imgsz, latency_images, latency_runs)}
+
+    if drop > max_map_drop:
+        return report
+
+    # Never overwrite an earlier int8 artifact of the same parent (or its registry entry)
+    int8_file = f"{stem}_int8.onnx"
+    suffix = 1
+    while True:
+        try:
+            with open(os.path.join(trained_models_dir, int8_file), 'xb'):
+                break
+        except FileExistsError:
+            suffix += 1
+            int8_file = f"{stem}_int8_{suffix}.onnx"
+    shutil.copy2(int8_onnx, os.path.join(trained_models_dir, int8_file))
+    register_model(
+        trained_models_dir, int8_file,
+        origin='quantization',
+        parent=model_file,
+        precision='int8',
+        quantization={'method': method, 'per_channel': per_channel,
+                      'calibration_images': len(val_images)},
+        base_model=entry.get('base_model'),
+        source_run=entry.get('source_run'),
+        dataset_manifest_hash=entry.get('dataset_manifest_hash'),
+        imgsz=imgsz,
+        latency=int8_latency,
+        file_size_mb=os.path.getsize(int8_onnx) / (1024 * 1024),
+        evaluated_on=data_yaml,
+        **int8_metrics
+    )
+    report['published'] = int8_file
+    return report
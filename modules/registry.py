@@ -0,0 +1,314 @@
+"""
+Model registry: an index of trained models and their metadata
+"""
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of one process are serialized
+    fcntl = None
+
+REGISTRY_FILE = 'registry.json'
+
+# Model artifacts tracked by the registry
+MODEL_EXTENSIONS = ('.pt', '.onnx')
+
+_registry_lock = threading.Lock()
+
+
+@contextmanager
+def _locked_registry(trained_models_dir: str):
+    """
+    Serialize registry read-modify-write cycles
+
+    The Streamlit server, CLI runs, the API server and sweep workers all
+    update the same registry.json, so the thread lock is paired with an
+    advisory file lock that also holds across processes.
+    """
+    with _registry_lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(trained_models_dir, exist_ok=True)
+        with open(os.path.join(trained_models_dir, REGISTRY_FILE + '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def load_registry(trained_models_dir: str) -> Dict[str, Dict]:
+    """
+    Load registry index
+
+    Args:
+        trained_models_dir: Directory with trained models
+
+    Returns:
+        Dictionary of model file name -> metadata
+    """
+    registry_path = os.path.join(trained_models_dir, REGISTRY_FILE)
+    if not os.path.exists(registry_path):
+        return {}
+    with open(registry_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_registry(trained_models_dir: str, registry: Dict[str, Dict]):
+    """Save registry index atomically"""
+    os.makedirs(trained_models_dir, exist_ok=True)
+    registry_path = os.path.join(trained_models_dir, REGISTRY_FILE)
+    tmp_path = registry_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(registry, f, indent=2)
+    os.replace(tmp_path, registry_path)
+
+
+def register_model(trained_models_dir: str, model_file: str, **metadata) -> Dict:
+    """
+    Add or update a model entry in the registry
+
+    The file size is recorded whenever the model file exists, so entries are
+    complete even if profiling the model fails later.
+
+    Args:
+        trained_models_dir: Directory with trained models
+        model_file: Model file name inside trained_models_dir
+        **metadata: Fields to record (source_run, metrics, hyperparameters, ...)
+
+    Returns:
+        The registry entry
+    """
+    model_path = os.path.join(trained_models_dir, model_file)
+    with _locked_registry(trained_models_dir):
+        registry = load_registry(trained_models_dir)
+        entry = registry.get(model_file, {
+            'file': model_file,
+            'registered': datetime.now().isoformat(timespec='seconds')
+        })
+        if os.path.exists(model_path):
+            entry['file_size_mb'] = os.path.getsize(model_path) / (1024 * 1024)
+        entry.update(metadata)
+        registry[model_file] = entry
+        save_registry(trained_models_dir, registry)
+    return entry
+
+
+def unregister_model(trained_models_dir: str, model_file: str):
+    """Remove a model entry from the registry"""
+    with _locked_registry(trained_models_dir):
+        registry = load_registry(trained_models_dir)
+        if registry.pop(model_file, None) is not None:
+            save_registry(trained_models_dir, registry)
+
+
+def get_model_entry(trained_models_dir: str, model_file: str) -> Optional[Dict]:
+    """Get registry entry for a model"""
+    return load_registry(trained_models_dir).get(model_file)
+
+
+def sync_registry(trained_models_dir: str) -> Dict[str, Dict]:
+    """
+    Bring the registry in line with the model files on disk
+
+    Model files without an entry (e.g. copied in by hand or trained before the
+    registry existed) get a minimal entry; entries whose file is gone are dropped.
+
+    Args:
+        trained_models_dir: Directory with trained models
+
+    Returns:
+        The synced registry
+    """
+    with _locked_registry(trained_models_dir):
+        registry = load_registry(trained_models_dir)
+        model_files = set()
+        if os.path.exists(trained_models_dir):
+            model_files = {f for f in os.listdir(trained_models_dir) if f.endswith(MODEL_EXTENSIONS)}
+        
+        changed = False
+        for model_file in model_files - set(registry):
+            model_path = os.path.join(trained_models_dir, model_file)
+            registry[model_file] = {
+                'file': model_file,
+                'registered': datetime.fromtimestamp(os.path.getmtime(model_path)).isoformat(timespec='seconds'),
+                'origin': 'unknown',
+                'file_size_mb': os.path.getsize(model_path) / (1024 * 1024)
+            }
+            changed = True
+        for model_file in set(registry) - model_files:
+            del registry[model_file]
+            changed = True
+        
+        if changed:
+            save_registry(trained_models_dir, registry)
+    return registry
+
+
+def list_models(trained_models_dir: str, sort_by: str = 'mask_map') -> List[Dict]:
+    """
+    List registered models, best first
+
+    Args:
+        trained_models_dir: Directory with trained models
+        sort_by: 'mask_map' (highest first), 'latency' (lowest p50 first) or 'newest'
+
+    Returns:
+        List of registry entries
+    """
+    entries = list(sync_registry(trained_models_dir).values())
+    
+    if sort_by == 'latency':
+        return sorted(entries, key=lambda e: (e.get('latency') or {}).get('p50_ms', float('inf')))
+    if sort_by == 'newest':
+        return sorted(entries, key=lambda e: e['registered'], reverse=True)
+    # Unprofiled models sort after profiled ones, newest first among equals
+    return sorted(entries, key=lambda e: (e.get('mask_map', -1.0), e['registered']), reverse=True)
+
+
+def format_model_entry(entry: Dict) -> str:
+    """Short one-line description of a registry entry for selectors"""
+    parts = [entry['file']]
+    if entry.get('mask_map') is not None:
+        parts.append(f"mAP {entry['mask_map']:.3f}")
+    if entry.get('latency'):
+        parts.append(f"p50 {entry['latency']['p50_ms']:.0f} ms")
+    if entry.get('imgsz'):
+        parts.append(f"{entry['imgsz']} px")
+    return " | ".join(parts)
+
+
+def measure_cpu_latency(model, imgsz: int, images: Optional[List] = None,
+                        n_runs: int = 20, warmup: int = 3) -> Dict:
+    """
+    Measure per-image CPU inference latency
+
+    Args:
+        model: Loaded YOLO model
+        imgsz: Inference image size
+        images: Images (paths or arrays) to cycle through (default: synthetic)
+        n_runs: Number of timed predictions
+        warmup: Number of untimed predictions
+
+    Returns:
+        Dictionary with p50/p95/mean latency in ms and the ultralytics stage means
+    """
+    import numpy as np
+
+    if not images:
+        rng = np.random.default_rng(0)
+        images = [rng.integers(0, 256, (imgsz // 2, imgsz, 3), dtype=np.uint8)]
+    
+    timings = []
+    stages = {'preprocess': [], 'inference': [], 'postprocess': []}
+    for i in range(warmup + n_runs):
+        start = time.perf_counter()
+        results = model.predict(images[i % len(images)], imgsz=imgsz, device='cpu', verbose=False)
+        elapsed = (time.perf_counter() - start) * 1000
+        if i >= warmup:
+            timings.append(elapsed)
+            for stage in stages:
+                stages[stage].append(results[0].speed.get(stage, 0.0))
+    
+    timings = np.array(timings)
+    return {
+        'p50_ms': float(np.percentile(timings, 50)),
+        'p95_ms': float(np.percentile(timings, 95)),
+        'mean_ms': float(timings.mean()),
+        'n_runs': n_runs,
+        'threads': _torch_threads(),
+        **{f'{stage}_ms': float(np.mean(values)) for stage, values in stages.items()}
+    }
+
+
+def _torch_threads() -> int:
+    import torch
+    return torch.get_num_threads()
+
+
+def evaluate_per_class_map(model, data_yaml: str, imgsz: int, split: str = 'val') -> Dict:
+    """
+    Validate a model and collect mask mAP overall and per class
+
+    Args:
+        model: Loaded YOLO model
+        data_yaml: Path to dataset data.yaml
+        imgsz: Validation image size
+        split: Dataset split to validate on
+
+    Returns:
+        Dictionary with 'mask_map', 'mask_map50' and 'per_class_map' (class name -> mask mAP50-95)
+    """
+    metrics = model.val(data=data_yaml, split=split, imgsz=imgsz, device='cpu',
+                        plots=False, verbose=False)
+    names = metrics.names
+    per_class = {
+        names[int(class_idx)]: float(metrics.seg.ap[i])
+        for i, class_idx in enumerate(metrics.seg.ap_class_index)
+    }
+    return {
+        'mask_map': float(metrics.seg.map),
+        'mask_map50': float(metrics.seg.map50),
+        'per_class_map': per_class
+    }
+
+
+def _split_images(data_yaml: str, split: str, limit: int) -> List[str]:
+    """First images of a dataset split, used as latency probes"""
+    import yaml
+
+    with open(data_yaml, 'r', encoding='utf-8') as f:
+        data = yaml.safe_load(f)
+    images_dir = os.path.join(data['path'], data[split])
+    if not os.path.exists(images_dir):
+        return []
+    images = sorted(f for f in os.listdir(images_dir)
+                    if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')))
+    return [os.path.join(images_dir, f) for f in images[:limit]]
+
+
+def profile_model(trained_models_dir: str, model_file: str, data_yaml: Optional[str] = None,
+                  imgsz: Optional[int] = None, n_runs: int = 20, warmup: int = 3) -> Dict:
+    """
+    Measure a model's metrics and latency and record them in the registry
+
+    Args:
+        trained_models_dir: Directory with trained models
+        model_file: Model file name inside trained_models_dir
+        data_yaml: Dataset for validation mAP (skipped if None or missing)
+        imgsz: Image size (default: from the registry entry or checkpoint)
+        n_runs: Number of timed predictions for latency
+        warmup: Number of untimed predictions for latency
+
+    Returns:
+        The updated registry entry
+    """
+    from ultralytics import YOLO
+
+    model_path = os.path.join(trained_models_dir, model_file)
+    entry = get_model_entry(trained_models_dir, model_file) or {}
+    model = YOLO(model_path, task='segment')
+    imgsz = imgsz or entry.get('imgsz') or model.overrides.get('imgsz') or 640
+    
+    profile = {
+        'imgsz': imgsz,
+        'file_size_mb': os.path.getsize(model_path) / (1024 * 1024),
+        'class_names': list(model.names.values()) if isinstance(model.names, dict) else list(model.names)
+    }
+    
+    latency_images = []
+    if data_yaml and os.path.exists(data_yaml):
+        profile.update(evaluate_per_class_map(model, data_yaml, imgsz))
+        profile['evaluated_on'] = data_yaml
+        latency_images = _split_images(data_yaml, 'val', n_runs)
+    
+    profile['latency'] = measure_cpu_latency(model, imgsz, latency_images, n_runs, warmup)
+    profile['profiled'] = datetime.now().isoformat(timespec='seconds')
+    return register_model(trained_models_dir, model_file, **profile)
@@ -0,0 +1,214 @@
+"""
+Parallel hyperparameter sweeps with successive halving
+"""
+import os
+import json
+import math
+import random
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# Training (and so torch) is imported lazily: trial processes must set their
+# thread environment before torch loads
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS')
+
+
+def sample_trials(space: Dict, n_trials: int, seed: int = 0) -> List[Dict]:
+    """
+    Sample trial hyperparameters from a search space
+
+    Args:
+        space: Dictionary with 'lr_range' (min, max; sampled log-uniformly),
+            'imgsz_options', 'optimizers' and 'models'
+        n_trials: Number of trials
+        seed: Random seed
+
+    Returns:
+        List of trial dictionaries
+    """
+    rng = random.Random(seed)
+    lr_min, lr_max = space['lr_range']
+    trials = []
+    for trial_id in range(n_trials):
+        trials.append({
+            'trial_id': trial_id,
+            'model': rng.choice(space['models']),
+            'lr0': math.exp(rng.uniform(math.log(lr_min), math.log(lr_max))),
+            'imgsz': rng.choice(space['imgsz_options']),
+            'optimizer': rng.choice(space['optimizers'])
+        })
+    return trials
+
+
+def successive_halving_rungs(min_epochs: int, max_epochs: int, reduction_factor: int) -> List[int]:
+    """Cumulative epoch budgets of each rung, e.g. (5, 45, 3) -> [5, 15, 45]"""
+    rungs = []
+    epochs = min_epochs
+    while epochs < max_epochs:
+        rungs.append(epochs)
+        epochs *= reduction_factor
+    rungs.append(max_epochs)
+    return rungs
+
+
+def default_sweep_workers(threads_per_trial: int) -> int:
+    """Number of parallel trial processes that fits the machine's cores"""
+    return max(1, (os.cpu_count() or 1) // max(1, threads_per_trial))
+
+
+def _init_trial_worker(threads: int):
+    """Limit a trial process's thread pools before torch is imported"""
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+
+
+def _train_trial(trial: Dict, data_yaml: str, sweep_dir: str, rung: int, epochs: int,
+                 init_weights: Optional[str], threads: int, device: str,
+                 metric: str) -> Dict:
+    """Train one trial for one rung (runs in a worker process)"""
+    from modules.trainer import run_training
+
+    run_name = f"trial_{trial['trial_id']:03d}_rung{rung}"
+    result = run_training(
+        init_weights or trial['model'],
+        data_yaml,
+        sweep_dir,
+        run_name,
+        metric=metric,
+        # select_device resets torch's thread count during trainer setup
+        threads=threads,
+        epochs=epochs,
+        imgsz=trial['imgsz'],
+        lr0=trial['lr0'],
+        optimizer=trial['optimizer'],
+        device=device,
+        workers=0,
+        # Continuing a survivor from the previous rung: no second warmup
+        warmup_epochs=0 if init_weights else 3,
+        plots=False,
+        verbose=False
+    )
+    return {**trial, 'rung': rung, 'epochs': epochs, **result}
+
+
+def run_sweep(job, data_yaml: str, sweep_dir: str, trained_models_dir: str,
+              space: Dict, n_trials: int, min_epochs: int, max_epochs: int,
+              reduction_factor: int = 3, threads_per_trial: int = 2,
+              n_workers: Optional[int] = None, device: str = 'cpu',
+              metric: Optional[str] = None, seed: int = 0) -> Dict:
+    """
+    Run a synchronous successive-halving sweep and register the winner
+
+    All trials train for the first rung's epoch budget in parallel worker
+    processes; the top 1/reduction_factor by validation metric continue from
+    their last weights to the next rung's budget, until the final rung.
+    Promoted trials start a new run from last.pt with a fresh optimizer and
+    learning-rate schedule (only the warmup is skipped); they do not resume
+    the previous rung's run.
+
+    Args:
+        job: JobContext for progress reporting (or None)
+        data_yaml: Path to dataset data.yaml
+        sweep_dir: Directory for this sweep's runs and state
+        trained_models_dir: Directory with trained models (winner is published here)
+        space: Search space (see sample_trials)
+        n_trials: Number of initial trials
+        min_epochs: Epoch budget of the first rung
+        max_epochs: Epoch budget of the final rung
+        reduction_factor: Keep 1/reduction_factor of trials per rung
+        threads_per_trial: Torch threads per trial process
+        n_workers: Parallel trial processes (default: cores / threads_per_trial)
+        device: Training device
+        metric: Validation metric to maximize (default: trainer.DEFAULT_METRIC)
+        seed: Random seed for trial sampling
+
+    Returns:
+        Sweep summary with all trial results and the registered winner
+    """
+    from modules.trainer import publish_model, DEFAULT_METRIC
+
+    metric = metric or DEFAULT_METRIC
+    os.makedirs(sweep_dir, exist_ok=True)
+    n_workers = n_workers or default_sweep_workers(threads_per_trial)
+    rungs = successive_halving_rungs(min_epochs, max_epochs, reduction_factor)
+    trials = sample_trials(space, n_trials, seed)
+    summary = {
+        'sweep_dir': sweep_dir,
+        'space': space,
+        'rungs': rungs,
+        'n_workers': n_workers,
+        'metric': metric,
+        'results': [],
+        'winner': None
+    }
+
+    def save_state():
+        with open(os.path.join(sweep_dir, 'sweep.json'), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+
+    survivors = [(trial, None) for trial in trials]
+    previous_epochs = 0
+    n_total = sum(max(1, math.ceil(n_trials / reduction_factor ** k)) for k in range(len(rungs)))
+    n_done = 0
+
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=context,
+                             initializer=_init_trial_worker, initargs=(threads_per_trial,)) as pool:
+        for rung, budget in enumerate(rungs):
+            futures = [
+                pool.submit(_train_trial, trial, data_yaml, sweep_dir, rung,
+                            budget - previous_epochs, weights, threads_per_trial,
+                            device, metric)
+                for trial, weights in survivors
+            ]
+            rung_results = []
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'rung': rung, 'score': 0.0, 'error': str(e)}
+                rung_results.append(result)
+                summary['results'].append(result)
+                save_state()
+                n_done += 1
+                if job is not None:
+                    job.update(progress=n_done / n_total,
+                               message=f"Rung {rung + 1}/{len(rungs)}: {len(rung_results)}/{len(futures)}")
+
+            rung_results = [r for r in rung_results if 'error' not in r]
+            if not rung_results:
+                raise RuntimeError(f"All trials failed at rung {rung}")
+            rung_results.sort(key=lambda r: r['score'], reverse=True)
+
+            if rung < len(rungs) - 1:
+                n_keep = max(1, len(rung_results) // reduction_factor)
+                survivors = [
+                    ({k: r[k] for k in ('trial_id', 'model', 'lr0', 'imgsz', 'optimizer')},
+                     r['last_weights'])
+                    for r in rung_results[:n_keep]
+                ]
+                previous_epochs = budget
+
+    winner = rung_results[0]
+    model_file = publish_model(
+        winner['best_weights'],
+        trained_models_dir,
+        origin='sweep',
+        source_run=winner['run_dir'],
+        base_model=winner['model'],
+        hyperparameters={k: winner[k] for k in ('lr0', 'imgsz', 'optimizer')},
+        metrics=winner['metrics'],
+        sweep_dir=sweep_dir
+    )
+    summary['winner'] = {**winner, 'model_file': model_file}
+    save_state()
+    return summary
+
+
+def new_sweep_dir(sweeps_dir: str) -> str:
+    """Create a unique directory for a new sweep"""
+    sweep_dir = os.path.join(sweeps_dir, f"sweep_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    os.makedirs(sweep_dir, exist_ok=True)
+    return sweep_dir
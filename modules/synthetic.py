@@ -0,0 +1,308 @@
+"""
+Procedural panoramic-like films with matching YOLO polygon labels, for scale and stress testing
+"""
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from modules.utils import save_yolo_annotation
+
+# Class names from config.yaml the generator knows how to draw
+KINDS = ('tooth', 'lesion', 'filling', 'crown', 'implant', 'root_canal', 'caries')
+CROWN_FRACTION = 0.35
+
+# Bump whenever a change makes the same seed produce different films or labels
+GENERATOR_VERSION = 1
+
+
+def _tooth_profile(n_points: int, length: float, crown_width: float,
+                   t_max: float = 1.0) -> np.ndarray:
+    """
+    Outline of a single-rooted tooth in local coordinates
+
+    The tooth axis runs along +y from the occlusal tip (y=0) to the apex
+    (y=length): a rounded crown, a cervical narrowing and a tapering root.
+    t_max < 1 returns only the part above t_max * length (e.g. the crown).
+    """
+    half = max(4, n_points // 2 + 1)
+    t = np.linspace(0, t_max, half)
+    crown = t < CROWN_FRACTION
+    crown_w = np.sqrt(np.clip(1 - ((CROWN_FRACTION - t) / CROWN_FRACTION) ** 2, 0, 1))
+    root_w = 0.75 * np.clip(1 - (t - CROWN_FRACTION) / (1 - CROWN_FRACTION), 0, 1) ** 0.6
+    w = crown_width / 2 * np.where(crown, crown_w, root_w)
+    y = t * length
+    left = np.stack([-w, y], axis=1)
+    right = np.stack([w, y], axis=1)[-2:0:-1] if t_max >= 1 else np.stack([w, y], axis=1)[::-1]
+    return np.concatenate([left, right])
+
+
+def _blob(rng: np.random.Generator, center: Sequence[float], radii: Sequence[float],
+          n_points: int, jitter: float = 0.15) -> np.ndarray:
+    """Irregular ellipse: radius modulated by a few random harmonics"""
+    angles = np.linspace(0, 2 * np.pi, max(3, n_points), endpoint=False)
+    modulation = np.ones_like(angles)
+    for harmonic in (2, 3, 5):
+        modulation += jitter / harmonic * rng.normal() * np.sin(harmonic * angles + rng.uniform(0, 2 * np.pi))
+    return np.stack([center[0] + radii[0] * modulation * np.cos(angles),
+                     center[1] + radii[1] * modulation * np.sin(angles)], axis=1)
+
+
+def _threaded_post(n_points: int, top: float, bottom: float, width: float) -> np.ndarray:
+    """Implant outline: a tapered post with zigzag threads, in local tooth coordinates"""
+    half = max(4, n_points // 2)
+    y = np.linspace(top, bottom, half)
+    taper = 1 - 0.35 * (y - top) / (bottom - top)
+    threads = 1 + 0.12 * (np.arange(half) % 2)
+    w = width / 2 * taper * threads
+    w[-1] *= 0.5
+    return np.concatenate([np.stack([-w, y], axis=1), np.stack([w, y], axis=1)[::-1]])
+
+
+def _paint(canvas: np.ndarray, polygon: np.ndarray, value: float, mode: str = 'set'):
+    """Fill a polygon on a float canvas, working only inside its bounding box"""
+    height, width = canvas.shape
+    x0, y0 = np.maximum(np.floor(polygon.min(axis=0)).astype(int), 0)
+    x1, y1 = np.minimum(np.ceil(polygon.max(axis=0)).astype(int) + 1, (width, height))
+    if x1 <= x0 or y1 <= y0:
+        return
+    mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+    cv2.fillPoly(mask, [np.round(polygon - (x0, y0)).astype(np.int32)], 1)
+    roi = canvas[y0:y1, x0:x1]
+    if mode == 'set':
+        roi[mask > 0] = value
+    elif mode == 'add':
+        roi[mask > 0] += value
+    else:
+        roi[mask > 0] *= value
+
+
+def generate_film(rng: np.random.Generator, width: int, height: int, class_ids: Dict[str, int],
+                  teeth_per_quadrant: int = 8, points_per_polygon: int = 32,
+                  findings_rate: float = 0.15) -> Tuple[np.ndarray, List[Dict]]:
+    """
+    Synthesize one panoramic-like grayscale film and its polygon annotations
+
+    Teeth sit in two rows along a curved occlusal plane; each tooth may
+    carry a crown, filling, caries, root canal filling or periapical
+    lesion, or be replaced by an implant.
+
+    Args:
+        rng: Random generator (the film is fully determined by its state)
+        width, height: Film size in pixels
+        class_ids: Class name -> class id for the kinds to annotate (see KINDS)
+        teeth_per_quadrant: Teeth per jaw half
+        points_per_polygon: Approximate number of points per polygon
+        findings_rate: Probability of each finding per tooth
+
+    Returns:
+        (uint8 image, annotations with 'class_id' and 'polygon' in pixels)
+    """
+    y_grid = np.linspace(-1, 1, height, dtype=np.float32)[:, None]
+    x_grid = np.linspace(-1, 1, width, dtype=np.float32)[None, :]
+    canvas = 45 + 35 * np.exp(-(x_grid ** 2 / 0.5 + y_grid ** 2 / 0.6))
+    # Maxilla and mandible: a bright band around the occlusal plane
+    occlusal = 0.05 + 0.25 * x_grid ** 2
+    canvas = canvas + 30 * np.exp(-((y_grid - occlusal) / 0.45) ** 2)
+    canvas = np.array(np.broadcast_to(canvas, (height, width)), dtype=np.float32)
+
+    annotations = []
+    radiolucent = []
+
+    def annotate(kind: str, polygon: np.ndarray):
+        if kind in class_ids:
+            polygon = np.clip(polygon, 0, (width - 1, height - 1))
+            annotations.append({'class_id': class_ids[kind],
+                                'polygon': [(round(float(x), 1), round(float(y), 1)) for x, y in polygon]})
+
+    n_teeth = 2 * teeth_per_quadrant
+    slot = 0.8 * width / n_teeth
+    for row, direction in (('upper', -1), ('lower', 1)):
+        for i in range(n_teeth):
+            if rng.random() < findings_rate / 3:
+                continue  # missing tooth
+            position = (i + 0.5) / n_teeth * 2 - 1  # -1..1 across the arch
+            cx = width / 2 + position * 0.4 * width + rng.normal(0, 0.03 * slot)
+            cy = height / 2 + (0.05 + 0.25 * (position * 0.8) ** 2) * height / 2 + direction * 0.01 * height
+            molar = abs(position) > 0.55
+            crown_width = slot * (0.9 if molar else 0.7) * rng.uniform(0.9, 1.05)
+            length = height * rng.uniform(0.28, 0.34) * (0.9 if molar else 1.0)
+            angle = np.deg2rad(position * 12 * direction + rng.normal(0, 3))
+            rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+
+            def place(local: np.ndarray) -> np.ndarray:
+                return (local * (1, direction)) @ rotation.T + (cx, cy)
+
+            def axis_point(t: float, offset: float = 0.0) -> np.ndarray:
+                return place(np.array([[offset, t * length]]))[0]
+
+            if rng.random() < findings_rate / 3:
+                # Implant with a crown on top
+                implant = place(_threaded_post(points_per_polygon, CROWN_FRACTION * length,
+                                               0.9 * length, 0.5 * crown_width))
+                _paint(canvas, implant, 245)
+                annotate('implant', implant)
+                cap = place(_tooth_profile(points_per_polygon, length, crown_width, CROWN_FRACTION * 1.05))
+                _paint(canvas, cap, 240)
+                annotate('crown', cap)
+                continue
+
+            tooth = place(_tooth_profile(points_per_polygon, length, crown_width))
+            _paint(canvas, tooth, 160 + rng.normal(0, 10))
+            annotate('tooth', tooth)
+            enamel = place(_tooth_profile(points_per_polygon, length, crown_width * 0.96, CROWN_FRACTION))
+            _paint(canvas, enamel, 25, 'add')
+
+            canal = place(np.array([[-0.04, CROWN_FRACTION], [0.04, CROWN_FRACTION],
+                                    [0.015, 0.95], [-0.015, 0.95]]) * (crown_width, length))
+            if rng.random() < findings_rate / 2:
+                canal_polygon = place(np.concatenate([
+                    np.stack([np.linspace(-0.05, -0.015, points_per_polygon // 2),
+                              np.linspace(0.3, 0.95, points_per_polygon // 2)], axis=1),
+                    np.stack([np.linspace(0.015, 0.05, points_per_polygon // 2),
+                              np.linspace(0.95, 0.3, points_per_polygon // 2)], axis=1)
+                ]) * (crown_width, length))
+                _paint(canvas, canal_polygon, 240)
+                annotate('root_canal', canal_polygon)
+            else:
+                _paint(canvas, canal, -35, 'add')
+
+            if rng.random() < findings_rate:
+                cap = place(_tooth_profile(points_per_polygon, length, crown_width * 1.08, CROWN_FRACTION * 1.05))
+                _paint(canvas, cap, 240)
+                annotate('crown', cap)
+            elif rng.random() < findings_rate:
+                filling = _blob(rng, axis_point(0.15, rng.uniform(-0.1, 0.1) * crown_width),
+                                (0.2 * crown_width, 0.06 * length), points_per_polygon, jitter=0.1)
+                _paint(canvas, filling, 250)
+                annotate('filling', filling)
+            if rng.random() < findings_rate / 2:
+                side = rng.choice([-1, 1])
+                caries = _blob(rng, axis_point(0.2, side * 0.32 * crown_width),
+                               (0.1 * crown_width, 0.04 * length), points_per_polygon, jitter=0.3)
+                radiolucent.append((caries, 0.6))
+                annotate('caries', caries)
+            if rng.random() < findings_rate / 3:
+                lesion = _blob(rng, axis_point(1.0), (0.3 * crown_width, 0.08 * length),
+                               points_per_polygon, jitter=0.25)
+                radiolucent.append((lesion, 0.65))
+                annotate('lesion', lesion)
+
+    # Radiolucent findings darken whatever lies beneath them
+    for polygon, factor in radiolucent:
+        _paint(canvas, polygon, factor, 'multiply')
+
+    sigma = max(0.8, width / 1500)
+    canvas = cv2.GaussianBlur(canvas, (0, 0), sigma)
+    low_frequency = cv2.resize(rng.normal(0, 10, (8, 16)).astype(np.float32), (width, height),
+                               interpolation=cv2.INTER_CUBIC)
+    canvas += low_frequency + rng.normal(0, 6, canvas.shape).astype(np.float32)
+    return np.clip(canvas, 0, 255).astype(np.uint8), annotations
+
+
+def _init_worker():
+    # One OpenCV thread per process; parallelism comes from the pool
+    cv2.setNumThreads(1)
+
+
+def _generate_chunk(indices: Sequence[int], images_dir: str, labels_dir: str, seed: int,
+                    options: Dict) -> Dict[str, int]:
+    """Generate films by index; returns polygon counts per class id"""
+    counts: Dict[str, int] = {'images': 0}
+    for index in indices:
+        name = f"{options['prefix']}_{index:06d}.{options['image_format']}"
+        image_path = os.path.join(images_dir, name)
+        label_path = os.path.join(labels_dir, f"{options['prefix']}_{index:06d}.txt")
+        if not options['overwrite'] and os.path.exists(image_path) and os.path.exists(label_path):
+            continue
+        # Seeding by (seed, index) makes each film independent of worker count and order
+        rng = np.random.default_rng([seed, index])
+        image, annotations = generate_film(rng, options['width'], options['height'], options['class_ids'],
+                                           options['teeth_per_quadrant'], options['points_per_polygon'],
+                                           options['findings_rate'])
+        cv2.imwrite(image_path, image)
+        save_yolo_annotation(name, annotations, labels_dir, options['width'], options['height'])
+        counts['images'] += 1
+        for ann in annotations:
+            counts[str(ann['class_id'])] = counts.get(str(ann['class_id']), 0) + 1
+    return counts
+
+
+def generate_dataset(images_dir: str, labels_dir: str, count: int, class_names: Sequence[str],
+                     width: int = 2048, height: int = 1024, seed: int = 0,
+                     teeth_per_quadrant: int = 8, points_per_polygon: int = 32,
+                     findings_rate: float = 0.15, image_format: str = 'jpg',
+                     prefix: str = 'synthetic', workers: Optional[int] = None, chunk_size: int = 64,
+                     overwrite: bool = False,
+                     progress_callback: Optional[Callable[[int, int], None]] = None) -> Dict:
+    """
+    Generate synthetic films and YOLO polygon labels in parallel
+
+    Output is deterministic under the seed, whatever the number of workers.
+    Existing films are kept unless overwrite is set, so an interrupted run
+    can be continued.
+
+    Args:
+        images_dir: Output directory for films
+        labels_dir: Output directory for YOLO label files
+        count: Number of films
+        class_names: Class names by id (config order); names in KINDS are drawn
+        width, height: Film size in pixels
+        seed: Random seed
+        teeth_per_quadrant: Teeth per jaw half
+        points_per_polygon: Approximate number of points per polygon
+        findings_rate: Probability of each finding per tooth
+        image_format: 'jpg' or 'png'
+        prefix: File name prefix
+        workers: Worker processes (default: CPU count)
+        chunk_size: Films per worker task
+        overwrite: Regenerate films that already exist
+        progress_callback: Called with (done, total) after each chunk
+
+    Returns:
+        Summary with the number of films written and polygons per class
+    """
+    os.makedirs(images_dir, exist_ok=True)
+    os.makedirs(labels_dir, exist_ok=True)
+    options = {
+        'width': width, 'height': height, 'prefix': prefix, 'image_format': image_format,
+        'class_ids': {name: i for i, name in enumerate(class_names) if name in KINDS},
+        'teeth_per_quadrant': teeth_per_quadrant, 'points_per_polygon': points_per_polygon,
+        'findings_rate': findings_rate, 'overwrite': overwrite
+    }
+    chunks = [range(start, min(start + chunk_size, count)) for start in range(0, count, chunk_size)]
+    workers = min(workers or os.cpu_count() or 1, max(1, len(chunks)))
+
+    totals: Dict[str, int] = {}
+
+    def collect(chunk_counts: Dict[str, int], done: int):
+        for key, value in chunk_counts.items():
+            totals[key] = totals.get(key, 0) + value
+        if progress_callback is not None:
+            progress_callback(done, count)
+
+    done = 0
+    if workers == 1:
+        for chunk in chunks:
+            done += len(chunk)
+            collect(_generate_chunk(chunk, images_dir, labels_dir, seed, options), done)
+    else:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker) as pool:
+            futures = {pool.submit(_generate_chunk, chunk, images_dir, labels_dir, seed, options): len(chunk)
+                       for chunk in chunks}
+            for future in as_completed(futures):
+                done += futures[future]
+                collect(future.result(), done)
+
+    written = totals.pop('images', 0)
+    return {
+        'images': written,
+        'skipped': count - written,
+        'polygons': {class_names[int(class_id)]: totals[class_id] for class_id in sorted(totals, key=int)},
+        'seed': seed,
+        'size': [width, height]
+    }
@@ -0,0 +1,288 @@
+"""
+Core training routines shared by the training page and background jobs
+"""
+import os
+import csv
+import json
+import shutil
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Union
+
+from ultralytics import YOLO
+
+from modules.registry import register_model, profile_model
+from modules.utils import dataset_manifest_hash, get_process_start_time, is_process_alive
+
+# Validation metric used to rank models and trials
+DEFAULT_METRIC = 'metrics/mAP50-95(M)'
+
+# Run record written next to ultralytics outputs in each run directory
+RUN_FILE = 'run.json'
+
+
+def load_run_record(run_dir: str) -> Optional[Dict]:
+    """Load a run's record, or None for runs started before run tracking"""
+    run_path = os.path.join(run_dir, RUN_FILE)
+    if not os.path.exists(run_path):
+        return None
+    with open(run_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_run_record(run_dir: str, **fields) -> Dict:
+    """Merge fields into a run's record"""
+    os.makedirs(run_dir, exist_ok=True)
+    record = load_run_record(run_dir) or {}
+    record.update(fields)
+    run_path = os.path.join(run_dir, RUN_FILE)
+    tmp_path = run_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(record, f, indent=2, default=str)
+    os.replace(tmp_path, run_path)
+    return record
+
+
+def _process_identity() -> Dict:
+    pid = os.getpid()
+    return {'pid': pid, 'pid_start_time': get_process_start_time(pid)}
+
+
+def _tracked_train(run_dir: str, train_fn: Callable, metric: str) -> Dict:
+    """Run train_fn while keeping the run record's status up to date"""
+    try:
+        train_fn()
+    except BaseException as e:
+        # Covers errors as well as Streamlit stop/rerun exceptions
+        write_run_record(run_dir, status='interrupted', error=str(e),
+                         finished=datetime.now().isoformat(timespec='seconds'))
+        raise
+
+    metrics = read_run_metrics(run_dir, metric)
+    write_run_record(run_dir, status='completed', metrics=metrics,
+                     finished=datetime.now().isoformat(timespec='seconds'))
+    return {
+        'run_name': os.path.basename(run_dir),
+        'run_dir': run_dir,
+        'best_weights': os.path.join(run_dir, 'weights', 'best.pt'),
+        'last_weights': os.path.join(run_dir, 'weights', 'last.pt'),
+        'metrics': metrics,
+        'score': metrics.get(metric, 0.0)
+    }
+
+
+def read_run_metrics(run_dir: str, metric: str = DEFAULT_METRIC) -> Dict:
+    """
+    Read the best epoch's metrics from an ultralytics results.csv
+
+    Args:
+        run_dir: Training run directory
+        metric: Metric used to pick the best epoch
+
+    Returns:
+        Dictionary of metric name -> value (empty if no results yet)
+    """
+    results_csv = os.path.join(run_dir, 'results.csv')
+    if not os.path.exists(results_csv):
+        return {}
+
+    best_row = {}
+    with open(results_csv, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            row = {k.strip(): float(v) for k, v in row.items() if k and v not in (None, '')}
+            if not best_row or row.get(metric, 0.0) >= best_row.get(metric, 0.0):
+                best_row = row
+    return best_row
+
+
+def pin_torch_threads(model: YOLO, threads: int):
+    """
+    Use `threads` torch threads for the model's next training run
+
+    Ultralytics' select_device resets the thread count while the trainer is
+    set up, so a count set before train() is lost; the callback applies it
+    once setup is done.
+    """
+    import torch
+
+    model.add_callback('on_pretrain_routine_end', lambda trainer: torch.set_num_threads(threads))
+
+
+def run_training(model: Union[str, YOLO], data_yaml: str, project_dir: str,
+                 run_name: str, metric: str = DEFAULT_METRIC,
+                 record: Optional[Dict] = None, threads: Optional[int] = None,
+                 **train_args) -> Dict:
+    """
+    Train a segmentation model
+
+    The run is tracked in run.json (status, hyperparameters, dataset
+    manifest hash and owning process) so interrupted runs can be resumed.
+
+    Args:
+        model: Model weights/name or a loaded YOLO model
+        data_yaml: Path to dataset data.yaml
+        project_dir: Directory that holds training runs
+        run_name: Name of this run inside project_dir
+        metric: Validation metric to report as 'score'
+        record: Extra fields to store in the run record
+        threads: Torch threads to train with (see pin_torch_threads)
+        **train_args: Extra arguments passed to YOLO.train
+
+    Returns:
+        Dictionary with run directory, weight paths, best-epoch metrics and score
+    """
+    if isinstance(model, str):
+        model = YOLO(model)
+    if threads:
+        pin_torch_threads(model, threads)
+
+    run_dir = os.path.join(project_dir, run_name)
+    dataset_dir = os.path.dirname(os.path.abspath(data_yaml))
+    write_run_record(
+        run_dir,
+        status='running',
+        data=data_yaml,
+        dataset_dir=dataset_dir,
+        dataset_manifest_hash=dataset_manifest_hash(dataset_dir),
+        train_args=train_args,
+        started=datetime.now().isoformat(timespec='seconds'),
+        resumes=[],
+        **(record or {}),
+        **_process_identity()
+    )
+
+    return _tracked_train(
+        run_dir,
+        lambda: model.train(data=data_yaml, project=project_dir, name=run_name,
+                            exist_ok=True, **train_args),
+        metric
+    )
+
+
+def find_interrupted_runs(training_results_dir: str) -> List[Dict]:
+    """
+    Find runs that stopped before completing and can be resumed
+
+    A run is interrupted if its record says so, or if it is marked running
+    but the process that owned it is gone (e.g. after a container restart).
+
+    Args:
+        training_results_dir: Directory that holds training runs
+
+    Returns:
+        List of run records (with 'run_dir' and 'last_weights'), newest first
+    """
+    if not os.path.exists(training_results_dir):
+        return []
+
+    interrupted = []
+    for run_name in sorted(os.listdir(training_results_dir), reverse=True):
+        run_dir = os.path.join(training_results_dir, run_name)
+        record = load_run_record(run_dir)
+        last_weights = os.path.join(run_dir, 'weights', 'last.pt')
+        if record is None or not os.path.exists(last_weights):
+            continue
+        if record['status'] == 'running' and is_process_alive(record['pid'], record.get('pid_start_time')):
+            continue
+        if record['status'] in ('running', 'interrupted'):
+            interrupted.append({**record, 'run_dir': run_dir, 'last_weights': last_weights})
+    return interrupted
+
+
+def resume_training(run_dir: str, metric: str = DEFAULT_METRIC, threads: Optional[int] = None) -> Dict:
+    """
+    Resume an interrupted run from its latest last.pt checkpoint
+
+    Ultralytics restores the original hyperparameters from the checkpoint;
+    the dataset must still match the manifest hash recorded at the start.
+
+    Args:
+        run_dir: Training run directory
+        metric: Validation metric to report as 'score'
+        threads: Torch threads to train with (see pin_torch_threads)
+
+    Returns:
+        Same as run_training
+    """
+    record = load_run_record(run_dir)
+    last_weights = os.path.join(run_dir, 'weights', 'last.pt')
+    if record is None or not os.path.exists(last_weights):
+        raise FileNotFoundError(f"No resumable checkpoint in {run_dir}")
+
+    current_hash = dataset_manifest_hash(record['dataset_dir'])
+    if current_hash != record['dataset_manifest_hash']:
+        raise ValueError(
+            "Dataset has changed since the run started "
+            f"({record['dataset_manifest_hash'][:8]} -> {current_hash[:8]}); cannot resume"
+        )
+
+    write_run_record(
+        run_dir,
+        status='running',
+        resumes=record.get('resumes', []) + [datetime.now().isoformat(timespec='seconds')],
+        **_process_identity()
+    )
+    resume_args = {}
+    if record.get('pruned_from'):
+        # Pruned runs must not be rebuilt from the parent's YAML
+        from modules.prune import PrunedSegmentationTrainer
+        resume_args['trainer'] = PrunedSegmentationTrainer
+    elif record.get('teacher'):
+        # Distillation runs need their teacher-aware trainer back
+        from modules.distill import make_distillation_trainer
+        resume_args['trainer'] = make_distillation_trainer(
+            record['teacher'], **record.get('distillation', {})
+        )
+    model = YOLO(last_weights)
+    if threads:
+        pin_torch_threads(model, threads)
+    return _tracked_train(run_dir, lambda: model.train(resume=True, **resume_args), metric)
+
+
+def publish_model(weights_path: str, trained_models_dir: str,
+                  timestamp: Optional[str] = None, data_yaml: Optional[str] = None,
+                  profile: bool = True, **metadata) -> str:
+    """
+    Copy trained weights into the trained models directory and register them
+
+    Lineage (dataset manifest hash, imgsz) is taken from the source run's
+    record; when profile is set, validation mAP and CPU latency are measured.
+
+    Args:
+        weights_path: Path to weights (usually a run's best.pt)
+        trained_models_dir: Directory with trained models
+        timestamp: Timestamp used in the model file name (default: now)
+        data_yaml: Dataset used for per-class validation mAP
+        profile: Measure metrics and latency after registering
+        **metadata: Registry metadata (source_run, base_model, hyperparameters, ...)
+
+    Returns:
+        Model file name
+    """
+    timestamp = timestamp or datetime.now().strftime("%Y%m%d_%H%M%S")
+    model_file = f"model_{timestamp}.pt"
+    os.makedirs(trained_models_dir, exist_ok=True)
+    # Runs can finish within the same second; reserve a free name before copying
+    suffix = 1
+    while True:
+        try:
+            with open(os.path.join(trained_models_dir, model_file), 'xb'):
+                break
+        except FileExistsError:
+            suffix += 1
+            model_file = f"model_{timestamp}_{suffix}.pt"
+    shutil.copy2(weights_path, os.path.join(trained_models_dir, model_file))
+
+    record = load_run_record(metadata['source_run']) if metadata.get('source_run') else None
+    if record is not None:
+        metadata.setdefault('dataset_manifest_hash', record.get('dataset_manifest_hash'))
+        metadata.setdefault('imgsz', record.get('train_args', {}).get('imgsz'))
+        data_yaml = data_yaml or record.get('data')
+    register_model(trained_models_dir, model_file, **metadata)
+
+    if profile:
+        try:
+            profile_model(trained_models_dir, model_file, data_yaml)
+        except Exception as e:
+            # The model is published either way; profiling can be re-run later
+            register_model(trained_models_dir, model_file, profile_error=str(e))
+    return model_file
@@ -4,16 +4,32 @@ Training module for YOLO11 segmentation models
 import os
 import streamlit as st
 from ultralytics import YOLO
-import yaml
-from pathlib import Path
-from typing import Dict, Optional
-import time
+import json
+from typing import Dict, List, Optional
+import torch
 from datetime import datetime
-import shutil
 from modules.utils import (
     load_config, split_dataset, create_dataset_yaml,
-    validate_dataset, count_annotations
+    validate_dataset, count_annotations, get_rss_mb, get_available_memory_mb,
+    write_dataset_manifest
 )
+from modules.autotune import autotune_cpu_training, save_autotune_result
+from modules.trainer import (
+    run_training, publish_model, find_interrupted_runs, resume_training, load_run_record
+)
+from modules.sweep import run_sweep, new_sweep_dir, default_sweep_workers
+from modules.jobs import start_job, list_jobs
+from modules import perf
+from modules.registry import (
+    unregister_model, list_models, profile_model, load_registry, format_model_entry
+)
+from modules.distill import run_distillation
+from modules.quantize import quantize_model
+from modules.prune import prune_model
+from modules.evaluation import evaluate_model, compute_metrics
+from modules.calibration import calibrate_model
+from modules.image_hash import HashIndex
+import plotly.graph_objects as go
 
 
 class TrainingInterface:
@@ -27,12 +43,18 @@ class TrainingInterface:
         self.pretrained_models_dir = config['paths']['pretrained_models']
         self.trained_models_dir = config['paths']['trained_models']
         self.training_results_dir = config['paths']['training_results']
+        self.sweeps_dir = config['paths']['sweeps']
+        self.jobs_dir = config['paths']['jobs']
         
         # Initialize session state
         if 'training_in_progress' not in st.session_state:
             st.session_state.training_in_progress = False
         if 'training_model' not in st.session_state:
             st.session_state.training_model = None
+        if 'autotune_result' not in st.session_state:
+            st.session_state.autotune_result = None
+        if 'evaluation_results' not in st.session_state:
+            st.session_state.evaluation_results = {}
     
     def render(self):
         """Render the training interface"""
@@ -40,7 +62,11 @@ class TrainingInterface:
         st.markdown("YOLO11 segmentasyon modelini özel veri setiniz üzerinde eğitin.")
         
         # Create tabs
-        tab1, tab2, tab3 = st.tabs(["📊 Dataset Preparation", "⚙️ Model Training", "📈 Training History"])
+        tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs([
+            "📊 Dataset Preparation", "⚙️ Model Training",
+            "🔬 Hyperparameter Sweep", "🧪 Distillation",
+            "🗜️ Model Optimization", "🧮 Evaluation", "📈 Training History"
+        ])
         
         with tab1:
             self._render_dataset_preparation()
@@ -49,6 +75,18 @@ class TrainingInterface:
             self._render_training_config()
         
         with tab3:
+            self._render_sweep()
+        
+        with tab4:
+            self._render_distillation()
+        
+        with tab5:
+            self._render_model_optimization()
+        
+        with tab6:
+            self._render_evaluation()
+        
+        with tab7:
             self._render_training_history()
     
     def _render_dataset_preparation(self):
@@ -108,25 +146,46 @@ class TrainingInterface:
             st.error("❌ Oranların toplamı 1.0 olmalıdır!")
             return
         
+        group_duplicates = st.checkbox(
+            "Yakın Kopyaları Aynı Bölüme Koy",
+            value=True,
+            help="Algısal hash ile bulunan yakın kopya filmler eğitim/test arasında bölünmez"
+        )
+        
         st.markdown("---")
         
         # Prepare dataset button
         if st.button("📦 Veri Setini Hazırla", type="primary", use_container_width=True):
             with st.spinner("Veri seti hazırlanıyor..."):
                 try:
+                    groups = None
+                    if group_duplicates:
+                        dedup_config = self.config['dedup']
+                        with perf.span('training.prepare_dataset.dedup'):
+                            hash_index = HashIndex(self.config['paths']['image_hashes'])
+                            hash_index.update(self.raw_images_dir, self.config['image']['supported_formats'])
+                            groups = hash_index.groups(max_distance=dedup_config['max_distance'])
+                        if groups:
+                            st.info(f"🔗 {len(groups)} yakın kopya grubu "
+                                    f"({sum(len(g) for g in groups)} film) aynı bölümde tutulacak")
+                    
                     # Split dataset
-                    split_counts = split_dataset(
-                        self.raw_images_dir,
-                        self.annotations_dir,
-                        self.dataset_dir,
-                        train_ratio,
-                        val_ratio,
-                        test_ratio
-                    )
+                    with perf.span('training.prepare_dataset.split'):
+                        split_counts = split_dataset(
+                            self.raw_images_dir,
+                            self.annotations_dir,
+                            self.dataset_dir,
+                            train_ratio,
+                            val_ratio,
+                            test_ratio,
+                            groups=groups
+                        )
                     
-                    # Create data.yaml
+                    # Create data.yaml and manifest
                     class_names = [c['name'] for c in self.config['classes']]
-                    create_dataset_yaml(self.dataset_dir, class_names)
+                    with perf.span('training.prepare_dataset.manifest'):
+                        create_dataset_yaml(self.dataset_dir, class_names)
+                        write_dataset_manifest(self.dataset_dir)
                     
                     # Display results
                     st.success("✅ Veri seti başarıyla hazırlandı!")
@@ -142,7 +201,8 @@ class TrainingInterface:
         # Validate dataset
         st.markdown("---")
         if st.button("✅ Veri Setini Doğrula"):
-            validation = validate_dataset(self.dataset_dir)
+            with perf.span('training.validate_dataset'):
+                validation = validate_dataset(self.dataset_dir)
             
             if validation['valid']:
                 st.success("✅ Veri seti geçerli!")
@@ -171,6 +231,10 @@ class TrainingInterface:
             st.warning("⚠️ Önce veri setini hazırlayın!")
             return
         
+        # Interrupted runs
+        if not st.session_state.training_in_progress:
+            self._render_interrupted_runs()
+        
         # Model selection
         st.markdown("### Model Seçimi")
         
@@ -250,6 +314,12 @@ class TrainingInterface:
                 help="Eğitim için kullanılacak cihaz"
             )
         
+        # CPU autotuning
+        autotune_result = None
+        if device == "cpu":
+            st.markdown("---")
+            autotune_result = self._render_autotune(selected_model, imgsz)
+        
         st.markdown("---")
         
         # Advanced options
@@ -283,7 +353,7 @@ class TrainingInterface:
                 self._start_training(
                     selected_model, epochs, batch_size, imgsz,
                     learning_rate, patience, device, optimizer,
-                    augment, save_period
+                    augment, save_period, autotune=autotune_result
                 )
         else:
             st.warning("⏳ Eğitim devam ediyor...")
@@ -291,9 +361,65 @@ class TrainingInterface:
                 st.session_state.training_in_progress = False
                 st.rerun()
     
+    def _render_autotune(self, model_name: str, imgsz: int) -> Optional[Dict]:
+        """Render CPU autotuning section and return the result to apply, if any"""
+        st.markdown("### ⚡ CPU Otomatik Ayarlama")
+        st.caption("Kısa deneme iterasyonlarıyla en yüksek verimli batch ve thread ayarını bulur "
+                   "(CPU'da ultralytics veri yükleme worker'larını kapatır, bu yüzden ayarlanmaz)")
+        
+        tune_config = self.config['training']['autotune']
+        
+        if st.button("⚡ Otomatik Ayarla", use_container_width=True):
+            data_yaml_path = os.path.join(self.dataset_dir, 'data.yaml')
+            memory_budget_mb = get_rss_mb() + tune_config['memory_budget_fraction'] * get_available_memory_mb()
+            progress_bar = st.progress(0)
+            
+            def on_probe(index, total, result):
+                progress_bar.progress(
+                    min(index / total, 1.0),
+                    text=f"Batch {result['batch_size']}, "
+                         f"thread {result['threads']}: {result['throughput']:.2f} görüntü/s"
+                )
+            
+            with st.spinner("Yapılandırmalar deneniyor..."):
+                try:
+                    st.session_state.autotune_result = autotune_cpu_training(
+                        model_name, data_yaml_path, imgsz,
+                        batch_candidates=tune_config['batch_candidates'],
+                        thread_candidates=tune_config['thread_candidates'] or None,
+                        memory_budget_mb=memory_budget_mb,
+                        iterations=tune_config['probe_iterations'],
+                        warmup=tune_config['warmup_iterations'],
+                        progress_callback=on_probe
+                    )
+                except Exception as e:
+                    st.error(f"❌ Otomatik ayarlama hatası: {str(e)}")
+        
+        result = st.session_state.autotune_result
+        if result is None:
+            return None
+        
+        if result['model_name'] != model_name or result['imgsz'] != imgsz:
+            st.warning("⚠️ Kayıtlı ayarlar farklı bir model/görüntü boyutu için. Tekrar ayarlayın.")
+            return None
+        
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Batch", result['batch_size'])
+        col2.metric("Thread", result['threads'])
+        col3.metric("Görüntü/s", f"{result['throughput']:.2f}")
+        
+        with st.expander("📋 Deneme Sonuçları"):
+            st.dataframe(result['probes'], use_container_width=True)
+        
+        if st.checkbox("Otomatik ayarları kullan", value=True,
+                       help="Batch boyutu yerine otomatik ayarlanan değerler kullanılır"):
+            return result
+        return None
+    
     def _start_training(self, model_name: str, epochs: int, batch_size: int,
                        imgsz: int, lr: float, patience: int, device: str,
-                       optimizer: str, augment: bool, save_period: int):
+                       optimizer: str, augment: bool, save_period: int,
+                       autotune: Optional[Dict] = None):
         """Start model training"""
         try:
             st.session_state.training_in_progress = True
@@ -317,9 +443,7 @@ class TrainingInterface:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             project_name = f"training_{timestamp}"
             
-            # Train model
-            results = model.train(
-                data=data_yaml_path,
+            train_args = dict(
                 epochs=epochs,
                 batch=batch_size,
                 imgsz=imgsz,
@@ -329,34 +453,50 @@ class TrainingInterface:
                 optimizer=optimizer,
                 augment=augment,
                 save_period=save_period,
-                project=self.training_results_dir,
-                name=project_name,
-                exist_ok=True,
                 verbose=True
             )
             
+            # Apply autotuned CPU settings and keep them with the run
+            previous_threads = torch.get_num_threads()
+            if autotune is not None:
+                train_args['batch'] = autotune['batch_size']
+                save_autotune_result(
+                    autotune, os.path.join(self.training_results_dir, project_name)
+                )
+            
+            # Train model (the thread count is process-wide, so restore it for other sessions)
+            try:
+                run = run_training(
+                    model, data_yaml_path, self.training_results_dir, project_name,
+                    record={'base_model': model_name, 'timestamp': timestamp, 'autotune': autotune},
+                    threads=autotune['threads'] if autotune is not None else None,
+                    **train_args
+                )
+            finally:
+                torch.set_num_threads(previous_threads)
+            
             # Training completed
             progress_bar.progress(100)
             status_text.success("✅ Eğitim tamamlandı!")
             
             # Copy best model to trained models directory
-            best_model_path = os.path.join(
-                self.training_results_dir, project_name, 'weights', 'best.pt'
-            )
-            
-            if os.path.exists(best_model_path):
-                dest_model_path = os.path.join(
+            if os.path.exists(run['best_weights']):
+                model_file = publish_model(
+                    run['best_weights'],
                     self.trained_models_dir,
-                    f"model_{timestamp}.pt"
+                    timestamp,
+                    origin='training',
+                    source_run=run['run_dir'],
+                    base_model=model_name,
+                    hyperparameters={'lr0': lr, 'imgsz': imgsz, 'optimizer': optimizer,
+                                     'batch': train_args['batch'], 'epochs': epochs},
+                    metrics=run['metrics']
                 )
-                shutil.copy2(best_model_path, dest_model_path)
                 
-                st.success(f"✅ En iyi model kaydedildi: model_{timestamp}.pt")
+                st.success(f"✅ En iyi model kaydedildi: {model_file}")
                 
                 # Display training results
-                self._display_training_results(
-                    os.path.join(self.training_results_dir, project_name)
-                )
+                self._display_training_results(run['run_dir'])
             
             st.session_state.training_in_progress = False
             
@@ -364,6 +504,613 @@ class TrainingInterface:
             st.error(f"❌ Eğitim hatası: {str(e)}")
             st.session_state.training_in_progress = False
     
+    def _render_sweep(self):
+        """Render hyperparameter sweep section"""
+        st.subheader("Hiperparametre Taraması")
+        st.caption("Paralel denemeler, ardışık yarılama (successive halving) ile zayıf denemeler erken elenir")
+        
+        data_yaml_path = os.path.join(self.dataset_dir, 'data.yaml')
+        if not os.path.exists(data_yaml_path):
+            st.warning("⚠️ Önce veri setini hazırlayın!")
+            return
+        
+        sweep_config = self.config['sweep']
+        
+        models = st.multiselect(
+            "Model Varyantları",
+            options=self.config['training']['available_models'],
+            default=[self.config['training']['default_model']]
+        )
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            lr_min = st.number_input("Min Öğrenme Oranı", min_value=0.00001, max_value=0.1,
+                                     value=sweep_config['lr_range'][0], format="%.5f")
+            imgsz_options = st.multiselect("Görüntü Boyutları", options=[320, 416, 512, 640, 800, 1024],
+                                           default=sweep_config['imgsz_options'])
+            n_trials = st.number_input("Deneme Sayısı", min_value=2, max_value=100,
+                                       value=sweep_config['n_trials'])
+            min_epochs = st.number_input("İlk Basamak Epoch", min_value=1, max_value=100,
+                                         value=sweep_config['min_epochs'])
+        with col2:
+            lr_max = st.number_input("Max Öğrenme Oranı", min_value=0.00001, max_value=0.1,
+                                     value=sweep_config['lr_range'][1], format="%.5f")
+            optimizers = st.multiselect("Optimizer", options=["SGD", "Adam", "AdamW"],
+                                        default=sweep_config['optimizers'])
+            reduction_factor = st.number_input("Eleme Faktörü", min_value=2, max_value=5,
+                                               value=sweep_config['reduction_factor'])
+            max_epochs = st.number_input("Son Basamak Epoch", min_value=1, max_value=500,
+                                         value=sweep_config['max_epochs'])
+        
+        threads_per_trial = sweep_config['threads_per_trial']
+        n_workers = default_sweep_workers(threads_per_trial)
+        st.info(f"🧵 {n_workers} paralel deneme süreci × {threads_per_trial} thread")
+        
+        if not models or not imgsz_options or not optimizers or lr_min > lr_max:
+            st.error("❌ Arama uzayı geçersiz!")
+            return
+        
+        if st.button("🔬 Taramayı Başlat", type="primary", use_container_width=True):
+            space = {
+                'models': models,
+                'lr_range': [lr_min, lr_max],
+                'imgsz_options': imgsz_options,
+                'optimizers': optimizers
+            }
+            start_job(
+                'sweep', run_sweep, self.jobs_dir,
+                data_yaml_path, new_sweep_dir(self.sweeps_dir), self.trained_models_dir,
+                space, int(n_trials), int(min_epochs), int(max_epochs),
+                reduction_factor=int(reduction_factor),
+                threads_per_trial=threads_per_trial,
+                n_workers=n_workers,
+                metric=sweep_config['metric']
+            )
+            st.success("✅ Tarama arka planda başlatıldı")
+        
+        # Sweep jobs
+        st.markdown("---")
+        st.markdown("### Taramalar")
+        jobs = list_jobs(self.jobs_dir, kind='sweep')
+        if not jobs:
+            st.info("Henüz tarama yok")
+            return
+        
+        if st.button("🔄 Yenile"):
+            st.rerun()
+        
+        for job in jobs:
+            with st.expander(f"{job['job_id']} — {job['status']}", expanded=job['status'] == 'running'):
+                st.progress(job['progress'], text=job['message'])
+                if job['status'] == 'completed':
+                    winner = job['result']['winner']
+                    st.success(
+                        f"🏆 Kazanan: {winner['model_file']} ({winner['model']}, lr0={winner['lr0']:.5f}, "
+                        f"imgsz={winner['imgsz']}, {winner['optimizer']}) — skor {winner['score']:.4f}"
+                    )
+                    st.dataframe(
+                        [{k: r.get(k) for k in ('trial_id', 'rung', 'model', 'lr0', 'imgsz',
+                                                'optimizer', 'epochs', 'score')}
+                         for r in job['result']['results']],
+                        use_container_width=True
+                    )
+                elif job['status'] == 'failed':
+                    st.error(job['error'])
+    
+    def _render_interrupted_runs(self):
+        """Offer to resume runs that were interrupted (e.g. by a restart)"""
+        interrupted = find_interrupted_runs(self.training_results_dir)
+        if not interrupted:
+            return
+        
+        st.markdown("### 🔁 Yarıda Kalan Eğitimler")
+        for run in interrupted:
+            run_name = os.path.basename(run['run_dir'])
+            train_args = run.get('train_args', {})
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                st.text(
+                    f"📦 {run_name} ({run.get('base_model', '?')}, "
+                    f"{self._count_completed_epochs(run['run_dir'])}/{train_args.get('epochs', '?')} epoch)"
+                )
+            with col2:
+                if st.button("🔁 Devam Et", key=f"resume_{run_name}", use_container_width=True):
+                    self._resume_training(run)
+        st.markdown("---")
+    
+    def _count_completed_epochs(self, run_dir: str) -> int:
+        """Number of epochs logged in a run's results.csv"""
+        results_csv = os.path.join(run_dir, 'results.csv')
+        if not os.path.exists(results_csv):
+            return 0
+        with open(results_csv, 'r', encoding='utf-8') as f:
+            return max(0, sum(1 for _ in f) - 1)
+    
+    def _resume_training(self, run: Dict):
+        """Resume an interrupted run from its last checkpoint"""
+        try:
+            st.session_state.training_in_progress = True
+            
+            autotune = run.get('autotune')
+            previous_threads = torch.get_num_threads()
+            
+            try:
+                with st.spinner(f"Eğitime devam ediliyor: {os.path.basename(run['run_dir'])}"):
+                    resumed = resume_training(
+                        run['run_dir'], threads=autotune['threads'] if autotune is not None else None
+                    )
+            finally:
+                torch.set_num_threads(previous_threads)
+            
+            st.success("✅ Eğitim tamamlandı!")
+            
+            if os.path.exists(resumed['best_weights']):
+                train_args = run.get('train_args', {})
+                model_file = publish_model(
+                    resumed['best_weights'],
+                    self.trained_models_dir,
+                    run.get('timestamp'),
+                    origin='training',
+                    source_run=resumed['run_dir'],
+                    base_model=run.get('base_model'),
+                    hyperparameters={k: train_args.get(k) for k in ('lr0', 'imgsz', 'optimizer', 'batch', 'epochs')},
+                    metrics=resumed['metrics'],
+                    resumed=True
+                )
+                st.success(f"✅ En iyi model kaydedildi: {model_file}")
+                self._display_training_results(resumed['run_dir'])
+            
+            st.session_state.training_in_progress = False
+            
+        except Exception as e:
+            st.error(f"❌ Devam ettirme hatası: {str(e)}")
+            st.session_state.training_in_progress = False
+    
+    def _render_distillation(self):
+        """Render knowledge distillation section"""
+        st.subheader("Bilgi Damıtma (Distillation)")
+        st.caption("Eğitilmiş büyük bir öğretmen model, hızlı bir nano/small öğrenci modeli denetler")
+        
+        data_yaml_path = os.path.join(self.dataset_dir, 'data.yaml')
+        if not os.path.exists(data_yaml_path):
+            st.warning("⚠️ Önce veri setini hazırlayın!")
+            return
+        
+        teachers = {entry['file']: entry for entry in list_models(self.trained_models_dir)}
+        if not teachers:
+            st.warning("⚠️ Öğretmen olarak kullanılacak eğitilmiş model yok.")
+            return
+        
+        distill_config = self.config['distillation']
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            teacher_file = st.selectbox(
+                "Öğretmen Model",
+                options=list(teachers.keys()),
+                format_func=lambda x: format_model_entry(teachers[x]),
+                help="Genellikle yolo11x/l tabanlı eğitilmiş model"
+            )
+            student_model = st.selectbox(
+                "Öğrenci Model",
+                options=distill_config['student_models']
+            )
+            epochs = st.number_input(
+                "Epoch Sayısı", min_value=10, max_value=500,
+                value=self.config['training']['default_epochs'], step=10,
+                key="distill_epochs"
+            )
+        with col2:
+            imgsz_options = [320, 416, 512, 640, 800, 1024]
+            teacher_imgsz = teachers[teacher_file].get('imgsz') or self.config['training']['default_imgsz']
+            imgsz = st.selectbox(
+                "Görüntü Boyutu", options=imgsz_options,
+                index=imgsz_options.index(teacher_imgsz) if teacher_imgsz in imgsz_options else 3,
+                key="distill_imgsz"
+            )
+            batch_size = st.number_input(
+                "Batch Boyutu", min_value=4, max_value=64,
+                value=self.config['training']['default_batch_size'], step=4,
+                key="distill_batch"
+            )
+            device = st.selectbox(
+                "Cihaz", options=["0", "cpu"],
+                format_func=lambda x: "GPU (CUDA)" if x == "0" else "CPU",
+                key="distill_device"
+            )
+        
+        with st.expander("🔧 Damıtma Ağırlıkları"):
+            temperature = st.number_input("Sıcaklık", min_value=1.0, max_value=10.0,
+                                          value=float(distill_config['temperature']))
+            cls_weight = st.number_input("Sınıf Logit Ağırlığı", min_value=0.0, max_value=10.0,
+                                         value=float(distill_config['cls_weight']))
+            dfl_weight = st.number_input("Kutu Dağılımı Ağırlığı", min_value=0.0, max_value=10.0,
+                                         value=float(distill_config['dfl_weight']))
+            mask_weight = st.number_input("Maske Ağırlığı", min_value=0.0, max_value=10.0,
+                                          value=float(distill_config['mask_weight']))
+        
+        if st.button("🧪 Damıtmayı Başlat", type="primary", use_container_width=True,
+                     disabled=st.session_state.training_in_progress):
+            loss_args = {
+                'temperature': temperature,
+                'cls_weight': cls_weight,
+                'dfl_weight': dfl_weight,
+                'mask_weight': mask_weight,
+                'mask_conf': distill_config['mask_conf'],
+                'max_mask_anchors': distill_config['max_mask_anchors']
+            }
+            self._start_distillation(teacher_file, student_model, int(epochs), int(batch_size),
+                                     imgsz, device, loss_args)
+    
+    def _start_distillation(self, teacher_file: str, student_model: str, epochs: int,
+                            batch_size: int, imgsz: int, device: str, loss_args: Dict):
+        """Run distillation and publish the student next to its teacher"""
+        try:
+            st.session_state.training_in_progress = True
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            teacher_path = os.path.join(self.trained_models_dir, teacher_file)
+            
+            with st.spinner("Öğrenci model eğitiliyor..."):
+                run = run_distillation(
+                    teacher_path, student_model,
+                    os.path.join(self.dataset_dir, 'data.yaml'),
+                    self.training_results_dir, f"distill_{timestamp}",
+                    loss_args=loss_args,
+                    epochs=epochs, batch=batch_size, imgsz=imgsz, device=device,
+                    patience=self.config['training']['patience'],
+                    save_period=self.config['training']['save_period']
+                )
+            
+            if os.path.exists(run['best_weights']):
+                with st.spinner("Öğrenci model profili çıkarılıyor..."):
+                    model_file = publish_model(
+                        run['best_weights'],
+                        self.trained_models_dir,
+                        timestamp,
+                        origin='distillation',
+                        source_run=run['run_dir'],
+                        base_model=student_model,
+                        teacher=teacher_file,
+                        hyperparameters={'imgsz': imgsz, 'batch': batch_size, 'epochs': epochs,
+                                         **loss_args},
+                        metrics=run['metrics']
+                    )
+                st.success(f"✅ Öğrenci model kaydedildi: {model_file}")
+                self._render_model_comparison([teacher_file, model_file])
+            
+            st.session_state.training_in_progress = False
+            
+        except Exception as e:
+            st.error(f"❌ Damıtma hatası: {str(e)}")
+            st.session_state.training_in_progress = False
+    
+    def _render_model_comparison(self, model_files: List[str]):
+        """Show registry metrics of several models side by side"""
+        registry = load_registry(self.trained_models_dir)
+        entries = [registry[f] for f in model_files if f in registry]
+        
+        rows = {
+            'Temel Model': [e.get('base_model') for e in entries],
+            'Maske mAP': [e.get('mask_map') for e in entries],
+            'Maske mAP50': [e.get('mask_map50') for e in entries],
+            'p50 (ms)': [(e.get('latency') or {}).get('p50_ms') for e in entries],
+            'p95 (ms)': [(e.get('latency') or {}).get('p95_ms') for e in entries],
+            'Boyut (MB)': [e.get('file_size_mb') for e in entries]
+        }
+        class_names = sorted({name for e in entries for name in (e.get('per_class_map') or {})})
+        for name in class_names:
+            rows[f"mAP: {name}"] = [(e.get('per_class_map') or {}).get(name) for e in entries]
+        
+        table = {e['file']: {metric: values[i] for metric, values in rows.items()}
+                 for i, e in enumerate(entries)}
+        st.dataframe(table, use_container_width=True)
+    
+    def _render_model_optimization(self):
+        """Render CPU deployment optimization section"""
+        st.subheader("CPU Dağıtımı için Model Optimizasyonu")
+        
+        models = {entry['file']: entry for entry in list_models(self.trained_models_dir)
+                  if entry['file'].endswith('.pt')}
+        if not models:
+            st.warning("⚠️ Henüz eğitilmiş model yok. Önce bir model eğitin.")
+            return
+        
+        st.markdown("### 🔢 Int8 Kuantizasyon")
+        quant_config = self.config['quantization']
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            model_file = st.selectbox(
+                "Model",
+                options=list(models.keys()),
+                format_func=lambda x: format_model_entry(models[x]),
+                key="quantize_model"
+            )
+            method = st.selectbox(
+                "Yöntem",
+                options=["static", "dynamic"],
+                index=["static", "dynamic"].index(quant_config['method']),
+                format_func=lambda x: "Statik (kalibrasyonlu)" if x == "static" else "Dinamik",
+                help="Statik kuantizasyon doğrulama görüntüleriyle kalibre edilir"
+            )
+        with col2:
+            max_map_drop = st.number_input(
+                "İzin Verilen mAP Düşüşü",
+                min_value=0.0, max_value=0.2,
+                value=float(quant_config['max_map_drop']),
+                step=0.005, format="%.3f",
+                help="Maske mAP düşüşü bu değeri aşarsa int8 model yayınlanmaz"
+            )
+            calibration_limit = st.number_input(
+                "Kalibrasyon Görüntü Sayısı",
+                min_value=8, max_value=1000,
+                value=quant_config['calibration_images']
+            )
+        
+        if st.button("🔢 Kuantize Et", type="primary", use_container_width=True):
+            with st.spinner("Kuantizasyon, doğrulama ve gecikme ölçümü yapılıyor..."):
+                try:
+                    report = quantize_model(
+                        self.trained_models_dir, model_file, self.dataset_dir,
+                        method=method,
+                        max_map_drop=max_map_drop,
+                        calibration_limit=int(calibration_limit),
+                        per_channel=quant_config['per_channel'],
+                        latency_runs=self.config['registry']['latency_runs']
+                    )
+                except Exception as e:
+                    st.error(f"❌ Kuantizasyon hatası: {str(e)}")
+                    return
+            
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Maske mAP (fp32 → int8)", f"{report['int8']['mask_map']:.4f}",
+                        delta=f"{-report['map_drop']:.4f}")
+            col2.metric("p50 Gecikme (ms)", f"{report['int8']['latency']['p50_ms']:.1f}",
+                        delta=f"{report['int8']['latency']['p50_ms'] - report['fp32']['latency']['p50_ms']:.1f}",
+                        delta_color="inverse")
+            col3.metric("p95 Gecikme (ms)", f"{report['int8']['latency']['p95_ms']:.1f}",
+                        delta=f"{report['int8']['latency']['p95_ms'] - report['fp32']['latency']['p95_ms']:.1f}",
+                        delta_color="inverse")
+            
+            if report['unreadable']:
+                st.warning(f"⚠️ Okunamayan {len(report['unreadable'])} doğrulama görüntüsü atlandı: "
+                           f"{', '.join(report['unreadable'][:10])}")
+            if report['published']:
+                st.success(f"✅ Int8 model yayınlandı: {report['published']}")
+            else:
+                st.error(
+                    f"❌ mAP düşüşü ({report['map_drop']:.4f}) toleransı "
+                    f"({report['max_map_drop']:.4f}) aşıyor; int8 model yayınlanmadı."
+                )
+        
+        st.markdown("---")
+        st.markdown("### ✂️ Yapısal Kanal Budama")
+        prune_config = self.config['pruning']
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            prune_file = st.selectbox(
+                "Model",
+                options=list(models.keys()),
+                format_func=lambda x: format_model_entry(models[x]),
+                key="prune_model"
+            )
+            budget_type = st.radio(
+                "Bütçe",
+                options=["flops", "latency"],
+                format_func=lambda x: "FLOP Oranı" if x == "flops" else "CPU Gecikmesi",
+                horizontal=True
+            )
+            if budget_type == "flops":
+                target_flops_ratio = st.slider(
+                    "Hedef FLOP Oranı", 0.1, 0.95,
+                    float(prune_config['target_flops_ratio']), 0.05,
+                    help="Budanmış modelin FLOP'larının orijinale oranı"
+                )
+                target_latency_ms = None
+            else:
+                parent_latency = (models[prune_file].get('latency') or {}).get('p50_ms')
+                target_latency_ms = st.number_input(
+                    "Hedef Gecikme (ms)", min_value=1.0, max_value=10000.0,
+                    value=float(round(parent_latency * 0.6)) if parent_latency else 100.0,
+                    help="Tek görüntü CPU ileri geçiş süresi"
+                )
+                target_flops_ratio = None
+        with col2:
+            finetune_epochs = st.number_input(
+                "İnce Ayar Epoch", min_value=1, max_value=100,
+                value=prune_config['finetune_epochs']
+            )
+            prune_device = st.selectbox(
+                "Cihaz", options=["0", "cpu"],
+                format_func=lambda x: "GPU (CUDA)" if x == "0" else "CPU",
+                key="prune_device"
+            )
+            prune_batch = st.number_input(
+                "Batch Boyutu", min_value=4, max_value=64,
+                value=self.config['training']['default_batch_size'], step=4,
+                key="prune_batch"
+            )
+        
+        if st.button("✂️ Buda ve İnce Ayar Yap", type="primary", use_container_width=True,
+                     disabled=st.session_state.training_in_progress):
+            st.session_state.training_in_progress = True
+            progress_bar = st.progress(0)
+            
+            def on_step(step, total, stats):
+                progress_bar.progress(
+                    step / total,
+                    text=f"Adım {step}: {stats['macs'] / 1e9:.2f} GMACs, {stats['params'] / 1e6:.2f}M parametre"
+                )
+            
+            try:
+                with st.spinner("Budama ve ince ayar yapılıyor..."):
+                    result = prune_model(
+                        self.trained_models_dir, prune_file, self.dataset_dir,
+                        self.training_results_dir,
+                        target_flops_ratio=target_flops_ratio,
+                        target_latency_ms=target_latency_ms,
+                        max_pruning_ratio=prune_config['max_pruning_ratio'],
+                        iterative_steps=prune_config['iterative_steps'],
+                        finetune_epochs=int(finetune_epochs),
+                        progress_callback=on_step,
+                        batch=int(prune_batch),
+                        device=prune_device
+                    )
+                pruning = result['pruning']
+                col1, col2, col3 = st.columns(3)
+                col1.metric("FLOP Oranı", f"{pruning['flops_ratio']:.2f}")
+                col2.metric("Parametre (M)", f"{pruning['params_after'] / 1e6:.2f}",
+                            delta=f"{(pruning['params_after'] - pruning['params_before']) / 1e6:.2f}")
+                col3.metric("İleri Geçiş (ms)", f"{pruning['latency_after_ms']:.1f}",
+                            delta=f"{pruning['latency_after_ms'] - pruning['latency_before_ms']:.1f}",
+                            delta_color="inverse")
+                st.success(f"✅ Budanmış model kaydedildi: {result['published']}")
+                self._render_model_comparison([prune_file, result['published']])
+            except Exception as e:
+                st.error(f"❌ Budama hatası: {str(e)}")
+            st.session_state.training_in_progress = False
+    
+    def _render_evaluation(self):
+        """Render model evaluation and comparison section"""
+        st.subheader("Model Değerlendirme")
+        st.caption("Tahminler model başına bir kez hesaplanıp önbelleğe alınır; eşik değişiklikleri anında yeniden puanlanır")
+        
+        models = {entry['file']: entry for entry in list_models(self.trained_models_dir)}
+        if not models:
+            st.warning("⚠️ Henüz eğitilmiş model yok. Önce bir model eğitin.")
+            return
+        
+        eval_config = self.config['evaluation']
+        class_names = [c['name'] for c in self.config['classes']]
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            selected = st.multiselect(
+                "Modeller",
+                options=list(models.keys()),
+                default=list(models.keys())[:1],
+                format_func=lambda x: format_model_entry(models[x]),
+                max_selections=4
+            )
+        with col2:
+            split = st.selectbox("Bölüm", options=["test", "val", "train"],
+                                 index=["test", "val", "train"].index(eval_config['split']))
+        
+        if st.button("🧮 Değerlendir", type="primary", use_container_width=True, disabled=not selected):
+            for model_file in selected:
+                progress_bar = st.progress(0, text=f"{model_file}: tahminler")
+                try:
+                    st.session_state.evaluation_results[(model_file, split)] = evaluate_model(
+                        os.path.join(self.trained_models_dir, model_file),
+                        self.dataset_dir,
+                        self.config['paths']['eval_cache'],
+                        len(class_names),
+                        split=split,
+                        conf=eval_config['prediction_conf'],
+                        iou=self.config['inference']['default_iou'],
+                        imgsz=models[model_file].get('imgsz'),
+                        max_det=self.config['inference']['max_det'],
+                        batch_size=eval_config['batch_size'],
+                        max_side=eval_config['eval_max_side'],
+                        workers=eval_config['workers'] or None,
+                        progress_callback=lambda done, total: progress_bar.progress(
+                            done / total, text=f"{model_file}: {done}/{total} görüntü"
+                        )
+                    )
+                    progress_bar.progress(1.0, text=f"{model_file}: tamamlandı")
+                except Exception as e:
+                    st.error(f"❌ Değerlendirme hatası ({model_file}): {str(e)}")
+        
+        self._render_calibration(models, selected, class_names)
+        
+        evaluated = [(f, st.session_state.evaluation_results[(f, split)]) for f in selected
+                     if (f, split) in st.session_state.evaluation_results]
+        if not evaluated:
+            return
+        
+        use_calibrated = st.checkbox("Kalibre Edilmiş Sınıf Eşiklerini Kullan", value=False,
+                                     help="Kalibrasyonu olmayan modeller için kaydırıcı değeri kullanılır")
+        score_threshold = st.slider("Güven Eşiği", 0.0, 1.0,
+                                    float(self.config['inference']['default_confidence']), 0.01)
+        
+        reports = {}
+        for f, result in evaluated:
+            thresholds = models[f].get('class_thresholds') if use_calibrated else None
+            reports[f] = compute_metrics(result['matches'], class_names, thresholds or score_threshold)
+        
+        summary_cols = st.columns(len(reports))
+        for col, (model_file, report) in zip(summary_cols, reports.items()):
+            col.metric(model_file, f"mAP50-95 {report['map50_95']:.3f}",
+                       help=f"mAP50 {report['map50']:.3f}, ortalama IoU {report['mean_iou']:.3f}")
+        
+        rows = []
+        for model_file, report in reports.items():
+            for name, metrics in report['per_class'].items():
+                rows.append({
+                    'Model': model_file, 'Sınıf': name, 'GT': metrics['n_gt'],
+                    'Tahmin': metrics['n_pred'], 'AP50': metrics['ap50'],
+                    'AP50-95': metrics['ap50_95'], 'Kesinlik': metrics['precision'],
+                    'Duyarlılık': metrics['recall'], 'F1': metrics['f1'], 'IoU': metrics['mean_iou']
+                })
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+        
+        pr_class = st.selectbox("PR Eğrisi Sınıfı", options=class_names)
+        figure = go.Figure()
+        for model_file, report in reports.items():
+            curve = report['per_class'][pr_class]['pr_curve']
+            figure.add_trace(go.Scatter(x=curve['recall'], y=curve['precision'],
+                                        mode='lines', name=model_file))
+        figure.update_layout(xaxis_title="Duyarlılık", yaxis_title="Kesinlik",
+                             xaxis_range=[0, 1], yaxis_range=[0, 1.05], height=400)
+        st.plotly_chart(figure, use_container_width=True)
+    
+    def _render_calibration(self, models: Dict[str, Dict], selected: List[str], class_names: List[str]):
+        """Render per-class threshold calibration for the selected models"""
+        with st.expander("🎯 Sınıf Eşiği Kalibrasyonu", expanded=False):
+            calibration_config = self.config['calibration']
+            st.caption(f"Her sınıf için {calibration_config['split']} bölümünde IoU 0.5'te F1'i "
+                       "en yüksek yapan güven eşiği seçilir ve modelle birlikte kaydedilir")
+            
+            for model_file in selected:
+                thresholds = models[model_file].get('class_thresholds')
+                if thresholds:
+                    st.write(f"**{model_file}**: " + ", ".join(
+                        f"{name} {threshold:.2f}" for name, threshold in zip(class_names, thresholds)
+                    ))
+            
+            if st.button("🎯 Eşikleri Kalibre Et", use_container_width=True, disabled=not selected):
+                eval_config = self.config['evaluation']
+                for model_file in selected:
+                    with st.spinner(f"{model_file} kalibre ediliyor..."):
+                        try:
+                            entry = calibrate_model(
+                                self.trained_models_dir,
+                                model_file,
+                                self.dataset_dir,
+                                self.config['paths']['eval_cache'],
+                                class_names,
+                                split=calibration_config['split'],
+                                default_threshold=self.config['inference']['default_confidence'],
+                                min_threshold=calibration_config['min_threshold'],
+                                conf=eval_config['prediction_conf'],
+                                iou=self.config['inference']['default_iou'],
+                                max_det=self.config['inference']['max_det'],
+                                batch_size=eval_config['batch_size'],
+                                max_side=eval_config['eval_max_side'],
+                                workers=eval_config['workers'] or None
+                            )
+                            models[model_file] = entry
+                            st.success(f"✅ {model_file} kalibre edildi")
+                            st.dataframe([
+                                {'Sınıf': name, 'Eşik': details['threshold'],
+                                 'F1': details.get('f1'), 'Kesinlik': details.get('precision'),
+                                 'Duyarlılık': details.get('recall')}
+                                for name, details in entry['calibration']['classes'].items()
+                            ], use_container_width=True, hide_index=True)
+                        except Exception as e:
+                            st.error(f"❌ Kalibrasyon hatası ({model_file}): {str(e)}")
+    
     def _display_training_results(self, results_dir: str):
         """Display training results"""
         st.markdown("---")
@@ -383,33 +1130,83 @@ class TrainingInterface:
             if os.path.exists(img_path):
                 with cols[idx]:
                     st.image(img_path, caption=title, use_container_width=True)
-    
+
+        # Autotuned CPU settings used for this run
+        autotune_path = os.path.join(results_dir, 'autotune.json')
+        if os.path.exists(autotune_path):
+            with open(autotune_path, 'r', encoding='utf-8') as f:
+                autotune = json.load(f)
+            st.info(
+                f"⚡ Otomatik ayar: batch {autotune['batch_size']}, "
+                f"thread {autotune['threads']} ({autotune['throughput']:.2f} görüntü/s)"
+            )
+
     def _render_training_history(self):
         """Render training history"""
         st.subheader("Training History")
         
-        # List trained models
+        # List trained models from the registry
         if os.path.exists(self.trained_models_dir):
-            model_files = [f for f in os.listdir(self.trained_models_dir) if f.endswith('.pt')]
+            models = list_models(self.trained_models_dir, sort_by='newest')
             
-            if model_files:
-                st.metric("Eğitilmiş Model Sayısı", len(model_files))
+            if models:
+                st.metric("Eğitilmiş Model Sayısı", len(models))
                 
                 st.markdown("### Eğitilmiş Modeller")
                 
-                for model_file in sorted(model_files, reverse=True):
+                st.dataframe(
+                    [{
+                        'Model': entry['file'],
+                        'Kaynak': entry.get('origin'),
+                        'Temel Model': entry.get('base_model'),
+                        'imgsz': entry.get('imgsz'),
+                        'Maske mAP': entry.get('mask_map'),
+                        'p50 (ms)': (entry.get('latency') or {}).get('p50_ms'),
+                        'p95 (ms)': (entry.get('latency') or {}).get('p95_ms'),
+                        'Boyut (MB)': entry.get('file_size_mb'),
+                        'Veri Seti': (entry.get('dataset_manifest_hash') or '')[:8]
+                    } for entry in models],
+                    use_container_width=True,
+                    hide_index=True
+                )
+                
+                for entry in models:
+                    model_file = entry['file']
                     model_path = os.path.join(self.trained_models_dir, model_file)
-                    file_size = os.path.getsize(model_path) / (1024 * 1024)  # MB
                     
                     col1, col2, col3 = st.columns([3, 1, 1])
                     
                     with col1:
-                        st.text(f"📦 {model_file}")
+                        with st.expander(f"📦 {model_file}"):
+                            if entry.get('per_class_map'):
+                                st.bar_chart(entry['per_class_map'])
+                            if entry.get('source_run'):
+                                st.caption(f"Eğitim: {entry['source_run']}")
+                            if entry.get('parent'):
+                                st.caption(f"Üst Model: {entry['parent']} ({entry.get('origin')})")
+                            if entry.get('teacher'):
+                                st.caption(f"Öğretmen: {entry['teacher']}")
+                                self._render_model_comparison([entry['teacher'], model_file])
+                            if entry.get('profile_error'):
+                                st.warning(f"Profil hatası: {entry['profile_error']}")
                     with col2:
-                        st.text(f"{file_size:.1f} MB")
+                        if st.button("📏", key=f"profile_model_{model_file}",
+                                     help="Doğrulama mAP ve CPU gecikmesini ölç"):
+                            with st.spinner("Model profili çıkarılıyor..."):
+                                try:
+                                    profile_model(
+                                        self.trained_models_dir, model_file,
+                                        os.path.join(self.dataset_dir, 'data.yaml'),
+                                        n_runs=self.config['registry']['latency_runs'],
+                                        warmup=self.config['registry']['latency_warmup']
+                                    )
+                                    st.rerun()
+                                except Exception as e:
+                                    st.error(f"❌ Profil hatası: {str(e)}")
                     with col3:
                         if st.button("🗑️", key=f"delete_model_{model_file}"):
                             os.remove(model_path)
+                            unregister_model(self.trained_models_dir, model_file)
                             st.rerun()
             else:
                 st.info("Henüz eğitilmiş model yok")
@@ -423,6 +1220,25 @@ class TrainingInterface:
                            if os.path.isdir(os.path.join(self.training_results_dir, d))]
             
             if training_dirs:
+                # Run status overview, including resumed runs
+                runs = []
+                for training_dir in sorted(training_dirs, reverse=True):
+                    record = load_run_record(os.path.join(self.training_results_dir, training_dir))
+                    if record is None:
+                        continue
+                    runs.append({
+                        'Eğitim': training_dir,
+                        'Model': record.get('base_model'),
+                        'Durum': record['status'],
+                        'Epoch': self._count_completed_epochs(
+                            os.path.join(self.training_results_dir, training_dir)
+                        ),
+                        'Devam Sayısı': len(record.get('resumes', [])),
+                        '🔁': '🔁' if record.get('resumes') else ''
+                    })
+                if runs:
+                    st.dataframe(runs, use_container_width=True, hide_index=True)
+                
                 selected_training = st.selectbox(
                     "Eğitim Seç",
                     options=sorted(training_dirs, reverse=True)
@@ -6,7 +6,7 @@ import yaml
 import json
 import shutil
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
 import numpy as np
 from PIL import Image
 import cv2
@@ -159,7 +159,8 @@ def create_dataset_yaml(dataset_path: str, class_names: List[str], output_path:
 
 def split_dataset(source_images_dir: str, source_labels_dir: str, 
                   dest_dataset_dir: str, train_ratio: float = 0.7, 
-                  val_ratio: float = 0.2, test_ratio: float = 0.1):
+                  val_ratio: float = 0.2, test_ratio: float = 0.1,
+                  groups: Optional[List[List[str]]] = None):
     """
     Split dataset into train/val/test sets
     
@@ -170,23 +171,38 @@ def split_dataset(source_images_dir: str, source_labels_dir: str,
         train_ratio: Ratio for training set
         val_ratio: Ratio for validation set
         test_ratio: Ratio for test set
+        groups: Groups of image names (e.g. near-duplicates) that must land in the same split
     """
     # Get all image files
     image_files = [f for f in os.listdir(source_images_dir) 
                    if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp'))]
     
-    # Shuffle images
-    np.random.shuffle(image_files)
-    
-    # Calculate split indices
+    # Shuffle units of images: each group is one unit, every other image its own
+    available = set(image_files)
+    grouped = set()
+    units = []
+    for group in groups or []:
+        members = [f for f in group if f in available and f not in grouped]
+        if members:
+            units.append(members)
+            grouped.update(members)
+    units.extend([f] for f in image_files if f not in grouped)
+    np.random.shuffle(units)
+    
+    # Calculate split sizes
     n_total = len(image_files)
     n_train = int(n_total * train_ratio)
     n_val = int(n_total * val_ratio)
     
     # Split files
-    train_files = image_files[:n_train]
-    val_files = image_files[n_train:n_train + n_val]
-    test_files = image_files[n_train + n_val:]
+    train_files, val_files, test_files = [], [], []
+    for unit in units:
+        if len(train_files) < n_train:
+            train_files.extend(unit)
+        elif len(val_files) < n_val:
+            val_files.extend(unit)
+        else:
+            test_files.extend(unit)
     
     # Copy files to respective directories
     for split_name, files in [('train', train_files), ('val', val_files), ('test', test_files)]:
@@ -282,6 +298,16 @@ def get_image_dimensions(image_path: str) -> Tuple[int, int]:
     return img.size  # Returns (width, height)
 
 
+def find_image(images_dir: str, stem: str, formats: List[str]) -> Optional[str]:
+    """Find the image with the given file stem (e.g. the film of a label file)"""
+    for ext in formats:
+        for candidate in (f"{stem}.{ext}", f"{stem}.{ext.upper()}"):
+            path = os.path.join(images_dir, candidate)
+            if os.path.exists(path):
+                return path
+    return None
+
+
 def count_annotations(labels_dir: str) -> int:
     """Count total number of annotations in a directory"""
     total = 0
@@ -341,3 +367,105 @@ def validate_dataset(dataset_path: str) -> Dict:
     
     return results
 
+
+
+def get_rss_mb(pid: Optional[int] = None) -> float:
+    """Get resident set size of the current process (or of pid) in MB; 0.0 for an exited pid"""
+    try:
+        with open(f"/proc/{pid or 'self'}/statm", 'r') as f:
+            rss_pages = int(f.read().split()[1])
+        return rss_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        if pid is not None:
+            return 0.0
+        import resource
+        # ru_maxrss is the peak (not current) RSS, reported in KB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def get_available_memory_mb() -> float:
+    """Get memory available for new allocations in MB (MemAvailable on Linux)"""
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+def get_process_start_time(pid: int):
+    """Get process start time (clock ticks since boot) from /proc, or None if unavailable"""
+    try:
+        with open(f'/proc/{pid}/stat', 'r') as f:
+            # Fields after the parenthesised command name; starttime is field 22
+            fields = f.read().rsplit(')', 1)[1].split()
+        return int(fields[19])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def is_process_alive(pid: int, start_time=None) -> bool:
+    """Check whether a process is still running (and is the same process, if start_time is given)"""
+    if start_time is not None and os.path.exists('/proc'):
+        return get_process_start_time(pid) == start_time
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def build_dataset_manifest(dataset_path: str) -> Dict:
+    """
+    Build a manifest of the dataset splits
+
+    Images are identified by name and size, labels by name and content hash,
+    so the manifest hash changes whenever the split or any label changes.
+    
+    Args:
+        dataset_path: Path to dataset directory
+    
+    Returns:
+        Dictionary with per-split image/label entries and a manifest hash
+    """
+    import hashlib
+
+    manifest = {'splits': {}}
+    for split in ['train', 'val', 'test']:
+        images_dir = os.path.join(dataset_path, 'images', split)
+        labels_dir = os.path.join(dataset_path, 'labels', split)
+        images = []
+        labels = []
+        
+        if os.path.exists(images_dir):
+            for f in sorted(os.listdir(images_dir)):
+                if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')):
+                    images.append([f, os.path.getsize(os.path.join(images_dir, f))])
+        
+        if os.path.exists(labels_dir):
+            for f in sorted(os.listdir(labels_dir)):
+                if f.endswith('.txt'):
+                    with open(os.path.join(labels_dir, f), 'rb') as label_file:
+                        labels.append([f, hashlib.sha1(label_file.read()).hexdigest()])
+        
+        manifest['splits'][split] = {'images': images, 'labels': labels}
+    
+    manifest['hash'] = hashlib.sha1(
+        json.dumps(manifest['splits'], sort_keys=True).encode('utf-8')
+    ).hexdigest()
+    return manifest
+
+
+def write_dataset_manifest(dataset_path: str) -> Dict:
+    """Build the dataset manifest and save it as dataset_path/manifest.json"""
+    manifest = build_dataset_manifest(dataset_path)
+    with open(os.path.join(dataset_path, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def dataset_manifest_hash(dataset_path: str) -> str:
+    """Hash of the dataset as it currently is on disk"""
+    return build_dataset_manifest(dataset_path)['hash']
@@ -0,0 +1,112 @@
+"""
+Drawing of predictions and annotations on films (no Streamlit dependency)
+"""
+from typing import Dict, List
+
+import cv2
+import numpy as np
+
+from modules.utils import hex_to_rgb, rgb_to_bgr, draw_polygon_on_image
+
+
+def draw_detections(image: np.ndarray, masks: np.ndarray, boxes: np.ndarray, classes: List[Dict],
+                    show_masks: bool = True, show_labels: bool = True, show_confidence: bool = True,
+                    mask_alpha: float = 0.4) -> np.ndarray:
+    """
+    Draw segmentation predictions on an image
+
+    Args:
+        image: RGB or grayscale image
+        masks: (N, h, w) masks at model resolution
+        boxes: (N, 6) boxes as x1, y1, x2, y2, confidence, class id
+        classes: Class definitions from the config
+        show_masks: Blend colored masks into the image
+        show_labels: Draw class names
+        show_confidence: Draw confidences
+        mask_alpha: Mask opacity
+
+    Returns:
+        RGB image with predictions drawn
+    """
+    # Convert to BGR for OpenCV
+    if len(image.shape) == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    elif image.shape[2] == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+
+    for mask, box in zip(masks, boxes):
+        class_id = int(box[5])
+        confidence = float(box[4])
+
+        # Get class info
+        if class_id < len(classes):
+            class_info = classes[class_id]
+            class_name = class_info.get('name_tr', class_info['name'])
+            bgr_color = rgb_to_bgr(hex_to_rgb(class_info['color']))
+        else:
+            class_name = f"Class {class_id}"
+            bgr_color = (255, 0, 0)
+
+        # Resize mask to image size
+        mask_resized = cv2.resize(mask.astype(np.uint8), (image.shape[1], image.shape[0]))
+
+        # Draw mask
+        if show_masks:
+            colored_mask = np.zeros_like(image)
+            colored_mask[mask_resized > 0.5] = bgr_color
+            image = cv2.addWeighted(image, 1.0, colored_mask, mask_alpha, 0)
+
+        # Draw contours
+        contours, _ = cv2.findContours(mask_resized, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        cv2.drawContours(image, contours, -1, bgr_color, 2)
+
+        # Draw label
+        if show_labels or show_confidence:
+            x1, y1 = int(box[0]), int(box[1])
+
+            label_parts = []
+            if show_labels:
+                label_parts.append(class_name)
+            if show_confidence:
+                label_parts.append(f"{confidence:.2f}")
+            label = " - ".join(label_parts)
+
+            (text_width, text_height), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
+            cv2.rectangle(image, (x1, y1 - text_height - 10), (x1 + text_width + 10, y1), bgr_color, -1)
+            cv2.putText(image, label, (x1 + 5, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+
+    # Convert back to RGB
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def draw_annotations(image: np.ndarray, annotations: List[Dict], classes: List[Dict]) -> np.ndarray:
+    """
+    Draw annotation polygons with class names on a copy of the image
+
+    Args:
+        image: Input image
+        annotations: Annotations with 'class_id' and 'polygon' in pixels
+        classes: Class definitions from the config
+
+    Returns:
+        Image with annotations drawn
+    """
+    img_copy = image.copy()
+
+    for ann in annotations:
+        class_id = ann['class_id']
+        polygon = ann['polygon']
+        bgr_color = rgb_to_bgr(hex_to_rgb(classes[class_id]['color']))
+
+        # Draw polygon
+        img_copy = draw_polygon_on_image(img_copy, polygon, bgr_color, thickness=3, fill=True, alpha=0.3)
+
+        # Add label text
+        if polygon:
+            centroid_x = int(np.mean([p[0] for p in polygon]))
+            centroid_y = int(np.mean([p[1] for p in polygon]))
+            class_name = classes[class_id]['name'].title()
+            cv2.putText(img_copy, class_name, (centroid_x, centroid_y),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, bgr_color, 2)
+
+    return img_copy
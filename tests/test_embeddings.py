@@ -0,0 +1,39 @@
+"""
+Embedding extraction must not leak predict overrides into the shared model
+"""
+import numpy as np
+import pytest
+
+from modules.embeddings import embed_images
+
+ultralytics = pytest.importorskip('ultralytics')
+
+
+@pytest.fixture(scope='module')
+def model():
+    # Untrained model from the architecture file; no weights download needed
+    return ultralytics.YOLO('yolo11n-seg.yaml', task='segment')
+
+
+def test_predict_after_embed_returns_results(model):
+    image = np.full((160, 160, 3), 127, dtype=np.uint8)
+
+    before = model.predict(image, imgsz=160, verbose=False)
+    assert hasattr(before[0], 'boxes')
+
+    vectors = embed_images(model, [image], imgsz=160)
+    assert vectors.shape[0] == 1
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0, atol=1e-3)
+
+    after = model.predict(image, imgsz=160, verbose=False)
+    assert hasattr(after[0], 'boxes')
+    assert model.predictor.args.embed is None
+
+
+def test_embed_on_fresh_model_does_not_stick():
+    model = ultralytics.YOLO('yolo11n-seg.yaml', task='segment')
+    image = np.full((160, 160, 3), 127, dtype=np.uint8)
+
+    embed_images(model, [image], imgsz=160)
+    results = model.predict(image, imgsz=160, verbose=False)
+    assert hasattr(results[0], 'boxes')